@@ -0,0 +1,53 @@
+"""add book_rating_summary
+
+Revision ID: 0b6e8f2a4d51
+Revises: f1a9d3b6c720
+Create Date: 2026-10-18 17:10:26.448391
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0b6e8f2a4d51'
+down_revision = 'f1a9d3b6c720'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('book_rating_summary',
+    sa.Column('book_id', sa.Integer(), autoincrement=False, nullable=False),
+    sa.Column('rating_count', sa.Integer(), server_default='0', nullable=False),
+    sa.Column('rating_sum', sa.Integer(), server_default='0', nullable=False),
+    sa.Column('points_1', sa.Integer(), server_default='0', nullable=False),
+    sa.Column('points_2', sa.Integer(), server_default='0', nullable=False),
+    sa.Column('points_3', sa.Integer(), server_default='0', nullable=False),
+    sa.Column('points_4', sa.Integer(), server_default='0', nullable=False),
+    sa.Column('points_5', sa.Integer(), server_default='0', nullable=False),
+    sa.ForeignKeyConstraint(['book_id'], ['book.book_id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('book_id')
+    )
+
+    op.execute("""
+        INSERT INTO book_rating_summary (
+            book_id, rating_count, rating_sum,
+            points_1, points_2, points_3, points_4, points_5
+        )
+        SELECT
+            book_id,
+            count(*),
+            sum(point),
+            count(*) FILTER (WHERE point = 1),
+            count(*) FILTER (WHERE point = 2),
+            count(*) FILTER (WHERE point = 3),
+            count(*) FILTER (WHERE point = 4),
+            count(*) FILTER (WHERE point = 5)
+        FROM rating
+        GROUP BY book_id
+    """)
+
+
+def downgrade():
+    op.drop_table('book_rating_summary')
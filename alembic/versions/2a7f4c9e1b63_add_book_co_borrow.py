@@ -0,0 +1,34 @@
+"""add book_co_borrow
+
+Revision ID: 2a7f4c9e1b63
+Revises: 9e3b5f1c8a07
+Create Date: 2026-10-18 20:02:37.615920
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '2a7f4c9e1b63'
+down_revision = '9e3b5f1c8a07'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Kept up to date at checkout, rebuilt by `python -m app.co_borrow`
+    op.create_table('book_co_borrow',
+    sa.Column('book_id', sa.Integer(), nullable=False),
+    sa.Column('other_book_id', sa.Integer(), nullable=False),
+    sa.Column('borrow_count', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['book_id'], ['book.book_id'], ondelete='CASCADE'),
+    sa.ForeignKeyConstraint(['other_book_id'], ['book.book_id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('book_id', 'other_book_id')
+    )
+    op.create_index('ix_book_co_borrow_book_id_borrow_count', 'book_co_borrow', ['book_id', sa.text('borrow_count DESC')], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_book_co_borrow_book_id_borrow_count', table_name='book_co_borrow')
+    op.drop_table('book_co_borrow')
@@ -0,0 +1,42 @@
+"""add book search_vector
+
+Revision ID: 3f9a1c2e7b10
+Revises: bb68f11aa84b
+Create Date: 2026-10-18 09:12:40.118204
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision = '3f9a1c2e7b10'
+down_revision = 'bb68f11aa84b'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('book', sa.Column(
+        'search_vector',
+        postgresql.TSVECTOR(),
+        sa.Computed(
+            "setweight(to_tsvector('english', book_name), 'A') || "
+            "setweight(to_tsvector('english', book_author), 'B') || "
+            "setweight(to_tsvector('english', book_description), 'C')",
+            persisted=True
+        )
+    ))
+    op.create_index(
+        'ix_book_search_vector',
+        'book',
+        ['search_vector'],
+        unique=False,
+        postgresql_using='gin'
+    )
+
+
+def downgrade():
+    op.drop_index('ix_book_search_vector', table_name='book')
+    op.drop_column('book', 'search_vector')
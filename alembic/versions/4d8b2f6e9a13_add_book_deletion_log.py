@@ -0,0 +1,70 @@
+"""add book deletion log
+
+Revision ID: 4d8b2f6e9a13
+Revises: b7d3e9a14c62
+Create Date: 2026-10-19 14:26:51.204718
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '4d8b2f6e9a13'
+down_revision = 'b7d3e9a14c62'
+branch_labels = None
+depends_on = None
+
+# Every deleted book id, including the ones that go with their category,
+# so that the autocomplete refresher of each worker can drop them. The
+# trigger runs once per statement and logs all the rows it deleted.
+CREATE_DELETION_TRIGGER = """
+CREATE OR REPLACE FUNCTION book_log_deletions()
+RETURNS trigger AS $$
+BEGIN
+    INSERT INTO book_deletion (book_id)
+    SELECT book_id FROM deleted_books
+    ON CONFLICT (book_id) DO NOTHING;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER book_log_deletions
+AFTER DELETE ON book
+REFERENCING OLD TABLE AS deleted_books
+FOR EACH STATEMENT EXECUTE FUNCTION book_log_deletions()
+"""
+
+
+def upgrade():
+    op.create_table('book_deletion',
+    sa.Column('book_id', sa.Integer(), nullable=False),
+    sa.Column('deleted_at', sa.TIMESTAMP(timezone=True), server_default=sa.text('now()'), nullable=False),
+    sa.PrimaryKeyConstraint('book_id')
+    )
+    op.create_index('ix_book_deletion_deleted_at', 'book_deletion', ['deleted_at'], unique=False)
+    op.execute(CREATE_DELETION_TRIGGER)
+
+    # The refresher asks for the books changed in the last few minutes
+    with op.get_context().autocommit_block():
+        op.create_index(
+            'ix_book_updated_at',
+            'book',
+            ['updated_at'],
+            unique=False,
+            postgresql_concurrently=True
+        )
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        op.drop_index(
+            'ix_book_updated_at',
+            table_name='book',
+            postgresql_concurrently=True
+        )
+
+    op.execute("DROP TRIGGER book_log_deletions ON book")
+    op.execute("DROP FUNCTION book_log_deletions()")
+    op.drop_index('ix_book_deletion_deleted_at', table_name='book_deletion')
+    op.drop_table('book_deletion')
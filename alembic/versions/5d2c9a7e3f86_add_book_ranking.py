@@ -0,0 +1,36 @@
+"""add book_ranking
+
+Revision ID: 5d2c9a7e3f86
+Revises: 0b6e8f2a4d51
+Create Date: 2026-10-18 18:04:51.730284
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5d2c9a7e3f86'
+down_revision = '0b6e8f2a4d51'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Filled by `python -m app.leaderboard`
+    op.create_table('book_ranking',
+    sa.Column('board', sa.String(), nullable=False),
+    sa.Column('book_id', sa.Integer(), nullable=False),
+    sa.Column('book_category_id', sa.Integer(), nullable=False),
+    sa.Column('score', sa.Float(), nullable=False),
+    sa.ForeignKeyConstraint(['book_id'], ['book.book_id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('board', 'book_id')
+    )
+    op.create_index('ix_book_ranking_board_score', 'book_ranking', ['board', sa.text('score DESC')], unique=False)
+    op.create_index('ix_book_ranking_board_category_score', 'book_ranking', ['board', 'book_category_id', sa.text('score DESC')], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_book_ranking_board_category_score', table_name='book_ranking')
+    op.drop_index('ix_book_ranking_board_score', table_name='book_ranking')
+    op.drop_table('book_ranking')
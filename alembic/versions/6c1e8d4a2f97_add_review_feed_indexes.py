@@ -0,0 +1,50 @@
+"""add review feed indexes
+
+Revision ID: 6c1e8d4a2f97
+Revises: 2a7f4c9e1b63
+Create Date: 2026-10-18 20:41:52.083164
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '6c1e8d4a2f97'
+down_revision = '2a7f4c9e1b63'
+branch_labels = None
+depends_on = None
+
+# The review feeds page on (given_at, review_id), newest first.
+# CREATE INDEX CONCURRENTLY cannot run inside a transaction.
+indexes = [
+    ('ix_review_given_at_review_id', 'review',
+     [sa.text('given_at DESC'), sa.text('review_id DESC')]),
+    ('ix_review_book_id_given_at_review_id', 'review',
+     [sa.text('book_id'), sa.text('given_at DESC'),
+      sa.text('review_id DESC')]),
+]
+
+
+def upgrade():
+    with op.get_context().autocommit_block():
+        for name, table, columns in indexes:
+            op.create_index(
+                name,
+                table,
+                columns,
+                unique=False,
+                postgresql_concurrently=True,
+                if_not_exists=True
+            )
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        for name, table, _ in reversed(indexes):
+            op.drop_index(
+                name,
+                table_name=table,
+                postgresql_concurrently=True,
+                if_exists=True
+            )
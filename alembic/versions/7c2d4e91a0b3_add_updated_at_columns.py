@@ -0,0 +1,39 @@
+"""add updated_at to role, user_profile, book_category, book, book_transaction
+
+Revision ID: 7c2d4e91a0b3
+Revises: 3f9a1c2e7b10
+Create Date: 2026-10-18 11:03:52.604117
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '7c2d4e91a0b3'
+down_revision = '3f9a1c2e7b10'
+branch_labels = None
+depends_on = None
+
+tables = [
+    'role',
+    'user_profile',
+    'book_category',
+    'book',
+    'book_transaction'
+]
+
+
+def upgrade():
+    for table in tables:
+        op.add_column(table, sa.Column(
+            'updated_at',
+            sa.TIMESTAMP(timezone=True),
+            server_default=sa.text('now()'),
+            nullable=False
+        ))
+
+
+def downgrade():
+    for table in reversed(tables):
+        op.drop_column(table, 'updated_at')
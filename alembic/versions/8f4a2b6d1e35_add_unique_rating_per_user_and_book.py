@@ -0,0 +1,94 @@
+"""add unique rating per user and book
+
+Revision ID: 8f4a2b6d1e35
+Revises: 6c1e8d4a2f97
+Create Date: 2026-10-18 21:08:44.731205
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = '8f4a2b6d1e35'
+down_revision = '6c1e8d4a2f97'
+branch_labels = None
+depends_on = None
+
+# Only the latest rating of a user for a book is kept.
+DELETE_DUPLICATES = """
+    DELETE FROM rating AS r
+    WHERE {where}
+        AND EXISTS (
+            SELECT 1 FROM rating AS newer
+            WHERE newer.book_id = r.book_id
+                AND newer.given_by = r.given_by
+                AND (newer.updated_at, newer.rating_id)
+                    > (r.updated_at, r.rating_id)
+        )
+"""
+
+# Runs outside of a transaction so that every batch of rating ids commits
+# on its own and only holds its row locks for a moment.
+DELETE_DUPLICATES_IN_BATCHES = """
+DO $$
+DECLARE
+    batch_start integer;
+    last_id integer;
+BEGIN
+    SELECT min(rating_id), max(rating_id) INTO batch_start, last_id
+    FROM rating;
+
+    WHILE batch_start <= last_id LOOP
+        {delete};
+        COMMIT;
+        batch_start := batch_start + 10000;
+    END LOOP;
+END
+$$
+""".format(delete=DELETE_DUPLICATES.format(
+    where="r.rating_id >= batch_start AND r.rating_id < batch_start + 10000"
+))
+
+RECOMPUTE_SUMMARIES = """
+    INSERT INTO book_rating_summary (
+        book_id, rating_count, rating_sum,
+        points_1, points_2, points_3, points_4, points_5
+    )
+    SELECT
+        book_id,
+        count(*),
+        sum(point),
+        count(*) FILTER (WHERE point = 1),
+        count(*) FILTER (WHERE point = 2),
+        count(*) FILTER (WHERE point = 3),
+        count(*) FILTER (WHERE point = 4),
+        count(*) FILTER (WHERE point = 5)
+    FROM rating
+    GROUP BY book_id
+"""
+
+
+def upgrade():
+    with op.get_context().autocommit_block():
+        op.execute(DELETE_DUPLICATES_IN_BATCHES)
+
+    # Writes are blocked from here on, so the last duplicates created while
+    # the batches ran are removed before the constraint goes in.
+    op.execute("LOCK TABLE rating IN SHARE ROW EXCLUSIVE MODE")
+    op.execute(DELETE_DUPLICATES.format(where="true"))
+
+    # The deleted ratings were still counted in the summaries
+    op.execute("LOCK TABLE book_rating_summary IN EXCLUSIVE MODE")
+    op.execute("DELETE FROM book_rating_summary")
+    op.execute(RECOMPUTE_SUMMARIES)
+
+    op.create_unique_constraint(
+        'uq_rating_book_id_given_by',
+        'rating',
+        ['book_id', 'given_by']
+    )
+
+
+def downgrade():
+    # The removed duplicates are not brought back
+    op.drop_constraint('uq_rating_book_id_given_by', 'rating', type_='unique')
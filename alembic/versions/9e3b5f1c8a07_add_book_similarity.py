@@ -0,0 +1,32 @@
+"""add book_similarity
+
+Revision ID: 9e3b5f1c8a07
+Revises: 5d2c9a7e3f86
+Create Date: 2026-10-18 19:15:09.284613
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '9e3b5f1c8a07'
+down_revision = '5d2c9a7e3f86'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Filled by `python -m app.recommendations`
+    op.create_table('book_similarity',
+    sa.Column('book_id', sa.Integer(), nullable=False),
+    sa.Column('similar_book_id', sa.Integer(), nullable=False),
+    sa.Column('score', sa.Float(), nullable=False),
+    sa.ForeignKeyConstraint(['book_id'], ['book.book_id'], ondelete='CASCADE'),
+    sa.ForeignKeyConstraint(['similar_book_id'], ['book.book_id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('book_id', 'similar_book_id')
+    )
+
+
+def downgrade():
+    op.drop_table('book_similarity')
@@ -0,0 +1,41 @@
+"""add book available_count
+
+Revision ID: a51e0b7d3c28
+Revises: 7c2d4e91a0b3
+Create Date: 2026-10-18 12:20:14.871530
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a51e0b7d3c28'
+down_revision = '7c2d4e91a0b3'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('book', sa.Column(
+        'available_count', sa.Integer(), nullable=True))
+
+    # Every copy that sits in an open transaction is off the shelf
+    op.execute("""
+        UPDATE book
+        SET available_count = book.book_count - COALESCE((
+            SELECT count(*)
+            FROM book_borrow
+            JOIN book_transaction
+                ON book_transaction.book_transaction_id
+                    = book_borrow.book_transaction_id
+            WHERE book_borrow.book_id = book.book_id
+                AND book_transaction.status_id = 1
+        ), 0)
+    """)
+
+    op.alter_column('book', 'available_count', nullable=False)
+
+
+def downgrade():
+    op.drop_column('book', 'available_count')
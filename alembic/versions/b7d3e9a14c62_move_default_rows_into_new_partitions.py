@@ -0,0 +1,100 @@
+"""move default rows into new partitions
+
+Revision ID: b7d3e9a14c62
+Revises: 8f4a2b6d1e35
+Create Date: 2026-10-19 09:12:40.518377
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = 'b7d3e9a14c62'
+down_revision = '8f4a2b6d1e35'
+branch_labels = None
+depends_on = None
+
+# Postgres refuses to create a partition for a month that already has rows
+# in the DEFAULT partition. When that happens the DEFAULT partition is now
+# swapped for an empty one and its rows are inserted again through the
+# parent, so that they land in the new partition (or the new DEFAULT).
+# The old DEFAULT is dropped rather than emptied with DELETE, so the
+# cascade trigger of book_transaction never fires for the moved rows.
+CREATE_PARTITION_FUNCTION = """
+CREATE OR REPLACE FUNCTION create_monthly_partition(parent text, month date)
+RETURNS void AS $$
+DECLARE
+    month_start timestamptz := date_trunc('month', month::timestamp)
+        AT TIME ZONE 'UTC';
+    month_end timestamptz := month_start + interval '1 month';
+    partition_name text := parent || '_'
+        || to_char(month_start AT TIME ZONE 'UTC', '"y"YYYY"m"MM');
+    default_name text := parent || '_default';
+    key_column text := substring(
+        pg_get_partkeydef(parent::regclass) FROM '\\((.*)\\)'
+    );
+    has_rows boolean;
+BEGIN
+    IF to_regclass(partition_name) IS NOT NULL THEN
+        RETURN;
+    END IF;
+
+    EXECUTE format(
+        'SELECT EXISTS (SELECT 1 FROM %I WHERE %I >= $1 AND %I < $2)',
+        default_name, key_column, key_column
+    ) INTO has_rows USING month_start, month_end;
+
+    IF has_rows THEN
+        EXECUTE format(
+            'ALTER TABLE %I DETACH PARTITION %I', parent, default_name
+        );
+        EXECUTE format(
+            'ALTER TABLE %I RENAME TO %I', default_name, default_name || '_old'
+        );
+    END IF;
+
+    EXECUTE format(
+        'CREATE TABLE %I PARTITION OF %I FOR VALUES FROM (%L) TO (%L)',
+        partition_name, parent, month_start, month_end
+    );
+
+    IF has_rows THEN
+        EXECUTE format(
+            'CREATE TABLE %I PARTITION OF %I DEFAULT', default_name, parent
+        );
+        EXECUTE format(
+            'INSERT INTO %I SELECT * FROM %I', parent, default_name || '_old'
+        );
+        EXECUTE format('DROP TABLE %I', default_name || '_old');
+    END IF;
+END;
+$$ LANGUAGE plpgsql
+"""
+
+# The version from e4b7c1f05a92
+PREVIOUS_PARTITION_FUNCTION = """
+CREATE OR REPLACE FUNCTION create_monthly_partition(parent text, month date)
+RETURNS void AS $$
+DECLARE
+    month_start timestamptz := date_trunc('month', month::timestamp)
+        AT TIME ZONE 'UTC';
+BEGIN
+    EXECUTE format(
+        'CREATE TABLE IF NOT EXISTS %I PARTITION OF %I '
+        'FOR VALUES FROM (%L) TO (%L)',
+        parent || '_' || to_char(month_start AT TIME ZONE 'UTC', '"y"YYYY"m"MM'),
+        parent,
+        month_start,
+        month_start + interval '1 month'
+    );
+END;
+$$ LANGUAGE plpgsql
+"""
+
+
+def upgrade():
+    op.execute(CREATE_PARTITION_FUNCTION)
+
+
+def downgrade():
+    op.execute(PREVIOUS_PARTITION_FUNCTION)
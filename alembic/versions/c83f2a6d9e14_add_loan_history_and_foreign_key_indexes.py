@@ -0,0 +1,70 @@
+"""add loan history and foreign key indexes
+
+Revision ID: c83f2a6d9e14
+Revises: a51e0b7d3c28
+Create Date: 2026-10-18 13:41:07.390562
+
+"""
+from alembic import context, op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c83f2a6d9e14'
+down_revision = 'a51e0b7d3c28'
+branch_labels = None
+depends_on = None
+
+# CREATE INDEX CONCURRENTLY does not block writes, but it cannot run inside
+# a transaction, hence the autocommit blocks. When it fails half way it
+# leaves an INVALID index behind, which IF NOT EXISTS would keep, so such an
+# index is dropped and built again.
+indexes = [
+    ('ix_book_transaction_borrowed_by_issued_date', 'book_transaction',
+     [sa.text('borrowed_by'), sa.text('issued_date DESC')]),
+    ('ix_rating_book_id', 'rating', ['book_id']),
+    ('ix_review_book_id', 'review', ['book_id']),
+    ('ix_book_borrow_book_transaction_id', 'book_borrow',
+     ['book_transaction_id']),
+    ('ix_book_book_category_id', 'book', ['book_category_id']),
+]
+
+
+def is_invalid(name):
+    return op.get_bind().execute(
+        sa.text("""
+            SELECT NOT indisvalid FROM pg_index
+            WHERE indexrelid = to_regclass(:name)
+        """),
+        {"name": name}
+    ).scalar()
+
+
+def upgrade():
+    with op.get_context().autocommit_block():
+        for name, table, columns in indexes:
+            if not context.is_offline_mode() and is_invalid(name):
+                op.drop_index(
+                    name,
+                    table_name=table,
+                    postgresql_concurrently=True
+                )
+            op.create_index(
+                name,
+                table,
+                columns,
+                unique=False,
+                postgresql_concurrently=True,
+                if_not_exists=True
+            )
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        for name, table, _ in reversed(indexes):
+            op.drop_index(
+                name,
+                table_name=table,
+                postgresql_concurrently=True,
+                if_exists=True
+            )
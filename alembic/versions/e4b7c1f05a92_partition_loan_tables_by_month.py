@@ -0,0 +1,256 @@
+"""partition book_transaction and book_borrow by month
+
+Revision ID: e4b7c1f05a92
+Revises: c83f2a6d9e14
+Create Date: 2026-10-18 15:02:33.517846
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e4b7c1f05a92'
+down_revision = 'c83f2a6d9e14'
+branch_labels = None
+depends_on = None
+
+# Postgres needs the partition key in every primary key of a partitioned
+# table, so the primary keys become (id, issued_date) and (id, created_at).
+# book_borrow can then no longer carry a foreign key to book_transaction,
+# the ON DELETE CASCADE it had is kept by a trigger instead.
+#
+# New months are added ahead of time by `python -m app.partitions`. Rows
+# outside of every monthly partition land in the DEFAULT partition.
+
+CREATE_PARTITION_FUNCTION = """
+CREATE OR REPLACE FUNCTION create_monthly_partition(parent text, month date)
+RETURNS void AS $$
+DECLARE
+    month_start timestamptz := date_trunc('month', month::timestamp)
+        AT TIME ZONE 'UTC';
+BEGIN
+    EXECUTE format(
+        'CREATE TABLE IF NOT EXISTS %I PARTITION OF %I '
+        'FOR VALUES FROM (%L) TO (%L)',
+        parent || '_' || to_char(month_start AT TIME ZONE 'UTC', '"y"YYYY"m"MM'),
+        parent,
+        month_start,
+        month_start + interval '1 month'
+    );
+END;
+$$ LANGUAGE plpgsql
+"""
+
+CREATE_TRANSACTION_TABLE = """
+CREATE TABLE book_transaction (
+    book_transaction_id INTEGER NOT NULL
+        DEFAULT nextval('book_transaction_book_transaction_id_seq'),
+    borrowed_by INTEGER NOT NULL,
+    issued_date TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT now(),
+    due_date TIMESTAMP WITH TIME ZONE DEFAULT NOW() + INTERVAL '5 day',
+    book_fine FLOAT,
+    remarks VARCHAR,
+    created_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT now(),
+    status_id INTEGER NOT NULL,
+    updated_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT now(),
+    CONSTRAINT book_transaction_pkey
+        PRIMARY KEY (book_transaction_id, issued_date)
+) PARTITION BY RANGE (issued_date)
+"""
+
+CREATE_BORROW_TABLE = """
+CREATE TABLE book_borrow (
+    book_borrow_id INTEGER NOT NULL
+        DEFAULT nextval('book_borrow_book_borrow_id_seq'),
+    book_id INTEGER NOT NULL,
+    book_transaction_id INTEGER NOT NULL,
+    created_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT now(),
+    CONSTRAINT book_borrow_pkey PRIMARY KEY (book_borrow_id, created_at)
+) PARTITION BY RANGE (created_at)
+"""
+
+TRANSACTION_COLUMNS = (
+    "book_transaction_id, borrowed_by, issued_date, due_date, book_fine, "
+    "remarks, created_at, status_id, updated_at"
+)
+BORROW_COLUMNS = "book_borrow_id, book_id, book_transaction_id, created_at"
+
+CREATE_CASCADE_TRIGGER = """
+CREATE OR REPLACE FUNCTION book_transaction_delete_borrows()
+RETURNS trigger AS $$
+BEGIN
+    DELETE FROM book_borrow
+    WHERE book_transaction_id = OLD.book_transaction_id;
+    RETURN OLD;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER book_transaction_delete_borrows
+AFTER DELETE ON book_transaction
+FOR EACH ROW EXECUTE FUNCTION book_transaction_delete_borrows()
+"""
+
+# Added once the old tables are gone, so that they keep their usual names
+FOREIGN_KEYS = [
+    ('book_transaction_borrowed_by_fkey', 'book_transaction', 'user_profile',
+     'borrowed_by', 'user_profile_id'),
+    ('book_transaction_status_id_fkey', 'book_transaction', 'status_code',
+     'status_id', 'status_id'),
+    ('book_borrow_book_id_fkey', 'book_borrow', 'book',
+     'book_id', 'book_id'),
+]
+
+INDEXES = [
+    ('ix_book_transaction_book_transaction_id', 'book_transaction',
+     ['book_transaction_id']),
+    ('ix_book_transaction_borrowed_by_issued_date', 'book_transaction',
+     [sa.text('borrowed_by'), sa.text('issued_date DESC')]),
+    ('ix_book_borrow_book_borrow_id', 'book_borrow', ['book_borrow_id']),
+    ('ix_book_borrow_book_transaction_id', 'book_borrow',
+     ['book_transaction_id']),
+]
+
+
+def rename_to_old(table, index_names):
+    op.execute(f"ALTER TABLE {table} RENAME TO {table}_old")
+    op.execute(f"ALTER INDEX {table}_pkey RENAME TO {table}_old_pkey")
+    for name in index_names:
+        op.execute(f"ALTER INDEX {name} RENAME TO {name}_old")
+
+
+def create_partitions(table, column):
+    """
+    One partition per month from the oldest row up to three months ahead,
+    plus a DEFAULT partition.
+    """
+    op.execute(f"""
+        SELECT create_monthly_partition('{table}', month::date)
+        FROM generate_series(
+            date_trunc('month', COALESCE(
+                (SELECT min({column}) FROM {table}_old), now()
+            ) AT TIME ZONE 'UTC'),
+            date_trunc('month', now() AT TIME ZONE 'UTC')
+                + interval '3 month',
+            interval '1 month'
+        ) AS month
+    """)
+    op.execute(f"CREATE TABLE {table}_default PARTITION OF {table} DEFAULT")
+
+
+def create_foreign_keys():
+    for name, table, referent, column, referent_column in FOREIGN_KEYS:
+        op.create_foreign_key(
+            name,
+            table,
+            referent,
+            [column],
+            [referent_column],
+            ondelete='CASCADE'
+        )
+
+
+def upgrade():
+    op.execute(CREATE_PARTITION_FUNCTION)
+
+    for table in ['book_borrow', 'book_transaction']:
+        rename_to_old(table, [
+            name for name, index_table, _ in INDEXES if index_table == table
+        ])
+        op.execute(
+            f"ALTER SEQUENCE {table}_{table}_id_seq OWNED BY NONE"
+        )
+
+    op.execute(CREATE_TRANSACTION_TABLE)
+    op.execute(CREATE_BORROW_TABLE)
+
+    create_partitions('book_transaction', 'issued_date')
+    create_partitions('book_borrow', 'created_at')
+
+    op.execute(f"""
+        INSERT INTO book_transaction ({TRANSACTION_COLUMNS})
+        SELECT {TRANSACTION_COLUMNS} FROM book_transaction_old
+    """)
+    op.execute(f"""
+        INSERT INTO book_borrow ({BORROW_COLUMNS})
+        SELECT {BORROW_COLUMNS} FROM book_borrow_old
+    """)
+
+    op.drop_table('book_borrow_old')
+    op.drop_table('book_transaction_old')
+
+    for table in ['book_borrow', 'book_transaction']:
+        op.execute(
+            f"ALTER SEQUENCE {table}_{table}_id_seq "
+            f"OWNED BY {table}.{table}_id"
+        )
+
+    create_foreign_keys()
+
+    # Indexes on the parent are created on every partition as well
+    for name, table, columns in INDEXES:
+        op.create_index(name, table, columns, unique=False)
+
+    op.execute(CREATE_CASCADE_TRIGGER)
+
+
+def downgrade():
+    op.execute(
+        "DROP TRIGGER book_transaction_delete_borrows ON book_transaction"
+    )
+    op.execute("DROP FUNCTION book_transaction_delete_borrows()")
+
+    for table in ['book_borrow', 'book_transaction']:
+        rename_to_old(table, [
+            name for name, index_table, _ in INDEXES if index_table == table
+        ])
+        op.execute(
+            f"ALTER SEQUENCE {table}_{table}_id_seq OWNED BY NONE"
+        )
+
+    op.execute(
+        CREATE_TRANSACTION_TABLE
+        .replace("PRIMARY KEY (book_transaction_id, issued_date)",
+                 "PRIMARY KEY (book_transaction_id)")
+        .replace("PARTITION BY RANGE (issued_date)", "")
+    )
+    op.execute(
+        CREATE_BORROW_TABLE
+        .replace("PRIMARY KEY (book_borrow_id, created_at)",
+                 "PRIMARY KEY (book_borrow_id)")
+        .replace("PARTITION BY RANGE (created_at)", "")
+    )
+
+    op.execute(f"""
+        INSERT INTO book_transaction ({TRANSACTION_COLUMNS})
+        SELECT {TRANSACTION_COLUMNS} FROM book_transaction_old
+    """)
+    op.execute(f"""
+        INSERT INTO book_borrow ({BORROW_COLUMNS})
+        SELECT {BORROW_COLUMNS} FROM book_borrow_old
+    """)
+
+    # Dropping the partitioned parents drops all of their partitions
+    op.execute("DROP TABLE book_borrow_old")
+    op.execute("DROP TABLE book_transaction_old")
+
+    for table in ['book_borrow', 'book_transaction']:
+        op.execute(
+            f"ALTER SEQUENCE {table}_{table}_id_seq "
+            f"OWNED BY {table}.{table}_id"
+        )
+
+    create_foreign_keys()
+    op.create_foreign_key(
+        'book_borrow_book_transaction_id_fkey',
+        'book_borrow',
+        'book_transaction',
+        ['book_transaction_id'],
+        ['book_transaction_id'],
+        ondelete='CASCADE'
+    )
+
+    for name, table, columns in INDEXES:
+        op.create_index(name, table, columns, unique=False)
+
+    op.execute("DROP FUNCTION create_monthly_partition(text, date)")
@@ -0,0 +1,50 @@
+"""add loan archive tables
+
+Revision ID: f1a9d3b6c720
+Revises: e4b7c1f05a92
+Create Date: 2026-10-18 16:27:45.902118
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f1a9d3b6c720'
+down_revision = 'e4b7c1f05a92'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Cold storage for closed loans, filled by `python -m app.archive`.
+    # Only the indexes the history endpoint needs, no foreign keys.
+    op.create_table('book_transaction_archive',
+    sa.Column('book_transaction_id', sa.Integer(), autoincrement=False, nullable=False),
+    sa.Column('borrowed_by', sa.Integer(), nullable=False),
+    sa.Column('issued_date', sa.TIMESTAMP(timezone=True), nullable=False),
+    sa.Column('due_date', sa.TIMESTAMP(timezone=True), nullable=True),
+    sa.Column('book_fine', sa.Float(), nullable=True),
+    sa.Column('remarks', sa.String(), nullable=True),
+    sa.Column('status_id', sa.Integer(), nullable=False),
+    sa.Column('created_at', sa.TIMESTAMP(timezone=True), nullable=False),
+    sa.Column('updated_at', sa.TIMESTAMP(timezone=True), nullable=False),
+    sa.Column('archived_at', sa.TIMESTAMP(timezone=True), server_default=sa.text('now()'), nullable=False),
+    sa.PrimaryKeyConstraint('book_transaction_id')
+    )
+    op.create_index(op.f('ix_book_transaction_archive_borrowed_by'), 'book_transaction_archive', ['borrowed_by'], unique=False)
+    op.create_table('book_borrow_archive',
+    sa.Column('book_borrow_id', sa.Integer(), autoincrement=False, nullable=False),
+    sa.Column('book_id', sa.Integer(), nullable=False),
+    sa.Column('book_transaction_id', sa.Integer(), nullable=False),
+    sa.Column('created_at', sa.TIMESTAMP(timezone=True), nullable=False),
+    sa.PrimaryKeyConstraint('book_borrow_id')
+    )
+    op.create_index(op.f('ix_book_borrow_archive_book_transaction_id'), 'book_borrow_archive', ['book_transaction_id'], unique=False)
+
+
+def downgrade():
+    op.drop_index(op.f('ix_book_borrow_archive_book_transaction_id'), table_name='book_borrow_archive')
+    op.drop_table('book_borrow_archive')
+    op.drop_index(op.f('ix_book_transaction_archive_borrowed_by'), table_name='book_transaction_archive')
+    op.drop_table('book_transaction_archive')
@@ -0,0 +1,110 @@
+# Moves loans closed a while ago out of book_transaction / book_borrow into
+# the archive tables, so that the indexes used at checkout only cover recent
+# loans. A loan closes when its status changes, which also sets its
+# updated_at, so that is the close time.
+# Work is done in small batches, each batch is one statement in its own
+# transaction, and the job sleeps between batches to leave I/O for the API.
+#
+# How to run it from the command line:
+#   python -m app.archive
+#   python -m app.archive --older-than-days 180 --batch-size 500 --pause 0.5
+import argparse
+import time
+
+from sqlalchemy import text
+
+# The borrows are moved before their transaction so that no borrow row is
+# ever left pointing at a transaction that has already gone. Rows locked by
+# a running request are skipped and picked up by a later run.
+# A loan is never closed before it is issued, so the issued_date bound does
+# not change the result, it only lets postgres skip the recent partitions.
+ARCHIVE_BATCH = text("""
+    WITH batch AS (
+        SELECT book_transaction_id
+        FROM book_transaction
+        WHERE status_id != 1
+            AND updated_at < now() - make_interval(days => :older_than_days)
+            AND issued_date < now() - make_interval(days => :older_than_days)
+        ORDER BY book_transaction_id
+        LIMIT :batch_size
+        FOR UPDATE SKIP LOCKED
+    ), moved_borrows AS (
+        DELETE FROM book_borrow
+        WHERE book_transaction_id IN (SELECT book_transaction_id FROM batch)
+        RETURNING book_borrow_id, book_id, book_transaction_id, created_at
+    ), archived_borrows AS (
+        INSERT INTO book_borrow_archive (
+            book_borrow_id, book_id, book_transaction_id, created_at
+        )
+        SELECT book_borrow_id, book_id, book_transaction_id, created_at
+        FROM moved_borrows
+    ), moved AS (
+        DELETE FROM book_transaction
+        WHERE book_transaction_id IN (SELECT book_transaction_id FROM batch)
+        RETURNING book_transaction_id, borrowed_by, issued_date, due_date,
+            book_fine, remarks, status_id, created_at, updated_at
+    )
+    INSERT INTO book_transaction_archive (
+        book_transaction_id, borrowed_by, issued_date, due_date,
+        book_fine, remarks, status_id, created_at, updated_at
+    )
+    SELECT book_transaction_id, borrowed_by, issued_date, due_date,
+        book_fine, remarks, status_id, created_at, updated_at
+    FROM moved
+""")
+
+
+def archive_closed_loans(db, older_than_days=90, batch_size=1000, pause=0.1):
+    """
+    Archives transactions closed more than `older_than_days` ago.
+    Returns how many transactions were moved.
+    """
+    archived = 0
+
+    while True:
+        result = db.execute(ARCHIVE_BATCH, {
+            "older_than_days": older_than_days,
+            "batch_size": batch_size
+        })
+        db.commit()
+
+        archived += result.rowcount
+        if result.rowcount < batch_size:
+            break
+
+        time.sleep(pause)
+
+    return archived
+
+
+def main():
+    from .database import SessionLocal
+
+    parser = argparse.ArgumentParser(description="Archive closed loans")
+    parser.add_argument(
+        "--older-than-days", type=int, default=90,
+        help="archive loans closed more than this many days ago"
+    )
+    parser.add_argument("--batch-size", type=int, default=1000)
+    parser.add_argument(
+        "--pause", type=float, default=0.1,
+        help="seconds to sleep between batches"
+    )
+    args = parser.parse_args()
+
+    db = SessionLocal()
+    try:
+        archived = archive_closed_loans(
+            db,
+            args.older_than_days,
+            args.batch_size,
+            args.pause
+        )
+    finally:
+        db.close()
+
+    print(f"archived: {archived} transactions")
+
+
+if __name__ == "__main__":
+    main()
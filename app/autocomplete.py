@@ -0,0 +1,305 @@
+# Per-worker prefix index used by the book autocomplete endpoint.
+# The index is a sorted list of (key, book_id) tuples, searched with bisect,
+# so a lookup never touches the database. It is loaded at startup and kept
+# up to date by the book routes of this worker. Changes made by other
+# workers or by the CLI importer are picked up by a background thread,
+# which only reads the books updated since its last look and the ids in
+# the book_deletion log.
+import logging
+from bisect import bisect_left, insort
+from datetime import timedelta
+from threading import Event, Lock, Thread
+
+from sqlalchemy import func
+
+from . import models
+
+logger = logging.getLogger(__name__)
+
+# updated_at is taken when a transaction starts, or from the clock of the
+# app server, so a row can commit with a time a little older than the last
+# one seen. Every refresh reads this far back again, which is cheap as the
+# rows that did not change are skipped.
+REFRESH_OVERLAP = timedelta(minutes=5)
+# Long enough for every worker to have seen the deletion
+DELETION_RETENTION = timedelta(days=1)
+
+
+class PrefixIndex:
+
+    def __init__(self):
+        self._lock = Lock()
+        self._keys = []
+        self._books = {}
+        # Newest updated_at / deleted_at applied, see refresh
+        self.changed_since = None
+        self.deleted_since = None
+        # Bumped by every write, see add_many
+        self._version = 0
+
+    @staticmethod
+    def _entry(book):
+        return {
+            "book_id": book.book_id,
+            "isbn": book.isbn,
+            "book_name": book.book_name,
+            "book_author": book.book_author
+        }
+
+    @staticmethod
+    def _keys_for(entry):
+        return [
+            (entry["book_name"].casefold(), entry["book_id"]),
+            (entry["isbn"].casefold(), entry["book_id"])
+        ]
+
+    def rebuild(self, db):
+        """
+        Replaces the whole index with the current contents of the book table
+        """
+        # Read first, anything that changes during the scan is picked up
+        # by the next refresh
+        self.changed_since = db.query(
+            func.max(models.Book.updated_at)
+        ).scalar()
+        self.deleted_since = db.query(
+            func.max(models.BookDeletion.deleted_at)
+        ).scalar()
+
+        self.load(db.query(
+            models.Book.book_id,
+            models.Book.isbn,
+            models.Book.book_name,
+            models.Book.book_author
+        ).yield_per(10000))
+
+    def load(self, rows):
+        """
+        Replaces the whole index with the given books
+        """
+        books = {}
+        keys = []
+        for row in rows:
+            entry = self._entry(row)
+            books[row.book_id] = entry
+            keys.extend(self._keys_for(entry))
+
+        keys.sort()
+
+        with self._lock:
+            self._keys = keys
+            self._books = books
+            self._version += 1
+
+    def _remove(self, book_id):
+        entry = self._books.pop(book_id, None)
+        if entry is None:
+            return
+
+        self._version += 1
+        for key in self._keys_for(entry):
+            i = bisect_left(self._keys, key)
+            if i < len(self._keys) and self._keys[i] == key:
+                del self._keys[i]
+
+    def add(self, book):
+        """
+        Adds a book to the index, replacing any previous entry for its id
+        """
+        entry = self._entry(book)
+
+        with self._lock:
+            self._remove(entry["book_id"])
+            self._books[entry["book_id"]] = entry
+            for key in self._keys_for(entry):
+                insort(self._keys, key)
+            self._version += 1
+
+    def add_many(self, books):
+        """
+        Adds books to the index, replacing any previous entry for their ids,
+        e.g. a chunk of a bulk import.
+        """
+        self._replace([self._entry(book) for book in books], [])
+
+    def remove_many(self, book_ids):
+        self._replace([], book_ids)
+
+    def _replace(self, entries, removed_ids):
+        """
+        Writes many books at once. The keys are merged in with one pass
+        that copies the slices between their insertion points, which is far
+        cheaper than an insort per book on a large index. The merge runs
+        outside the lock, searches only wait for the swap.
+        """
+        new_keys = sorted(
+            key for entry in entries for key in self._keys_for(entry)
+        )
+        book_ids = [entry["book_id"] for entry in entries] + list(removed_ids)
+
+        while True:
+            with self._lock:
+                keys, version = self._keys, self._version
+                # The books may be in already, e.g. when a rebuild picked up
+                # the committed chunk before this call got the lock.
+                old_keys = sorted(
+                    key
+                    for book_id in book_ids
+                    if book_id in self._books
+                    for key in self._keys_for(self._books[book_id])
+                )
+            # add() and remove() may change keys in place while this runs,
+            # the version check below throws such a merge away.
+            merged = self._merge(self._without(keys, old_keys), new_keys)
+            with self._lock:
+                # Start over if another write came in meanwhile
+                if self._version != version:
+                    continue
+                self._keys = merged
+                for book_id in removed_ids:
+                    self._books.pop(book_id, None)
+                for entry in entries:
+                    self._books[entry["book_id"]] = entry
+                self._version += 1
+                return
+
+    def refresh(self, db):
+        """
+        Applies the books changed and deleted since the last rebuild or
+        refresh, by any process. Rows that did not change, e.g. the writes
+        of this worker that add() already applied, are skipped, so when
+        nothing else changed the index is left alone.
+        """
+        changed = []
+        query = db.query(
+            models.Book.book_id,
+            models.Book.isbn,
+            models.Book.book_name,
+            models.Book.book_author,
+            models.Book.updated_at
+        )
+        if self.changed_since is not None:
+            query = query.filter(
+                models.Book.updated_at > self.changed_since - REFRESH_OVERLAP
+            )
+        for row in query.yield_per(10000):
+            self.changed_since = max(
+                self.changed_since or row.updated_at, row.updated_at
+            )
+            if self._books.get(row.book_id) != self._entry(row):
+                changed.append(row)
+        changed_ids = {row.book_id for row in changed}
+
+        deleted = []
+        query = db.query(
+            models.BookDeletion.book_id,
+            models.BookDeletion.deleted_at
+        )
+        if self.deleted_since is not None:
+            query = query.filter(
+                models.BookDeletion.deleted_at
+                > self.deleted_since - REFRESH_OVERLAP
+            )
+        for row in query:
+            self.deleted_since = max(
+                self.deleted_since or row.deleted_at, row.deleted_at
+            )
+            if row.book_id in self._books or row.book_id in changed_ids:
+                deleted.append(row.book_id)
+
+        if changed:
+            self.add_many(changed)
+        if deleted:
+            self.remove_many(deleted)
+        return len(changed), len(deleted)
+
+    @staticmethod
+    def _merge(keys, new_keys):
+        merged = []
+        start = 0
+        for key in new_keys:
+            i = bisect_left(keys, key, start)
+            merged += keys[start:i]
+            start = i
+            # Never two copies of a key, remove() only takes one out
+            if i < len(keys) and keys[i] == key:
+                continue
+            if merged and merged[-1] == key:
+                continue
+            merged.append(key)
+        merged += keys[start:]
+        return merged
+
+    @staticmethod
+    def _without(keys, old_keys):
+        if not old_keys:
+            return keys
+
+        kept = []
+        start = 0
+        for key in old_keys:
+            i = bisect_left(keys, key, start)
+            if i < len(keys) and keys[i] == key:
+                kept += keys[start:i]
+                start = i + 1
+        kept += keys[start:]
+        return kept
+
+    def remove(self, book_id):
+        with self._lock:
+            self._remove(book_id)
+
+    def search(self, prefix, limit=10):
+        prefix = prefix.casefold()
+        results = []
+        seen = set()
+
+        with self._lock:
+            i = bisect_left(self._keys, (prefix,))
+            while i < len(self._keys) and len(results) < limit:
+                key, book_id = self._keys[i]
+                if not key.startswith(prefix):
+                    break
+                if book_id not in seen:
+                    seen.add(book_id)
+                    results.append(self._books[book_id])
+                i += 1
+
+        return results
+
+
+class Refresher:
+    """
+    Refreshes the index every `interval` seconds and clears out the
+    deletion log entries every worker has seen.
+    """
+
+    def __init__(self, index, session_factory, interval):
+        self.index = index
+        self.session_factory = session_factory
+        self.interval = interval
+        self._stopped = Event()
+
+    def start(self):
+        Thread(target=self._run, daemon=True).start()
+
+    def stop(self):
+        self._stopped.set()
+
+    def _run(self):
+        while not self._stopped.wait(self.interval):
+            db = self.session_factory()
+            try:
+                self.index.refresh(db)
+                db.query(models.BookDeletion).filter(
+                    models.BookDeletion.deleted_at
+                    < func.now() - DELETION_RETENTION
+                ).delete(synchronize_session=False)
+                db.commit()
+            except Exception:
+                logger.exception("autocomplete refresh failed")
+            finally:
+                db.close()
+
+
+book_index = PrefixIndex()
@@ -0,0 +1,187 @@
+# Streaming bulk import of books from a CSV or JSONL file.
+# Rows are validated against schemas.BookCreate in chunks and each chunk is
+# written with a single multi-row INSERT in its own transaction. A bad row is
+# reported and skipped, it never aborts the rest of the file: when the
+# database rejects a chunk, that chunk is retried row by row.
+#
+# Files are read as utf-8-sig, so a byte order mark left by spreadsheet
+# exports does not end up in the first CSV header.
+#
+# How to run it from the command line:
+#   python -m app.bulk_import books.csv
+#   python -m app.bulk_import books.jsonl --chunk-size 10000
+import argparse
+import csv
+import json
+from itertools import islice
+
+from pydantic import ValidationError
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.exc import SQLAlchemyError
+
+from . import models, schemas
+from .autocomplete import book_index
+
+DEFAULT_CHUNK_SIZE = 5000
+
+# The response only carries the first few errors, the count is always exact.
+MAX_REPORTED_ERRORS = 1000
+
+
+def read_rows(text_file, file_format):
+    """
+    Yields (row_number, raw_row) pairs from an open text file.
+    A row that cannot be parsed is yielded as an exception.
+    """
+    if file_format == "csv":
+        for row_number, row in enumerate(csv.DictReader(text_file), start=1):
+            yield row_number, row
+        return
+
+    row_number = 0
+    for line in text_file:
+        if not line.strip():
+            continue
+        row_number += 1
+        try:
+            yield row_number, json.loads(line)
+        except ValueError as e:
+            yield row_number, e
+
+
+def insert_books(db, books):
+    """
+    Inserts the books in one statement and returns the (book_id, isbn) of
+    the ones whose isbn was not taken yet.
+    """
+    statement = insert(models.Book).values(
+        books
+    ).on_conflict_do_nothing(
+        index_elements=[models.Book.isbn]
+    ).returning(
+        models.Book.book_id,
+        models.Book.isbn
+    )
+    inserted = db.execute(statement).fetchall()
+    db.commit()
+    return inserted
+
+
+def import_books(db, rows, chunk_size=DEFAULT_CHUNK_SIZE, index=book_index):
+    """
+    The imported books are added to `index` (the autocomplete index of
+    this worker). Pass index=None where nothing reads it, e.g. the CLI.
+    """
+    result = {"inserted": 0, "failed": 0, "errors": []}
+
+    def report(row_number, detail):
+        result["failed"] += 1
+        if len(result["errors"]) < MAX_REPORTED_ERRORS:
+            result["errors"].append({"row": row_number, "detail": detail})
+
+    # Categories are few, checking them here keeps a foreign key violation
+    # from failing a whole chunk.
+    category_ids = {
+        row.book_category_id
+        for row in db.query(models.BookCategory.book_category_id)
+    }
+
+    rows = iter(rows)
+    while True:
+        chunk = list(islice(rows, chunk_size))
+        if not chunk:
+            break
+
+        valid = {}
+        for row_number, raw in chunk:
+            if isinstance(raw, Exception):
+                report(row_number, f"Invalid row: {raw}")
+                continue
+            try:
+                book = schemas.BookCreate(**raw)
+            except (ValidationError, TypeError) as e:
+                report(row_number, str(e))
+                continue
+            if book.book_category_id not in category_ids:
+                report(
+                    row_number,
+                    f"Book Category with id: {book.book_category_id} not found!"
+                )
+                continue
+            if book.isbn in valid:
+                report(row_number, f"Duplicate isbn {book.isbn} in file")
+                continue
+            book = book.dict()
+            book["available_count"] = book["book_count"]
+            valid[book["isbn"]] = (row_number, book)
+
+        if not valid:
+            continue
+
+        try:
+            inserted = insert_books(db, [book for _, book in valid.values()])
+        except SQLAlchemyError:
+            db.rollback()
+            # Find the rows the database refuses, e.g. a number too large
+            # for its column, by inserting them one at a time.
+            inserted = []
+            for isbn, (row_number, book) in list(valid.items()):
+                try:
+                    inserted.extend(insert_books(db, [book]))
+                except SQLAlchemyError as e:
+                    db.rollback()
+                    del valid[isbn]
+                    report(row_number, str(getattr(e, "orig", e)).strip())
+
+        result["inserted"] += len(inserted)
+
+        new_books = []
+        for row in inserted:
+            _, book = valid.pop(row.isbn)
+            new_books.append(models.Book(book_id=row.book_id, **book))
+        if index is not None:
+            index.add_many(new_books)
+
+        # Whatever was not returned hit an existing isbn
+        for isbn, (row_number, _) in valid.items():
+            report(row_number, f"Book with isbn: {isbn} already exists!")
+
+    return result
+
+
+def main():
+    from .database import SessionLocal
+
+    parser = argparse.ArgumentParser(description="Bulk import books")
+    parser.add_argument("path", help="a .csv or .jsonl file")
+    parser.add_argument(
+        "--format", choices=["csv", "jsonl"], default=None,
+        help="defaults to the file extension"
+    )
+    parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE)
+    args = parser.parse_args()
+
+    file_format = args.format or (
+        "csv" if args.path.lower().endswith(".csv") else "jsonl"
+    )
+
+    db = SessionLocal()
+    try:
+        with open(args.path, newline="", encoding="utf-8-sig") as text_file:
+            # No API worker reads this process's autocomplete index
+            result = import_books(
+                db,
+                read_rows(text_file, file_format),
+                args.chunk_size,
+                index=None
+            )
+    finally:
+        db.close()
+
+    for error in result["errors"]:
+        print(f"row {error['row']}: {error['detail']}")
+    print(f"inserted: {result['inserted']}, failed: {result['failed']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+# Small in-process caches shared by the routers.
+# Every gunicorn worker keeps its own copy, so anything stored here has to be
+# invalidated explicitly by the routes that change the underlying rows.
+import time
+from collections import OrderedDict
+from threading import Lock
+
+from .config import settings
+
+
+class LRUCache:
+    """
+    Bounded LRU cache whose entries also expire after `ttl` seconds.
+    Keeps hit / miss / eviction counters so that it can be sized.
+    """
+
+    def __init__(self, maxsize, ttl):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                self.misses += 1
+                return None
+
+            value, expires_at = item
+            if expires_at < time.monotonic():
+                del self._data[key]
+                self.misses += 1
+                return None
+
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key, value, ttl=None):
+        expires_at = time.monotonic() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            self._data[key] = (value, expires_at)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "evictions": self.evictions,
+                "size": len(self._data),
+                "maxsize": self.maxsize
+            }
+
+
+# (ETag, serialized schemas.BookComplete) pairs keyed by book_id
+book_cache = LRUCache(
+    settings.book_cache_size,
+    settings.book_cache_ttl_seconds
+)
+
+
+# Leaderboard entries keyed by (board, category, limit)
+leaderboard_cache = LRUCache(256, settings.leaderboard_cache_ttl_seconds)
+
+
+# schemas.UserPrincipal keyed by user_profile_id, read by
+# oauth2.get_current_user. The short TTL bounds how long a change made by
+# another worker can go unnoticed.
+user_cache = LRUCache(
+    settings.user_cache_size,
+    settings.user_cache_ttl_seconds
+)
+
+
+# (schemas.TokenData, claims) keyed by the SHA-256 digest of the token, never
+# the token itself. Entries live until the token's exp and the size limit
+# keeps the worst case at a few MB per worker.
+token_cache = LRUCache(
+    settings.token_cache_size,
+    settings.access_token_expire_minutes * 60
+)
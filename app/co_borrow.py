@@ -0,0 +1,215 @@
+# "Frequently borrowed together" counts.
+# Every checkout adds its pairs of books to book_co_borrow right away, and
+# a periodic rebuild recounts everything from the loan history (live and
+# archived) into a staging table that then replaces the live one, to fix
+# any drift.
+#
+# How to run the rebuild from the command line:
+#   python -m app.co_borrow
+#   python -m app.co_borrow --chunk-size 100000
+import argparse
+from itertools import permutations
+
+from sqlalchemy import func, text
+from sqlalchemy.dialects.postgresql import insert
+
+from . import models
+
+DEFAULT_CHUNK_SIZE = 50000
+
+
+def record_transaction(db, book_ids):
+    """
+    Counts one more joint borrow for every pair of distinct books that went
+    out in the same transaction.
+    """
+    # Sorted so that concurrent checkouts lock the rows in the same order
+    pairs = sorted(permutations(set(book_ids), 2))
+    if not pairs:
+        return
+
+    statement = insert(models.BookCoBorrow).values([
+        {"book_id": book_id, "other_book_id": other_book_id, "borrow_count": 1}
+        for book_id, other_book_id in pairs
+    ])
+    statement = statement.on_conflict_do_update(
+        index_elements=[
+            models.BookCoBorrow.book_id,
+            models.BookCoBorrow.other_book_id
+        ],
+        set_={"borrow_count": models.BookCoBorrow.borrow_count + 1}
+    )
+    db.execute(statement)
+
+
+# One chunk of transactions, counted by postgres and merged into the
+# staging table
+REBUILD_CHUNK = text("""
+    WITH borrows AS (
+        SELECT DISTINCT book_transaction_id, book_id
+        FROM (
+            SELECT book_transaction_id, book_id FROM book_borrow
+            WHERE book_transaction_id >= :start
+                AND book_transaction_id < :stop
+            UNION ALL
+            SELECT book_transaction_id, book_id FROM book_borrow_archive
+            WHERE book_transaction_id >= :start
+                AND book_transaction_id < :stop
+        ) AS chunk
+    )
+    INSERT INTO book_co_borrow_staging (book_id, other_book_id, borrow_count)
+    SELECT a.book_id, b.book_id, count(*)
+    FROM borrows AS a
+    JOIN borrows AS b
+        ON b.book_transaction_id = a.book_transaction_id
+        AND b.book_id != a.book_id
+    GROUP BY a.book_id, b.book_id
+    ON CONFLICT (book_id, other_book_id) DO UPDATE
+    SET borrow_count = book_co_borrow_staging.borrow_count
+        + EXCLUDED.borrow_count
+""")
+
+CREATE_STAGING = [
+    "DROP TABLE IF EXISTS book_co_borrow_staging",
+    """
+    CREATE TABLE book_co_borrow_staging (
+        book_id INTEGER NOT NULL,
+        other_book_id INTEGER NOT NULL,
+        borrow_count INTEGER NOT NULL,
+        CONSTRAINT book_co_borrow_staging_pkey
+            PRIMARY KEY (book_id, other_book_id)
+    )
+    """,
+]
+
+# Run with book_co_borrow locked. The staging table takes the place of the
+# live one and gets its names, the foreign keys are added NOT VALID so that
+# they do not scan the table under the lock.
+SWAP = [
+    "DROP TABLE book_co_borrow",
+    "ALTER TABLE book_co_borrow_staging RENAME TO book_co_borrow",
+    """
+    ALTER TABLE book_co_borrow
+    RENAME CONSTRAINT book_co_borrow_staging_pkey TO book_co_borrow_pkey
+    """,
+    """
+    ALTER INDEX ix_book_co_borrow_staging_book_id_borrow_count
+    RENAME TO ix_book_co_borrow_book_id_borrow_count
+    """,
+    """
+    ALTER TABLE book_co_borrow
+    ADD CONSTRAINT book_co_borrow_book_id_fkey
+    FOREIGN KEY (book_id) REFERENCES book (book_id)
+    ON DELETE CASCADE NOT VALID
+    """,
+    """
+    ALTER TABLE book_co_borrow
+    ADD CONSTRAINT book_co_borrow_other_book_id_fkey
+    FOREIGN KEY (other_book_id) REFERENCES book (book_id)
+    ON DELETE CASCADE NOT VALID
+    """,
+]
+
+# Books deleted while the staging table was filled left rows behind
+VALIDATE = [
+    """
+    DELETE FROM book_co_borrow AS pair
+    WHERE NOT EXISTS (
+        SELECT 1 FROM book WHERE book.book_id = pair.book_id
+    ) OR NOT EXISTS (
+        SELECT 1 FROM book WHERE book.book_id = pair.other_book_id
+    )
+    """,
+    "ALTER TABLE book_co_borrow VALIDATE CONSTRAINT book_co_borrow_book_id_fkey",
+    """
+    ALTER TABLE book_co_borrow
+    VALIDATE CONSTRAINT book_co_borrow_other_book_id_fkey
+    """,
+]
+
+
+def lock_live_table(db):
+    """
+    Waits for the checkouts that already counted their pairs to commit and
+    holds off new ones. Checkouts count their pairs before their
+    transaction gets an id, so from here on every transaction id handed out
+    so far belongs to a committed checkout.
+    """
+    db.execute(text("LOCK TABLE book_co_borrow IN SHARE ROW EXCLUSIVE MODE"))
+
+
+def max_transaction_id(db):
+    return max(
+        db.query(func.max(table.book_transaction_id)).scalar() or 0
+        for table in [models.BookBorrow, models.BookBorrowArchive]
+    )
+
+
+def rebuild(db, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Recounts the whole table into book_co_borrow_staging and swaps it in.
+    Checkouts are only held up twice for a moment: while the boundary id
+    is read and during the swap. The history is counted in between, one
+    committed chunk of transaction ids at a time, and the transactions
+    that came in meanwhile are added under the swap's lock, so every
+    checkout is counted exactly once.
+    """
+    for statement in CREATE_STAGING:
+        db.execute(text(statement))
+    db.commit()
+
+    lock_live_table(db)
+    boundary = max_transaction_id(db)
+    db.commit()
+
+    chunks = 0
+    for start in range(1, boundary + 1, chunk_size):
+        db.execute(REBUILD_CHUNK, {
+            "start": start,
+            "stop": min(start + chunk_size, boundary + 1)
+        })
+        db.commit()
+        chunks += 1
+
+    db.execute(text("""
+        CREATE INDEX ix_book_co_borrow_staging_book_id_borrow_count
+        ON book_co_borrow_staging (book_id, borrow_count DESC)
+    """))
+    db.commit()
+
+    lock_live_table(db)
+    db.execute(REBUILD_CHUNK, {
+        "start": boundary + 1,
+        "stop": max_transaction_id(db) + 1
+    })
+    for statement in SWAP:
+        db.execute(text(statement))
+    db.commit()
+
+    for statement in VALIDATE:
+        db.execute(text(statement))
+        db.commit()
+
+    return chunks
+
+
+def main():
+    from .database import SessionLocal
+
+    parser = argparse.ArgumentParser(
+        description="Rebuild the frequently borrowed together counts"
+    )
+    parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE)
+    args = parser.parse_args()
+
+    db = SessionLocal()
+    try:
+        chunks = rebuild(db, args.chunk_size)
+    finally:
+        db.close()
+
+    print(f"co-borrow counts rebuilt in {chunks} chunks")
+
+
+if __name__ == "__main__":
+    main()
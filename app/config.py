@@ -1,3 +1,5 @@
+from typing import Optional
+
 from pydantic import BaseSettings
 
 
@@ -10,6 +12,27 @@ class Settings(BaseSettings):
     secret_key: str
     algorithm: str
     access_token_expire_minutes: int
+    book_cache_size: int = 10000
+    book_cache_ttl_seconds: int = 300
+    fine_per_day: float = 1.0
+    leaderboard_size: int = 100
+    leaderboard_rating_prior: int = 10
+    leaderboard_cache_ttl_seconds: int = 300
+    similar_books_k: int = 20
+    autocomplete_refresh_seconds: int = 30
+    user_cache_size: int = 10000
+    user_cache_ttl_seconds: int = 60
+    token_version: int = 1
+    token_cache_size: int = 10000
+    bcrypt_rounds: int = 12
+    password_pool_size: int = 2
+    password_queue_limit: int = 16
+    login_ip_per_minute: int = 30
+    login_ip_burst: int = 30
+    login_username_per_minute: int = 5
+    login_username_burst: int = 10
+    rate_limit_redis_url: Optional[str] = None
+    trusted_proxy_hops: int = 0
 
     class Config:
         env_file = ".env"
@@ -0,0 +1,33 @@
+# Helpers for conditional GETs.
+# An ETag is a hash of whatever identifies the version of a response: the
+# request parameters plus the ids and updated_at values of every row (and
+# related row) that ends up in the body.
+# The /info/{id} routes read only those updated_at values first and load the
+# full row only when the client does not have that version yet.
+import hashlib
+
+from fastapi import Request, Response, status
+
+
+def make_etag(*versions):
+    digest = hashlib.sha1(repr(versions).encode()).hexdigest()
+    return f'"{digest}"'
+
+
+def is_not_modified(request: Request, etag: str):
+    """
+    True if the client already holds this version, going by If-None-Match
+    """
+    header = request.headers.get("if-none-match")
+    if header is None:
+        return False
+
+    tags = [tag.strip() for tag in header.split(",")]
+    return "*" in tags or etag in tags or f"W/{etag}" in tags
+
+
+def not_modified(etag: str):
+    return Response(
+        status_code=status.HTTP_304_NOT_MODIFIED,
+        headers={"ETag": etag}
+    )
@@ -0,0 +1,74 @@
+# Fills in BookTransaction.book_fine for every overdue open transaction.
+# The whole backlog is handled by one set-based UPDATE. The fine is derived
+# from the due date alone, so running the job again only changes the rows
+# whose fine has grown since the last run.
+#
+# How to run it from the command line:
+#   python -m app.fines
+#   python -m app.fines --rate-per-day 2.5
+import argparse
+import time
+
+from sqlalchemy import func
+
+from . import models
+from .config import settings
+
+
+def compute_overdue_fines(db, rate_per_day=None):
+    """
+    Returns the number of transactions whose fine changed and how long the
+    update took in seconds.
+    """
+    if rate_per_day is None:
+        rate_per_day = settings.fine_per_day
+
+    now = func.now()
+
+    # Every started day past the due date counts as a full day
+    days_overdue = func.ceil(
+        func.extract('epoch', now - models.BookTransaction.due_date) / 86400
+    )
+    fine = days_overdue * rate_per_day
+
+    started = time.perf_counter()
+
+    updated = db.query(
+        models.BookTransaction
+    ).filter(
+        models.BookTransaction.status_id == 1,
+        models.BookTransaction.due_date < now,
+        models.BookTransaction.book_fine.is_distinct_from(fine)
+    ).update(
+        {models.BookTransaction.book_fine: fine},
+        synchronize_session=False
+    )
+    db.commit()
+
+    return {
+        "updated": updated,
+        "seconds": round(time.perf_counter() - started, 3)
+    }
+
+
+def main():
+    from .database import SessionLocal
+
+    parser = argparse.ArgumentParser(description="Compute overdue fines")
+    parser.add_argument(
+        "--rate-per-day", type=float, default=None,
+        help=f"defaults to FINE_PER_DAY ({settings.fine_per_day})"
+    )
+    args = parser.parse_args()
+
+    db = SessionLocal()
+    try:
+        result = compute_overdue_fines(db, args.rate_per_day)
+    finally:
+        db.close()
+
+    print(f"updated: {result['updated']} in {result['seconds']}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+# Keeps Book.available_count in step with the loans.
+# available_count is book_count minus the copies that sit in open
+# transactions (status_id 1). Every change is a relative UPDATE done by the
+# database, so concurrent requests never overwrite each other's counts.
+#
+# Checkouts also lock the book rows they take copies from, always in book_id
+# order so that two desks checking out overlapping sets of books cannot
+# deadlock. Whoever gets the lock second sees the already reduced count, so
+# the last copy can only be handed out once.
+from collections import Counter
+
+from sqlalchemy import case, func, select, update
+
+from . import models
+
+
+def checkout(db, book_ids):
+    """
+    Takes one copy off the shelf for every id in book_ids.
+    A book id may appear more than once.
+
+    Returns the ids that do not exist or do not have enough copies left, in
+    which case nothing is changed and the caller should roll back.
+    The row locks are held until the caller commits or rolls back.
+    """
+    counts = Counter(book_ids)
+    if not counts:
+        return []
+
+    locked = db.query(
+        models.Book.book_id,
+        models.Book.available_count
+    ).filter(
+        models.Book.book_id.in_(counts.keys())
+    ).order_by(
+        models.Book.book_id
+    ).with_for_update().all()
+
+    available = {row.book_id: row.available_count for row in locked}
+    unavailable = sorted(
+        book_id for book_id, copies in counts.items()
+        if available.get(book_id, 0) < copies
+    )
+    if unavailable:
+        return unavailable
+
+    db.execute(
+        update(models.Book).where(
+            models.Book.book_id.in_(counts.keys())
+        ).values(
+            available_count=models.Book.available_count - case(
+                counts, value=models.Book.book_id
+            )
+        ).execution_options(synchronize_session=False)
+    )
+    return []
+
+
+def release_transaction(db, book_transaction_id):
+    """
+    Puts the books of a transaction back on the shelf.
+    """
+    borrowed = db.query(
+        models.BookBorrow.book_id,
+        func.count().label("copies")
+    ).filter(
+        models.BookBorrow.book_transaction_id == book_transaction_id
+    ).group_by(
+        models.BookBorrow.book_id
+    ).subquery()
+
+    # Same lock order as checkout()
+    db.query(
+        models.Book.book_id
+    ).filter(
+        models.Book.book_id.in_(select(borrowed.c.book_id))
+    ).order_by(
+        models.Book.book_id
+    ).with_for_update().all()
+
+    db.execute(
+        update(models.Book).where(
+            models.Book.book_id == borrowed.c.book_id
+        ).values(
+            available_count=models.Book.available_count
+            + borrowed.c.copies
+        ).execution_options(synchronize_session=False)
+    )
@@ -0,0 +1,137 @@
+# "Top rated" and "most borrowed" leaderboards.
+# The rankings are rebuilt from scratch into book_ranking by a scheduled
+# run of this module, and reads are served from an in-process cache, so
+# the home page costs at most one small indexed query per worker and TTL.
+#
+# How to run it from the command line (e.g. from cron every few minutes):
+#   python -m app.leaderboard
+import argparse
+
+from sqlalchemy import text
+
+from . import models
+from .cache import leaderboard_cache
+from .config import settings
+
+BOARDS = ["rating", "borrows"]
+
+# Bayesian average: every book starts with `prior` imaginary ratings at the
+# mean of all ratings, so a single 5 does not beat a hundred 4.8s.
+RATING_SCORES = """
+    WITH global AS (
+        SELECT sum(rating_sum)::float / NULLIF(sum(rating_count), 0) AS mean
+        FROM book_rating_summary
+    )
+    SELECT
+        summary.book_id,
+        (:prior * global.mean + summary.rating_sum)
+            / (:prior + summary.rating_count) AS score
+    FROM book_rating_summary AS summary, global
+    WHERE summary.rating_count > 0
+"""
+
+# Archived loans still count as borrows
+BORROW_SCORES = """
+    SELECT book_id, count(*)::float AS score
+    FROM (
+        SELECT book_id FROM book_borrow
+        UNION ALL
+        SELECT book_id FROM book_borrow_archive
+    ) AS borrows
+    GROUP BY book_id
+"""
+
+REFRESH_BOARD = """
+    INSERT INTO book_ranking (board, book_id, book_category_id, score)
+    SELECT :board, ranked.book_id, ranked.book_category_id, ranked.score
+    FROM (
+        SELECT
+            scores.book_id,
+            book.book_category_id,
+            scores.score,
+            row_number() OVER (
+                PARTITION BY book.book_category_id
+                ORDER BY scores.score DESC, scores.book_id
+            ) AS category_rank
+        FROM ({scores}) AS scores
+        JOIN book ON book.book_id = scores.book_id
+    ) AS ranked
+    WHERE ranked.category_rank <= :size
+"""
+
+
+def refresh_rankings(db):
+    """
+    Rebuilds every board in one transaction, readers keep seeing the old
+    rankings until it commits.
+    """
+    for board, scores in [("rating", RATING_SCORES), ("borrows", BORROW_SCORES)]:
+        db.query(models.BookRanking).filter(
+            models.BookRanking.board == board
+        ).delete(synchronize_session=False)
+        db.execute(text(REFRESH_BOARD.format(scores=scores)), {
+            "board": board,
+            "size": settings.leaderboard_size,
+            "prior": settings.leaderboard_rating_prior
+        })
+    db.commit()
+
+
+def get_leaderboard(db, board, category=None, limit=10):
+    key = (board, category, limit)
+    entries = leaderboard_cache.get(key)
+    if entries is not None:
+        return entries
+
+    ranking_query = db.query(
+        models.BookRanking.book_id,
+        models.BookRanking.score,
+        models.Book.book_name,
+        models.Book.book_author
+    ).join(
+        models.BookRanking.book
+    ).filter(
+        models.BookRanking.board == board
+    )
+    if category is not None:
+        ranking_query = ranking_query.filter(
+            models.BookRanking.book_category_id == category
+        )
+
+    rows = ranking_query.order_by(
+        models.BookRanking.score.desc(),
+        models.BookRanking.book_id
+    ).limit(limit).all()
+
+    entries = [
+        {
+            "rank": rank,
+            "book_id": row.book_id,
+            "book_name": row.book_name,
+            "book_author": row.book_author,
+            "score": row.score
+        }
+        for rank, row in enumerate(rows, start=1)
+    ]
+    leaderboard_cache.set(key, entries)
+    return entries
+
+
+def main():
+    from .database import SessionLocal
+
+    argparse.ArgumentParser(
+        description="Rebuild the book leaderboards"
+    ).parse_args()
+
+    db = SessionLocal()
+    try:
+        refresh_rankings(db)
+    finally:
+        db.close()
+
+    print(f"leaderboards refreshed: {', '.join(BOARDS)}")
+
+
+if __name__ == "__main__":
+    main()
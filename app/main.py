@@ -4,6 +4,10 @@
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 
+from .autocomplete import Refresher, book_index
+from .config import settings
+from .database import SessionLocal
+from . import utils
 from .routers import (
     role,
     user,
@@ -47,6 +51,38 @@ app.include_router(book_transaction.router)
 app.include_router(status_code.router)
 
 
+book_index_refresher = Refresher(
+    book_index,
+    SessionLocal,
+    settings.autocomplete_refresh_seconds
+)
+
+
+@app.on_event("startup")
+def load_book_index():
+    db = SessionLocal()
+    try:
+        book_index.rebuild(db)
+    finally:
+        db.close()
+    book_index_refresher.start()
+
+
+@app.on_event("startup")
+def start_password_pool():
+    utils.start_pool()
+
+
+@app.on_event("shutdown")
+def stop_book_index_refresher():
+    book_index_refresher.stop()
+
+
+@app.on_event("shutdown")
+def stop_password_pool():
+    utils.stop_pool()
+
+
 @app.get("/")
 async def root():
     return {
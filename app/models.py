@@ -3,7 +3,10 @@
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql.schema import ForeignKey
 from .database import Base
-from sqlalchemy import Column, Integer, String, Float
+from sqlalchemy import (
+    Column, Integer, String, Float, Computed, Index, UniqueConstraint
+)
+from sqlalchemy.dialects.postgresql import TSVECTOR
 from sqlalchemy.sql.expression import text
 from sqlalchemy.sql.sqltypes import TIMESTAMP
 
@@ -18,6 +21,11 @@ class Role(Base):
         nullable=False,
         server_default=text('now()')
     )
+    updated_at = Column(
+        TIMESTAMP(timezone=True),
+        nullable=False,
+        server_default=text('now()')
+    )
 
 
 class UserProfile(Base):
@@ -33,6 +41,11 @@ class UserProfile(Base):
         nullable=False,
         server_default=text('now()')
     )
+    updated_at = Column(
+        TIMESTAMP(timezone=True),
+        nullable=False,
+        server_default=text('now()')
+    )
     books_allowed = Column(
         Integer,
         default=5,
@@ -74,6 +87,11 @@ class BookCategory(Base):
         nullable=False,
         server_default=text('now()')
     )
+    updated_at = Column(
+        TIMESTAMP(timezone=True),
+        nullable=False,
+        server_default=text('now()')
+    )
 
 
 class Book(Base):
@@ -88,11 +106,14 @@ class Book(Base):
     book_category_id = Column(
         Integer,
         ForeignKey("book_category.book_category_id", ondelete="CASCADE"),
-        nullable=False
+        nullable=False,
+        index=True
     )
 
     book_price = Column(Float, nullable=False)
     book_count = Column(Integer, nullable=False)
+    # Copies currently on the shelf, maintained by app/inventory.py
+    available_count = Column(Integer, nullable=False)
     book_description = Column(String, nullable=False)
 
     created_at = Column(TIMESTAMP(
@@ -100,10 +121,50 @@ class Book(Base):
         nullable=False,
         server_default=text('now()')
     )
+    updated_at = Column(
+        TIMESTAMP(timezone=True),
+        nullable=False,
+        server_default=text('now()')
+    )
+
+    # Maintained by postgres itself, so it never goes stale. Titles weigh
+    # more than authors, and authors more than the description.
+    search_vector = Column(
+        TSVECTOR,
+        Computed(
+            "setweight(to_tsvector('english', book_name), 'A') || "
+            "setweight(to_tsvector('english', book_author), 'B') || "
+            "setweight(to_tsvector('english', book_description), 'C')",
+            persisted=True
+        )
+    )
 
     book_category = relationship(
         "BookCategory", foreign_keys=[book_category_id])
 
+    __table_args__ = (
+        Index(
+            'ix_book_search_vector',
+            search_vector,
+            postgresql_using='gin'
+        ),
+        Index('ix_book_updated_at', updated_at),
+    )
+
+
+# Ids of deleted books, logged by a trigger on book. Read by the
+# autocomplete refresher, see app/autocomplete.py.
+class BookDeletion(Base):
+    __tablename__ = "book_deletion"
+
+    book_id = Column(Integer, primary_key=True)
+    deleted_at = Column(
+        TIMESTAMP(timezone=True),
+        nullable=False,
+        server_default=text('now()'),
+        index=True
+    )
+
 
 class StatusCode(Base):
     __tablename__ = "status_code"
@@ -150,6 +211,11 @@ class BookTransaction(Base):
         nullable=False,
         server_default=text('now()')
     )
+    updated_at = Column(
+        TIMESTAMP(timezone=True),
+        nullable=False,
+        server_default=text('now()')
+    )
 
     status_id = Column(
         Integer,
@@ -161,6 +227,19 @@ class BookTransaction(Base):
     borrower = relationship("UserProfile", foreign_keys=[borrowed_by])
     status = relationship("StatusCode", foreign_keys=[status_id])
 
+    # The table is partitioned by month on issued_date, so its primary key
+    # in postgres is (book_transaction_id, issued_date). The id alone is
+    # still unique and is what the ORM uses.
+    __table_args__ = (
+        # Serves the "latest transaction of a borrower" lookup at checkout
+        Index(
+            'ix_book_transaction_borrowed_by_issued_date',
+            borrowed_by,
+            issued_date.desc()
+        ),
+        {'postgresql_partition_by': 'RANGE (issued_date)'}
+    )
+
 
 class BookBorrow(Base):
     __tablename__ = "book_borrow"
@@ -171,10 +250,13 @@ class BookBorrow(Base):
         ForeignKey("book.book_id", ondelete="CASCADE"),
         nullable=False
     )
+    # Partitioned tables cannot reference book_transaction by its id alone,
+    # so there is no foreign key here. Deleting a transaction still deletes
+    # its borrows through the book_transaction_delete_borrows trigger.
     book_transaction_id = Column(
         Integer,
-        ForeignKey("book_transaction.book_transaction_id", ondelete="CASCADE"),
-        nullable=False
+        nullable=False,
+        index=True
     )
     created_at = Column(TIMESTAMP(
         timezone=True),
@@ -184,7 +266,16 @@ class BookBorrow(Base):
 
     book_borrowed = relationship("Book", foreign_keys=[book_id])
     book_borrow_transaction = relationship(
-        "BookTransaction", foreign_keys=[book_transaction_id])
+        "BookTransaction",
+        primaryjoin="foreign(BookBorrow.book_transaction_id) == "
+        "BookTransaction.book_transaction_id"
+    )
+
+    # Partitioned by month on created_at, see BookTransaction. Lookups by
+    # book_transaction_id probe every partition, see app/partitions.py
+    __table_args__ = (
+        {'postgresql_partition_by': 'RANGE (created_at)'},
+    )
 
 
 class Rating(Base):
@@ -195,7 +286,8 @@ class Rating(Base):
     book_id = Column(
         Integer,
         ForeignKey("book.book_id", ondelete="CASCADE"),
-        nullable=False
+        nullable=False,
+        index=True
     )
 
     point = Column(Integer, nullable=False)
@@ -221,6 +313,15 @@ class Rating(Base):
     rater = relationship("UserProfile", foreign_keys=[given_by])
     book = relationship("Book", foreign_keys=[book_id])
 
+    # A user has at most one rating per book, /rating/create upserts on it
+    __table_args__ = (
+        UniqueConstraint(
+            book_id,
+            given_by,
+            name='uq_rating_book_id_given_by'
+        ),
+    )
+
 
 class Review(Base):
     __tablename__ = "review"
@@ -230,7 +331,8 @@ class Review(Base):
     book_id = Column(
         Integer,
         ForeignKey("book.book_id", ondelete="CASCADE"),
-        nullable=False
+        nullable=False,
+        index=True
     )
 
     description = Column(String, nullable=False)
@@ -255,3 +357,148 @@ class Review(Base):
 
     reviewer = relationship("UserProfile", foreign_keys=[given_by])
     book = relationship("Book", foreign_keys=[book_id])
+
+    # Used by the review feeds, which page on (given_at, review_id)
+    __table_args__ = (
+        Index(
+            'ix_review_given_at_review_id',
+            given_at.desc(),
+            review_id.desc()
+        ),
+        Index(
+            'ix_review_book_id_given_at_review_id',
+            book_id,
+            given_at.desc(),
+            review_id.desc()
+        ),
+    )
+
+
+# Closed loans moved out of the hot tables by app/archive.py.
+# These only ever get inserted into and read by the history endpoint.
+class BookTransactionArchive(Base):
+    __tablename__ = "book_transaction_archive"
+
+    book_transaction_id = Column(
+        Integer,
+        primary_key=True,
+        autoincrement=False
+    )
+    borrowed_by = Column(Integer, nullable=False, index=True)
+    issued_date = Column(TIMESTAMP(timezone=True), nullable=False)
+    due_date = Column(TIMESTAMP(timezone=True))
+    book_fine = Column(Float, nullable=True)
+    remarks = Column(String, nullable=True)
+    status_id = Column(Integer, nullable=False)
+    created_at = Column(TIMESTAMP(timezone=True), nullable=False)
+    updated_at = Column(TIMESTAMP(timezone=True), nullable=False)
+    archived_at = Column(
+        TIMESTAMP(timezone=True),
+        nullable=False,
+        server_default=text('now()')
+    )
+
+
+class BookBorrowArchive(Base):
+    __tablename__ = "book_borrow_archive"
+
+    book_borrow_id = Column(Integer, primary_key=True, autoincrement=False)
+    book_id = Column(Integer, nullable=False)
+    book_transaction_id = Column(Integer, nullable=False, index=True)
+    created_at = Column(TIMESTAMP(timezone=True), nullable=False)
+
+
+# Running totals of the ratings of a book, kept in sync by
+# app/rating_summary.py so the average never needs a scan of rating.
+class BookRatingSummary(Base):
+    __tablename__ = "book_rating_summary"
+
+    book_id = Column(
+        Integer,
+        ForeignKey("book.book_id", ondelete="CASCADE"),
+        primary_key=True,
+        autoincrement=False
+    )
+    rating_count = Column(Integer, nullable=False, server_default=text('0'))
+    rating_sum = Column(Integer, nullable=False, server_default=text('0'))
+    points_1 = Column(Integer, nullable=False, server_default=text('0'))
+    points_2 = Column(Integer, nullable=False, server_default=text('0'))
+    points_3 = Column(Integer, nullable=False, server_default=text('0'))
+    points_4 = Column(Integer, nullable=False, server_default=text('0'))
+    points_5 = Column(Integer, nullable=False, server_default=text('0'))
+
+
+# Precomputed leaderboards, rebuilt on a schedule by app/leaderboard.py.
+# Only the top books of every category are kept, which always includes
+# the overall top books as well.
+class BookRanking(Base):
+    __tablename__ = "book_ranking"
+
+    board = Column(String, primary_key=True)
+    book_id = Column(
+        Integer,
+        ForeignKey("book.book_id", ondelete="CASCADE"),
+        primary_key=True
+    )
+    book_category_id = Column(Integer, nullable=False)
+    score = Column(Float, nullable=False)
+
+    book = relationship("Book", foreign_keys=[book_id])
+
+    __table_args__ = (
+        Index('ix_book_ranking_board_score', board, score.desc()),
+        Index(
+            'ix_book_ranking_board_category_score',
+            board,
+            book_category_id,
+            score.desc()
+        ),
+    )
+
+
+# Top-K most similar books of every book, precomputed from the ratings by
+# app/recommendations.py.
+class BookSimilarity(Base):
+    __tablename__ = "book_similarity"
+
+    book_id = Column(
+        Integer,
+        ForeignKey("book.book_id", ondelete="CASCADE"),
+        primary_key=True
+    )
+    similar_book_id = Column(
+        Integer,
+        ForeignKey("book.book_id", ondelete="CASCADE"),
+        primary_key=True
+    )
+    score = Column(Float, nullable=False)
+
+    similar_book = relationship("Book", foreign_keys=[similar_book_id])
+
+
+# How many transactions contained both books, stored in both directions.
+# Maintained by app/co_borrow.py.
+class BookCoBorrow(Base):
+    __tablename__ = "book_co_borrow"
+
+    book_id = Column(
+        Integer,
+        ForeignKey("book.book_id", ondelete="CASCADE"),
+        primary_key=True
+    )
+    other_book_id = Column(
+        Integer,
+        ForeignKey("book.book_id", ondelete="CASCADE"),
+        primary_key=True
+    )
+    borrow_count = Column(Integer, nullable=False)
+
+    other_book = relationship("Book", foreign_keys=[other_book_id])
+
+    __table_args__ = (
+        Index(
+            'ix_book_co_borrow_book_id_borrow_count',
+            book_id,
+            borrow_count.desc()
+        ),
+    )
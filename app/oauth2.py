@@ -1,3 +1,5 @@
+import hashlib
+import time
 from datetime import datetime, timedelta
 
 from fastapi import Depends, status, HTTPException
@@ -7,6 +9,7 @@ from jose import JWTError, jwt
 from sqlalchemy.orm import Session
 
 from . import schemas, models, database
+from .cache import token_cache, user_cache
 from .config import settings
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl='login')
@@ -19,12 +22,24 @@ SECRET_KEY = settings.secret_key
 ALGORITHM = settings.algorithm
 ACCESS_TOKEN_EXPIRE_MINUTES = settings.access_token_expire_minutes
 
+# Tokens carry the role of the user, so that role checks need no query.
+# A token is refused when its "ver" is not settings.token_version (bump it
+# to log everybody out), or when it was issued before its user was revoked
+# in this worker, see revoke_user.
+_revoked_before = {}
+
 
 def create_access_token(data: dict):
     to_encode = data.copy()
 
     expire = datetime.utcnow() + timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
-    to_encode.update({"exp": expire})
+    to_encode.update({
+        "exp": expire,
+        # Kept to the microsecond, like the revocation times it is
+        # compared with in is_revoked
+        "iat": time.time(),
+        "ver": settings.token_version
+    })
 
     encoded_jwt = jwt.encode(
         to_encode,
@@ -35,6 +50,19 @@ def create_access_token(data: dict):
 
 
 def verify_access_token(token: str, credentials_exception):
+    """
+    Verified tokens are kept in token_cache until they expire, keyed by
+    their SHA-256, so that a token sent again skips the signature check.
+    Revocation is still checked on every call.
+    """
+    key = hashlib.sha256(token.encode()).digest()
+
+    cached = token_cache.get(key)
+    if cached is not None:
+        token_data, payload = cached
+        if is_revoked(payload):
+            raise credentials_exception
+        return token_data
 
     try:
         payload = jwt.decode(
@@ -46,28 +74,124 @@ def verify_access_token(token: str, credentials_exception):
 
         if user_profile_id is None:
             raise credentials_exception
-        token_data = schemas.TokenData(user_profile_id=user_profile_id)
+        if is_revoked(payload):
+            raise credentials_exception
+        token_data = schemas.TokenData(
+            user_profile_id=user_profile_id,
+            role_id=payload.get("role_id")
+        )
 
     except JWTError:
         raise credentials_exception
 
+    # Only the claims is_revoked needs are kept besides the token data
+    expires_in = payload.get("exp", 0) - time.time()
+    if expires_in > 0:
+        token_cache.set(
+            key,
+            (token_data, {
+                claim: payload.get(claim)
+                for claim in ["user_profile_id", "iat", "ver"]
+            }),
+            ttl=expires_in
+        )
+
     return token_data
 
 
-def get_current_user(
-    token: str = Depends(oauth2_scheme),
-    db: Session = Depends(database.get_db)
-):
-    credentials_exception = HTTPException(
+def is_revoked(payload):
+    if payload.get("ver") != settings.token_version:
+        return True
+
+    revoked_before = _revoked_before.get(payload["user_profile_id"], 0)
+    return payload.get("iat", 0) < revoked_before
+
+
+def get_credentials_exception():
+    return HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail=f"Could not validate credentials",
         headers={"WWW-Authenticate": "Bearer"}
     )
 
-    token = verify_access_token(token, credentials_exception)
 
-    user = db.query(models.UserProfile).filter(
-        models.UserProfile.user_profile_id == token.user_profile_id
+def get_current_token_data(token: str = Depends(oauth2_scheme)):
+    """
+    Only verifies the token. Use it on routes that need an authenticated
+    caller but not the user's row, so that they skip the database.
+    """
+    return verify_access_token(token, get_credentials_exception())
+
+
+def require_role(*role_ids):
+    """
+    Dependency that lets only the given roles through. It authorizes from
+    the verified token alone, without loading the user.
+    """
+    def check_role(
+        token_data: schemas.TokenData = Depends(get_current_token_data)
+    ):
+        if token_data.role_id not in role_ids:
+            raise HTTPException(
+                status_code=status.HTTP_403_FORBIDDEN,
+                detail=f"Not Authorized to perform requested action!"
+            )
+        return token_data
+
+    return check_role
+
+
+require_admin = require_role(1)
+
+
+def get_current_user(
+    token: str = Depends(oauth2_scheme),
+    db: Session = Depends(database.get_db)
+):
+    """
+    Returns the caller as a schemas.UserPrincipal. The principal is cached
+    per worker, so most requests do not query user_profile at all.
+    """
+    credentials_exception = get_credentials_exception()
+
+    token = verify_access_token(token, credentials_exception)
+    user_profile_id = token.user_profile_id
+
+    user = user_cache.get(user_profile_id)
+    if user is not None:
+        return user
+
+    user = db.query(
+        models.UserProfile.user_profile_id,
+        models.UserProfile.role_id,
+        models.UserProfile.books_allowed
+    ).filter(
+        models.UserProfile.user_profile_id == user_profile_id
     ).first()
 
+    # The user was deleted after the token was issued
+    if user is None:
+        raise credentials_exception
+
+    user = schemas.UserPrincipal.from_orm(user)
+    user_cache.set(user_profile_id, user)
     return user
+
+
+def forget_user(user_profile_id):
+    """
+    Drops the cached principal of a user. Routes change users through
+    app/user_profiles.py, which calls this and revoke_user for them.
+    """
+    user_cache.delete(user_profile_id)
+
+
+def revoke_user(user_profile_id):
+    """
+    Drops the cached principal of a user and refuses the tokens issued to
+    them until now. Only this worker is affected, the others catch up when
+    their cache entries and tokens expire. Bump TOKEN_VERSION to log
+    everybody out.
+    """
+    forget_user(user_profile_id)
+    _revoked_before[user_profile_id] = time.time()
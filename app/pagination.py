@@ -0,0 +1,23 @@
+# Helpers for the paginated /all and feed routes.
+# A page is fetched with one more row than asked for: that row tells whether
+# there is a next page without running a separate COUNT, and is then
+# dropped. The cursor of the next page is built from the last row kept.
+
+
+def split_page(results, limit, cursor):
+    """
+    Trims rows fetched with a limit of `limit + 1` to one page. Returns the
+    page and the cursor of the next one, None on the last page.
+    """
+    if len(results) <= limit:
+        return results, None
+
+    results = results[:limit]
+    return results, cursor(results[-1])
+
+
+def fetch_page(query, limit, cursor):
+    """
+    Runs an ordered query for one page, see split_page
+    """
+    return split_page(query.limit(limit + 1).all(), limit, cursor)
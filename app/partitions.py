@@ -0,0 +1,89 @@
+# Creates the monthly partitions of the loan tables ahead of time.
+# Rows for a month without a partition end up in the DEFAULT partition and
+# lose partition pruning until that month gets its partition, at which point
+# create_monthly_partition() moves them over. Run this at least once a
+# month (e.g. from cron) to keep DEFAULT empty.
+#
+# book_borrow is partitioned on created_at, but it is looked up by
+# book_transaction_id (releasing copies, archiving, the co-borrow rebuild,
+# the cascade trigger). Those lookups cannot be pruned and probe the
+# book_transaction_id index of every monthly partition, so their cost grows
+# with the number of partitions. Archiving closed loans keeps the old
+# partitions small, which keeps every probe cheap.
+#
+# How to run it from the command line:
+#   python -m app.partitions
+#   python -m app.partitions --months-ahead 6
+import argparse
+import sys
+from datetime import date
+
+from sqlalchemy import text
+from sqlalchemy.exc import DBAPIError
+
+PARTITIONED_TABLES = ["book_transaction", "book_borrow"]
+
+
+def months_from(start, count):
+    year, month = start.year, start.month
+    for _ in range(count):
+        yield date(year, month, 1)
+        month += 1
+        if month > 12:
+            year, month = year + 1, 1
+
+
+def create_future_partitions(db, months_ahead=3, today=None):
+    """
+    Makes sure the current month and the next `months_ahead` months have a
+    partition. create_monthly_partition() comes from the migrations and
+    does nothing for existing partitions.
+
+    Every partition is committed on its own, so one failing month does not
+    hold back the others. Returns the months and the (table, month, error)
+    of the partitions that could not be created.
+    """
+    today = today or date.today()
+    months = list(months_from(today, months_ahead + 1))
+
+    failed = []
+    for table in PARTITIONED_TABLES:
+        for month in months:
+            try:
+                db.execute(
+                    text("SELECT create_monthly_partition(:parent, :month)"),
+                    {"parent": table, "month": month}
+                )
+                db.commit()
+            except DBAPIError as error:
+                db.rollback()
+                failed.append((table, month, str(error.orig)))
+
+    return months, failed
+
+
+def main():
+    from .database import SessionLocal
+
+    parser = argparse.ArgumentParser(
+        description="Create monthly partitions of the loan tables"
+    )
+    parser.add_argument("--months-ahead", type=int, default=3)
+    args = parser.parse_args()
+
+    db = SessionLocal()
+    try:
+        months, failed = create_future_partitions(db, args.months_ahead)
+    finally:
+        db.close()
+
+    for table, month, error in failed:
+        print(f"{table} {month}: {error}")
+    if failed:
+        sys.exit(1)
+
+    print(f"partitions ready from {months[0]} to {months[-1]}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,150 @@
+# Token buckets that throttle /login before any database or bcrypt work.
+# Every client IP and every username has a bucket of `burst` tokens that
+# refills at `per_minute` tokens a minute, and each attempt takes one token.
+#
+# The buckets live in the worker by default. Set RATE_LIMIT_REDIS_URL (needs
+# the redis package) to share them between all the gunicorn workers, any
+# Redis compatible server works, including a local one for development.
+#
+# Behind a load balancer or the platform router, set TRUSTED_PROXY_HOPS to
+# the number of proxies in front of the app, so that the client IP is taken
+# from X-Forwarded-For instead of being the address of the last proxy.
+import logging
+import threading
+import time
+from collections import OrderedDict
+
+from .config import settings
+
+logger = logging.getLogger(__name__)
+
+
+class MemoryBuckets:
+    """
+    Buckets of a single worker. Only the `maxsize` most recently used keys
+    are kept, so that made-up usernames cannot grow it without bound.
+    """
+
+    def __init__(self, maxsize=100000):
+        self.maxsize = maxsize
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+
+    def take(self, key, per_minute, burst):
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated = self._buckets.get(key, (burst, now))
+            tokens = min(burst, tokens + (now - updated) * per_minute / 60)
+
+            allowed = tokens >= 1
+            if allowed:
+                tokens -= 1
+
+            self._buckets[key] = (tokens, now)
+            self._buckets.move_to_end(key)
+            while len(self._buckets) > self.maxsize:
+                self._buckets.popitem(last=False)
+
+            return allowed
+
+
+# Same refill as MemoryBuckets.take, run atomically inside Redis
+TAKE_SCRIPT = """
+local per_second = tonumber(ARGV[1]) / 60
+local burst = tonumber(ARGV[2])
+local now = tonumber(ARGV[3])
+
+local bucket = redis.call('HMGET', KEYS[1], 'tokens', 'updated')
+local tokens = tonumber(bucket[1]) or burst
+local updated = tonumber(bucket[2]) or now
+tokens = math.min(burst, tokens + math.max(0, now - updated) * per_second)
+
+local allowed = 0
+if tokens >= 1 then
+    tokens = tokens - 1
+    allowed = 1
+end
+
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'updated', ARGV[3])
+redis.call('EXPIRE', KEYS[1], math.ceil(burst / per_second) + 1)
+return allowed
+"""
+
+
+class RedisBuckets:
+    """
+    Buckets shared by every worker through Redis. When Redis cannot be
+    reached the worker falls back to its own buckets instead of letting
+    every attempt through.
+    """
+
+    def __init__(self, url, prefix="login-bucket:"):
+        import redis
+
+        self._errors = redis.RedisError
+        self._client = redis.Redis.from_url(url, socket_timeout=0.1)
+        self._take = self._client.register_script(TAKE_SCRIPT)
+        self._fallback = MemoryBuckets()
+        self.prefix = prefix
+
+    def take(self, key, per_minute, burst):
+        try:
+            return bool(self._take(
+                keys=[self.prefix + key],
+                args=[per_minute, burst, repr(time.time())]
+            ))
+        except self._errors:
+            logger.warning("rate limit backend unavailable", exc_info=True)
+            return self._fallback.take(key, per_minute, burst)
+
+
+def client_ip(request):
+    """
+    Returns the address of the client, or None when it is not known. Each
+    trusted proxy appends the address it got the request from to
+    X-Forwarded-For, so the client is that many entries from the end, and
+    anything before that was sent by the client itself.
+    """
+    if settings.trusted_proxy_hops > 0:
+        forwarded = [
+            address.strip()
+            for address in request.headers.get("x-forwarded-for", "").split(",")
+            if address.strip()
+        ]
+        if len(forwarded) >= settings.trusted_proxy_hops:
+            return forwarded[-settings.trusted_proxy_hops]
+
+    if request.client is None:
+        return None
+    return request.client.host
+
+
+class LoginLimiter:
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+
+    def allow(self, client_ip, username):
+        """
+        Takes a token from the bucket of the client IP, then from the one of
+        the username. Returns False as soon as one of them is empty. Without
+        a client IP only the username is throttled.
+        """
+        if client_ip is not None and not self.buckets.take(
+            f"ip:{client_ip}",
+            settings.login_ip_per_minute,
+            settings.login_ip_burst
+        ):
+            return False
+
+        return self.buckets.take(
+            f"user:{username.strip().casefold()}",
+            settings.login_username_per_minute,
+            settings.login_username_burst
+        )
+
+
+login_limiter = LoginLimiter(
+    RedisBuckets(settings.rate_limit_redis_url)
+    if settings.rate_limit_redis_url else MemoryBuckets()
+)
@@ -0,0 +1,92 @@
+# Keeps BookRatingSummary in step with the rating table.
+# Every change is a single upsert with relative increments, so concurrent
+# ratings of the same book never lose an update.
+from sqlalchemy import func, literal, select
+from sqlalchemy.dialects.postgresql import insert
+
+from . import models
+
+
+def apply(db, book_id, point, direction=1):
+    """
+    Counts a rating in (direction=1) or out (direction=-1) of the summary
+    of its book.
+    """
+    table = models.BookRatingSummary
+
+    values = {
+        "rating_count": direction,
+        "rating_sum": direction * point
+    }
+    # Ratings from before points were limited to 1-5 have no bucket
+    if 1 <= point <= 5:
+        values[f"points_{point}"] = direction
+
+    statement = insert(table).values(book_id=book_id, **values)
+    statement = statement.on_conflict_do_update(
+        index_elements=[table.book_id],
+        set_={
+            column: getattr(table, column) + delta
+            for column, delta in values.items()
+        }
+    )
+    db.execute(statement)
+
+
+def as_dict(book_id, summary):
+    if summary is None:
+        return {
+            "book_id": book_id,
+            "rating_count": 0,
+            "average": None,
+            "histogram": {point: 0 for point in range(1, 6)}
+        }
+
+    return {
+        "book_id": book_id,
+        "rating_count": summary.rating_count,
+        "average": (
+            summary.rating_sum / summary.rating_count
+            if summary.rating_count else None
+        ),
+        "histogram": {
+            point: getattr(summary, f"points_{point}")
+            for point in range(1, 6)
+        }
+    }
+
+
+def recompute(db, book_id):
+    """
+    Recounts the summary of one book from the rating table. Waits for the
+    requests already holding the summary row, so that the count below sees
+    their ratings and no increment is lost.
+    """
+    table = models.BookRatingSummary
+
+    db.query(table).filter(
+        table.book_id == book_id
+    ).with_for_update().first()
+
+    values = {
+        "rating_count": func.count(),
+        "rating_sum": func.coalesce(func.sum(models.Rating.point), 0)
+    }
+    for point in range(1, 6):
+        values[f"points_{point}"] = func.count().filter(
+            models.Rating.point == point
+        )
+
+    counts = select(
+        literal(book_id),
+        *values.values()
+    ).where(models.Rating.book_id == book_id)
+
+    statement = insert(table).from_select(
+        ["book_id", *values], counts
+    )
+    statement = statement.on_conflict_do_update(
+        index_elements=[table.book_id],
+        set_={column: statement.excluded[column] for column in values}
+    )
+    db.execute(statement)
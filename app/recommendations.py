@@ -0,0 +1,183 @@
+# "Readers who liked this also liked" recommendations.
+# An offline job builds a sparse user x book matrix out of the ratings,
+# computes the cosine similarity between every pair of book columns with
+# sparse matrix products, and stores the top-K neighbours of every book in
+# book_similarity. The API only ever reads that table.
+#
+# How to run it from the command line (needs numpy and scipy):
+#   python -m app.recommendations
+#   python -m app.recommendations --top-k 30
+import argparse
+import time
+
+import numpy as np
+from scipy import sparse
+from sqlalchemy import insert, select
+
+from . import models
+from .config import settings
+
+# Books whose similarities are computed in one sparse product. Bounds the
+# memory used by the dense-ish intermediate rows of popular books.
+BLOCK_SIZE = 2000
+INSERT_CHUNK_SIZE = 10000
+FETCH_SIZE = 100000
+
+
+def load_ratings(db):
+    """
+    Returns the user ids, book ids and points of all ratings as arrays,
+    with only the latest rating of a user for a book. Every batch of rows
+    fetched goes straight into arrays of its own, which are joined at the
+    end.
+    """
+    users, books, points = [], [], []
+
+    result = db.execute(
+        select(
+            models.Rating.given_by,
+            models.Rating.book_id,
+            models.Rating.point
+        ).distinct(
+            models.Rating.given_by,
+            models.Rating.book_id
+        ).order_by(
+            models.Rating.given_by,
+            models.Rating.book_id,
+            models.Rating.updated_at.desc()
+        ).execution_options(yield_per=FETCH_SIZE)
+    )
+
+    for rows in result.partitions():
+        count = len(rows)
+        users.append(np.fromiter(
+            (row[0] for row in rows), dtype=np.int64, count=count
+        ))
+        books.append(np.fromiter(
+            (row[1] for row in rows), dtype=np.int64, count=count
+        ))
+        points.append(np.fromiter(
+            (row[2] for row in rows), dtype=np.float32, count=count
+        ))
+
+    if not users:
+        return (
+            np.empty(0, dtype=np.int64),
+            np.empty(0, dtype=np.int64),
+            np.empty(0, dtype=np.float32)
+        )
+
+    return (
+        np.concatenate(users),
+        np.concatenate(books),
+        np.concatenate(points)
+    )
+
+
+def top_k_neighbours(users, books, points, top_k):
+    """
+    Yields (book_id, similar_book_id, score) for the top_k most similar
+    books of every rated book.
+    """
+    user_ids, user_index = np.unique(users, return_inverse=True)
+    book_ids, book_index = np.unique(books, return_inverse=True)
+
+    ratings = sparse.csc_matrix(
+        (points, (user_index, book_index)),
+        shape=(len(user_ids), len(book_ids))
+    )
+
+    # Normalising every book column to unit length turns the dot products
+    # below into cosine similarities.
+    norms = np.sqrt(ratings.multiply(ratings).sum(axis=0)).A1
+    norms[norms == 0] = 1
+    ratings = (ratings @ sparse.diags(1 / norms)).tocsc()
+    ratings_t = ratings.T.tocsr()
+
+    for start in range(0, len(book_ids), BLOCK_SIZE):
+        block = (ratings_t[start:start + BLOCK_SIZE] @ ratings).tocsr()
+        block.setdiag(0, k=start)
+        block.eliminate_zeros()
+
+        for row in range(block.shape[0]):
+            begin, end = block.indptr[row], block.indptr[row + 1]
+            if begin == end:
+                continue
+
+            scores = block.data[begin:end]
+            columns = block.indices[begin:end]
+            if len(scores) > top_k:
+                best = np.argpartition(-scores, top_k)[:top_k]
+                scores, columns = scores[best], columns[best]
+
+            book_id = int(book_ids[start + row])
+            for column, score in zip(columns, scores):
+                yield book_id, int(book_ids[column]), float(score)
+
+
+def build_similarities(db, top_k=None):
+    top_k = top_k or settings.similar_books_k
+    started = time.perf_counter()
+
+    users, books, points = load_ratings(db)
+    loaded = time.perf_counter()
+
+    db.query(models.BookSimilarity).delete(synchronize_session=False)
+
+    stored = 0
+    chunk = []
+    for book_id, similar_book_id, score in top_k_neighbours(
+        users, books, points, top_k
+    ):
+        chunk.append({
+            "book_id": book_id,
+            "similar_book_id": similar_book_id,
+            "score": score
+        })
+        if len(chunk) >= INSERT_CHUNK_SIZE:
+            db.execute(insert(models.BookSimilarity), chunk)
+            stored += len(chunk)
+            chunk = []
+
+    if chunk:
+        db.execute(insert(models.BookSimilarity), chunk)
+        stored += len(chunk)
+
+    # Readers keep the previous neighbours until this commits
+    db.commit()
+
+    return {
+        "ratings": len(points),
+        "stored": stored,
+        "load_seconds": round(loaded - started, 3),
+        "total_seconds": round(time.perf_counter() - started, 3)
+    }
+
+
+def main():
+    from .database import SessionLocal
+
+    parser = argparse.ArgumentParser(
+        description="Rebuild the similar books table from the ratings"
+    )
+    parser.add_argument(
+        "--top-k", type=int, default=None,
+        help=f"defaults to SIMILAR_BOOKS_K ({settings.similar_books_k})"
+    )
+    args = parser.parse_args()
+
+    db = SessionLocal()
+    try:
+        result = build_similarities(db, args.top_k)
+    finally:
+        db.close()
+
+    print(
+        f"ratings: {result['ratings']}, neighbours stored: {result['stored']}, "
+        f"loaded in {result['load_seconds']}s, "
+        f"total {result['total_seconds']}s"
+    )
+
+
+if __name__ == "__main__":
+    main()
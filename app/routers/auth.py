@@ -1,9 +1,10 @@
-from fastapi import APIRouter,  Depends, status, HTTPException
+from fastapi import APIRouter,  Depends, status, HTTPException, Request
 from fastapi.security.oauth2 import OAuth2PasswordRequestForm
-from sqlalchemy.orm import Session
+from sqlalchemy.orm import Session, joinedload
 
 from .. import models, schemas, utils, oauth2
 from ..database import get_db
+from ..rate_limit import client_ip, login_limiter
 
 router = APIRouter(tags=['Authentication'])
 
@@ -13,10 +14,25 @@ router = APIRouter(tags=['Authentication'])
     response_model=schemas.Token
 )
 def login(
+    request: Request,
     user_credentials: OAuth2PasswordRequestForm = Depends(),
     db: Session = Depends(get_db)
 ):
-    user = db.query(models.UserLogin).filter(
+    # Throttled before touching the database or bcrypt, so that credential
+    # stuffing costs us next to nothing.
+    if not login_limiter.allow(
+        client_ip(request),
+        user_credentials.username
+    ):
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail=f"Too many login attempts, try again later!",
+            headers={"Retry-After": "60"}
+        )
+
+    user = db.query(models.UserLogin).options(
+        joinedload(models.UserLogin.user_profile)
+    ).filter(
         models.UserLogin.email_address == user_credentials.username
     ).first()
 
@@ -26,10 +42,17 @@ def login(
             detail=f"Invalid Credentials !!!"
         )
 
+    hashed_password = user.password
+    user_profile_id = user.user_profile_id
+    role_id = user.user_profile.role_id
+    # Hand the connection back to the pool before waiting on bcrypt, or a
+    # login storm ties up every pooled connection and stalls all routes.
+    db.close()
+
     # if the passwords do not match
     if not utils.verify(
         user_credentials.password,
-        user.password
+        hashed_password
     ):
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
@@ -39,7 +62,8 @@ def login(
     # Create a Token & return it
     access_token = oauth2.create_access_token(
         data={
-            "user_profile_id": user.user_profile_id
+            "user_profile_id": user_profile_id,
+            "role_id": role_id
         }
     )
     return {
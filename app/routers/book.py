@@ -1,10 +1,19 @@
+import codecs
 from datetime import datetime
-from fastapi import status, HTTPException, Response, Depends, APIRouter
-from typing import List
-from sqlalchemy.orm import Session
+from fastapi import (
+    status, HTTPException, Request, Response, Depends, APIRouter, Query,
+    UploadFile, File
+)
+from typing import List, Optional
+from sqlalchemy import func
+from sqlalchemy.orm import Session, joinedload
 
 from ..database import get_db
-from .. import models, schemas, oauth2
+from .. import models, schemas, oauth2, bulk_import, leaderboard
+from ..autocomplete import book_index
+from ..cache import book_cache
+from ..etag import make_etag, is_not_modified, not_modified
+from ..pagination import fetch_page
 
 # Using hyphen by following this answer
 # https://stackoverflow.com/a/18449772
@@ -16,15 +25,97 @@ router = APIRouter(
 
 @router.get(
     '/all',
-    response_model=List[schemas.BookSimple],
+    response_model=schemas.BookPage,
 )
 # @router.get('/')
 def get_books(
+    request: Request,
+    response: Response,
+    limit: int = Query(50, ge=1, le=200),
+    after: Optional[int] = None,
     db: Session = Depends(get_db),
     current_user: int = Depends(oauth2.get_current_user)
 ):
-    results = db.query(models.Book).all()
-    return results
+    """
+    Keyset pagination on book_id. Pass the `next_cursor` of a page as
+    `after` to get the next one. The category is joined in the same query.
+    """
+    book_query = db.query(
+        models.Book
+    ).options(
+        joinedload(models.Book.book_category)
+    )
+
+    if after is not None:
+        book_query = book_query.filter(models.Book.book_id > after)
+
+    results, next_cursor = fetch_page(
+        book_query.order_by(models.Book.book_id),
+        limit,
+        lambda book: book.book_id
+    )
+
+    etag = make_etag(limit, after, next_cursor, [
+        (book.book_id, book.updated_at, book.book_category.updated_at)
+        for book in results
+    ])
+    if is_not_modified(request, etag):
+        return not_modified(etag)
+
+    response.headers["ETag"] = etag
+    return {"books": results, "next_cursor": next_cursor}
+
+
+@router.get(
+    '/search',
+    response_model=schemas.BookSearchPage,
+)
+def search_books(
+    q: str = Query(..., min_length=1),
+    limit: int = Query(20, ge=1, le=100),
+    offset: int = Query(0, ge=0),
+    db: Session = Depends(get_db),
+    current_user: int = Depends(oauth2.get_current_user)
+):
+    """
+    Ranked full-text search over the book name, author and description.
+    Served from the GIN index on book.search_vector.
+    """
+    ts_query = func.websearch_to_tsquery('english', q)
+    rank = func.ts_rank_cd(models.Book.search_vector, ts_query)
+
+    search_query = db.query(
+        models.Book
+    ).options(
+        joinedload(models.Book.book_category)
+    ).filter(
+        models.Book.search_vector.op('@@')(ts_query)
+    ).order_by(
+        rank.desc(),
+        models.Book.book_id
+    ).offset(offset)
+
+    results, next_offset = fetch_page(
+        search_query, limit, lambda book: offset + limit
+    )
+
+    return {"books": results, "next_offset": next_offset}
+
+
+@router.get(
+    '/autocomplete',
+    response_model=List[schemas.BookShort],
+)
+def autocomplete_books(
+    prefix: str = Query(..., min_length=1),
+    limit: int = Query(10, ge=1, le=50),
+    token_data: schemas.TokenData = Depends(oauth2.get_current_token_data)
+):
+    """
+    Matches the start of a book name or an ISBN. Served from this worker's
+    in-memory index, the database is never queried here.
+    """
+    return book_index.search(prefix, limit)
 
 
 @router.post(
@@ -35,17 +126,10 @@ def get_books(
 def create_book(
     book: schemas.BookCreate,
     db: Session = Depends(get_db),
-    current_user: int = Depends(oauth2.get_current_user)
+    token_data: schemas.TokenData = Depends(oauth2.require_admin)
 ):
 
-    # Allowing only the admins to proceed
-    if current_user.role_id != 1 or current_user is None:
-        raise HTTPException(
-            status_code=status.HTTP_403_FORBIDDEN,
-            detail=f"Not Authorized to perform requested action!"
-        )
-
-    new_book = models.Book(**book.dict())
+    new_book = models.Book(**book.dict(), available_count=book.book_count)
     # ** unpacks the dictionary into this format:
     # title=post.title, content=post.content, ...
     # This prevents us from specifiying individual fields
@@ -54,17 +138,146 @@ def create_book(
     db.commit()
     db.refresh(new_book)
 
+    book_index.add(new_book)
+
     return new_book
 
 
+@router.get(
+    '/availability',
+    response_model=List[schemas.BookAvailability],
+)
+def get_books_availability(
+    ids: List[int] = Query(..., max_items=200),
+    db: Session = Depends(get_db),
+    token_data: schemas.TokenData = Depends(oauth2.get_current_token_data)
+):
+    """
+    How many copies of each book are on the shelf, e.g. ?ids=1&ids=2
+    """
+    results = db.query(
+        models.Book.book_id,
+        models.Book.book_count,
+        models.Book.available_count
+    ).filter(
+        models.Book.book_id.in_(ids)
+    ).all()
+    return results
+
+
+@router.get(
+    '/leaderboard',
+    response_model=List[schemas.LeaderboardEntry],
+)
+def get_leaderboard(
+    by: str = Query('rating', regex='^(rating|borrows)$'),
+    category: Optional[int] = None,
+    limit: int = Query(10, ge=1, le=100),
+    db: Session = Depends(get_db),
+    token_data: schemas.TokenData = Depends(oauth2.get_current_token_data)
+):
+    """
+    Top rated (Bayesian average) or most borrowed books, optionally within
+    one category. Rankings are precomputed, see app/leaderboard.py.
+    """
+    return leaderboard.get_leaderboard(db, by, category, limit)
+
+
+@router.get(
+    '/{id}/similar',
+    response_model=List[schemas.SimilarBook],
+)
+def get_similar_books(
+    id: int,
+    limit: int = Query(10, ge=1, le=50),
+    db: Session = Depends(get_db),
+    token_data: schemas.TokenData = Depends(oauth2.get_current_token_data)
+):
+    """
+    Readers who liked this book also liked these. Read straight from the
+    neighbours precomputed by app/recommendations.py.
+    """
+    results = db.query(
+        models.BookSimilarity.similar_book_id.label("book_id"),
+        models.Book.book_name,
+        models.Book.book_author,
+        models.BookSimilarity.score
+    ).join(
+        models.BookSimilarity.similar_book
+    ).filter(
+        models.BookSimilarity.book_id == id
+    ).order_by(
+        models.BookSimilarity.score.desc()
+    ).limit(limit).all()
+    return results
+
+
+@router.get(
+    '/{id}/co-borrowed',
+    response_model=List[schemas.CoBorrowedBook],
+)
+def get_co_borrowed_books(
+    id: int,
+    limit: int = Query(10, ge=1, le=50),
+    db: Session = Depends(get_db),
+    token_data: schemas.TokenData = Depends(oauth2.get_current_token_data)
+):
+    """
+    Books most often borrowed in the same transaction as this one
+    """
+    results = db.query(
+        models.BookCoBorrow.other_book_id.label("book_id"),
+        models.Book.book_name,
+        models.Book.book_author,
+        models.BookCoBorrow.borrow_count
+    ).join(
+        models.BookCoBorrow.other_book
+    ).filter(
+        models.BookCoBorrow.book_id == id
+    ).order_by(
+        models.BookCoBorrow.borrow_count.desc()
+    ).limit(limit).all()
+    return results
+
+
+@router.post(
+    '/import',
+    response_model=schemas.BookImportResult,
+)
+def import_books(
+    file: UploadFile = File(...),
+    file_format: Optional[str] = Query(None, regex='^(csv|jsonl)$'),
+    chunk_size: int = Query(bulk_import.DEFAULT_CHUNK_SIZE, ge=1, le=50000),
+    db: Session = Depends(get_db),
+    token_data: schemas.TokenData = Depends(oauth2.require_admin)
+):
+    """
+    Streams a CSV or JSONL file of books into the catalog in chunks.
+    Rows that fail are reported back, the rest of the file is still imported.
+    """
+    if file_format is None:
+        file_format = "csv" if (
+            file.filename or ""
+        ).lower().endswith(".csv") else "jsonl"
+
+    text_file = codecs.getreader("utf-8-sig")(file.file)
+
+    return bulk_import.import_books(
+        db,
+        bulk_import.read_rows(text_file, file_format),
+        chunk_size
+    )
+
+
 @router.get(
     '/info/{id}',
     response_model=schemas.BookComplete
 )
 def get_book(
     id: int,
+    request: Request,
     db: Session = Depends(get_db),
-    current_user: int = Depends(oauth2.get_current_user)
+    token_data: schemas.TokenData = Depends(oauth2.get_current_token_data)
 ):
     """ 
     {id} is a path parameter
@@ -79,17 +292,63 @@ def get_book(
     # error later. Don't know the reason for the error yet.
     # post = cursor.fetchone()
 
-    book = db.query(models.Book).filter(
-        models.Book.book_id == id
-    ).first()
+    # The cache holds the ETag and the already serialized response body,
+    # so a hit skips both the database and pydantic.
+    cached = book_cache.get(id)
 
-    if not book:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail=f"Book with id: {id} not found!"
+    if cached is None and request.headers.get("if-none-match"):
+        versions = db.query(
+            models.Book.updated_at,
+            models.BookCategory.updated_at
+        ).join(
+            models.Book.book_category
+        ).filter(
+            models.Book.book_id == id
+        ).first()
+
+        if versions is not None:
+            etag = make_etag(id, *versions)
+            if is_not_modified(request, etag):
+                return not_modified(etag)
+
+    if cached is None:
+        book = db.query(models.Book).options(
+            joinedload(models.Book.book_category)
+        ).filter(
+            models.Book.book_id == id
+        ).first()
+
+        if not book:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail=f"Book with id: {id} not found!"
+            )
+
+        cached = (
+            make_etag(id, book.updated_at, book.book_category.updated_at),
+            schemas.BookComplete.from_orm(book).json()
         )
+        book_cache.set(id, cached)
 
-    return book
+    etag, payload = cached
+    if is_not_modified(request, etag):
+        return not_modified(etag)
+
+    return Response(
+        content=payload,
+        media_type="application/json",
+        headers={"ETag": etag}
+    )
+
+
+@router.get(
+    '/cache-stats',
+    response_model=schemas.CacheStats
+)
+def get_book_cache_stats(
+    token_data: schemas.TokenData = Depends(oauth2.require_admin)
+):
+    return book_cache.stats()
 
 
 @router.delete(
@@ -99,15 +358,9 @@ def get_book(
 def delete_book(
     id: int,
     db: Session = Depends(get_db),
-    current_user: int = Depends(oauth2.get_current_user)
+    token_data: schemas.TokenData = Depends(oauth2.require_admin)
 ):
 
-    if current_user.role_id != 1 or current_user is None:
-        raise HTTPException(
-            status_code=status.HTTP_403_FORBIDDEN,
-            detail=f"Not Authorized to perform requested action!"
-        )
-
     book_query = db.query(
         models.Book
     ).filter(
@@ -124,6 +377,9 @@ def delete_book(
     book_query.delete(synchronize_session=False)
     db.commit()
 
+    book_index.remove(id)
+    book_cache.delete(id)
+
     return Response(status_code=status.HTTP_204_NO_CONTENT)
 
 
@@ -136,22 +392,18 @@ def update_book(
     id: int,
     updated_book: schemas.BookCreate,
     db: Session = Depends(get_db),
-    current_user: int = Depends(oauth2.get_current_user)
+    token_data: schemas.TokenData = Depends(oauth2.require_admin)
 ):
 
-    if current_user.role_id != 1 or current_user is None:
-        raise HTTPException(
-            status_code=status.HTTP_403_FORBIDDEN,
-            detail=f"Not Authorized to perform requested action!"
-        )
-
     book_query = db.query(
         models.Book
     ).filter(
         models.Book.book_id == id
     )
 
-    book = book_query.first()
+    # Locked like at checkout, so the copies on loan cannot change while
+    # the new stock is worked out.
+    book = book_query.with_for_update().first()
 
     if book is None:
         raise HTTPException(
@@ -159,8 +411,20 @@ def update_book(
             detail=f"Book with id: {id} does not exist!"
         )
 
+    # Copies that are out stay out, only the shelf gains or loses the
+    # difference in stock.
+    on_loan = book.book_count - book.available_count
+    if updated_book.book_count < on_loan:
+        db.rollback()
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail=f"{on_loan} copies of the book with id: {id} are on loan!"
+        )
+
     # print(status_code.__dict__)
     updated_book = updated_book.dict()
+    updated_book["updated_at"] = datetime.now().astimezone()
+    updated_book["available_count"] = updated_book["book_count"] - on_loan
 
     # print(updated_init_type)
     book_query.update(
@@ -169,5 +433,9 @@ def update_book(
     )
     db.commit()
 
+    book = book_query.first()
+    book_index.add(book)
+    book_cache.delete(id)
+
     # Sending the updated empl_type back to the user
-    return book_query.first()
+    return book
@@ -1,10 +1,13 @@
 from datetime import datetime
-from fastapi import status, HTTPException, Response, Depends, APIRouter
+from fastapi import status, HTTPException, Request, Response, Depends, APIRouter
 from typing import List
 from sqlalchemy.orm import Session
 
 from ..database import get_db
 from .. import models, schemas, oauth2
+from ..autocomplete import book_index
+from ..cache import book_cache
+from ..etag import make_etag, is_not_modified, not_modified
 
 # Using hyphen by following this answer
 # https://stackoverflow.com/a/18449772
@@ -20,17 +23,23 @@ router = APIRouter(
 )
 # @router.get('/')
 def get_book_categorys(
+    request: Request,
+    response: Response,
     db: Session = Depends(get_db),
-    current_user: int = Depends(oauth2.get_current_user)
+    token_data: schemas.TokenData = Depends(oauth2.require_admin)
 ):
-    # Allowing only the admins to proceed
-    if current_user.role_id != 1 or current_user is None:
-        raise HTTPException(
-            status_code=status.HTTP_403_FORBIDDEN,
-            detail=f"Not Authorized to perform requested action!"
-        )
-
-    results = db.query(models.BookCategory).all()
+    results = db.query(models.BookCategory).order_by(
+        models.BookCategory.book_category_id
+    ).all()
+
+    etag = make_etag([
+        (book_category.book_category_id, book_category.updated_at)
+        for book_category in results
+    ])
+    if is_not_modified(request, etag):
+        return not_modified(etag)
+
+    response.headers["ETag"] = etag
     return results
 
 
@@ -42,16 +51,9 @@ def get_book_categorys(
 def create_book_category(
     book_category: schemas.BookCategoryCreate,
     db: Session = Depends(get_db),
-    current_user: int = Depends(oauth2.get_current_user)
+    token_data: schemas.TokenData = Depends(oauth2.require_admin)
 ):
 
-    # Allowing only the admins to proceed
-    if current_user.role_id != 1 or current_user is None:
-        raise HTTPException(
-            status_code=status.HTTP_403_FORBIDDEN,
-            detail=f"Not Authorized to perform requested action!"
-        )
-
     new_book_category = models.BookCategory(**book_category.dict())
     # ** unpacks the dictionary into this format:
     # title=post.title, content=post.content, ...
@@ -70,8 +72,10 @@ def create_book_category(
 )
 def get_book_category(
     id: int,
+    request: Request,
+    response: Response,
     db: Session = Depends(get_db),
-    current_user: int = Depends(oauth2.get_current_user)
+    token_data: schemas.TokenData = Depends(oauth2.require_admin)
 ):
     """ 
     {id} is a path parameter
@@ -86,22 +90,25 @@ def get_book_category(
     # error later. Don't know the reason for the error yet.
     # post = cursor.fetchone()
 
-    if current_user.role_id != 1 or current_user is None:
-        raise HTTPException(
-            status_code=status.HTTP_403_FORBIDDEN,
-            detail=f"Not Authorized to perform requested action!"
-        )
-
-    book_category = db.query(models.BookCategory).filter(
+    updated_at = db.query(models.BookCategory.updated_at).filter(
         models.BookCategory.book_category_id == id
-    ).first()
+    ).scalar()
 
-    if not book_category:
+    if updated_at is None:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail=f"Book Category with id: {id} not found!"
         )
 
+    etag = make_etag(id, updated_at)
+    if is_not_modified(request, etag):
+        return not_modified(etag)
+
+    book_category = db.query(models.BookCategory).filter(
+        models.BookCategory.book_category_id == id
+    ).first()
+
+    response.headers["ETag"] = etag
     return book_category
 
 
@@ -112,15 +119,9 @@ def get_book_category(
 def delete_book_category(
     id: int,
     db: Session = Depends(get_db),
-    current_user: int = Depends(oauth2.get_current_user)
+    token_data: schemas.TokenData = Depends(oauth2.require_admin)
 ):
 
-    if current_user.role_id != 1 or current_user is None:
-        raise HTTPException(
-            status_code=status.HTTP_403_FORBIDDEN,
-            detail=f"Not Authorized to perform requested action!"
-        )
-
     book_category_query = db.query(
         models.BookCategory
     ).filter(
@@ -134,9 +135,21 @@ def delete_book_category(
             detail=f"Book Category with id: {id} does not exist!"
         )
 
+    # The books of this category are deleted along with it
+    book_ids = [
+        book.book_id for book in db.query(
+            models.Book.book_id
+        ).filter(
+            models.Book.book_category_id == id
+        ).all()
+    ]
+
     book_category_query.delete(synchronize_session=False)
     db.commit()
 
+    book_index.remove_many(book_ids)
+    book_cache.clear()
+
     return Response(status_code=status.HTTP_204_NO_CONTENT)
 
 
@@ -149,15 +162,9 @@ def update_book_category(
     id: int,
     updated_book_category: schemas.BookCategoryCreate,
     db: Session = Depends(get_db),
-    current_user: int = Depends(oauth2.get_current_user)
+    token_data: schemas.TokenData = Depends(oauth2.require_admin)
 ):
 
-    if current_user.role_id != 1 or current_user is None:
-        raise HTTPException(
-            status_code=status.HTTP_403_FORBIDDEN,
-            detail=f"Not Authorized to perform requested action!"
-        )
-
     book_category_query = db.query(
         models.BookCategory
     ).filter(
@@ -174,6 +181,7 @@ def update_book_category(
 
     # print(book_category.__dict__)
     updated_init_type = updated_book_category.dict()
+    updated_init_type["updated_at"] = datetime.now().astimezone()
 
     # print(updated_init_type)
     book_category_query.update(
@@ -182,5 +190,9 @@ def update_book_category(
     )
     db.commit()
 
+    # Cached books embed their category. Category changes are rare, so
+    # dropping every cached book is cheaper than tracking who uses what.
+    book_cache.clear()
+
     # Sending the updated book category back to the user
     return book_category_query.first()
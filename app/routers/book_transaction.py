@@ -1,10 +1,15 @@
 from datetime import datetime
-from fastapi import status, HTTPException, Response, Depends, APIRouter
-from typing import List
-from sqlalchemy.orm import Session
+from fastapi import (
+    status, HTTPException, Request, Response, Depends, APIRouter, Query
+)
+from typing import Optional
+from sqlalchemy import func, insert, literal, select, union_all
+from sqlalchemy.orm import Session, joinedload
 
 from ..database import get_db
-from .. import models, schemas, oauth2
+from .. import models, schemas, oauth2, inventory, fines, co_borrow
+from ..etag import make_etag, is_not_modified, not_modified
+from ..pagination import fetch_page, split_page
 
 # Using hyphen by following this answer
 # https://stackoverflow.com/a/18449772
@@ -16,15 +21,137 @@ router = APIRouter(
 
 @router.get(
     '/all',
-    response_model=List[schemas.BookTransaction],
+    response_model=schemas.BookTransactionPage,
 )
 # @router.get('/')
 def get_books(
+    request: Request,
+    response: Response,
+    limit: int = Query(50, ge=1, le=200),
+    after: Optional[int] = None,
+    status_id: Optional[int] = None,
+    borrowed_by: Optional[int] = None,
+    issued_from: Optional[datetime] = None,
+    issued_to: Optional[datetime] = None,
+    overdue: bool = False,
     db: Session = Depends(get_db),
     current_user: int = Depends(oauth2.get_current_user)
 ):
-    results = db.query(models.BookTransaction).all()
-    return results
+    """
+    Keyset pagination on book_transaction_id. Pass the `next_cursor` of a
+    page as `after` to get the next one. The borrower and the status are
+    joined in the same query.
+    """
+    trn_query = db.query(models.BookTransaction).options(
+        joinedload(models.BookTransaction.borrower),
+        joinedload(models.BookTransaction.status)
+    )
+
+    if after is not None:
+        trn_query = trn_query.filter(
+            models.BookTransaction.book_transaction_id > after
+        )
+    if status_id is not None:
+        trn_query = trn_query.filter(
+            models.BookTransaction.status_id == status_id
+        )
+    if borrowed_by is not None:
+        trn_query = trn_query.filter(
+            models.BookTransaction.borrowed_by == borrowed_by
+        )
+    if issued_from is not None:
+        trn_query = trn_query.filter(
+            models.BookTransaction.issued_date >= issued_from
+        )
+    if issued_to is not None:
+        trn_query = trn_query.filter(
+            models.BookTransaction.issued_date < issued_to
+        )
+    if overdue:
+        trn_query = trn_query.filter(
+            models.BookTransaction.status_id == 1,
+            models.BookTransaction.due_date < func.now()
+        )
+
+    results, next_cursor = fetch_page(
+        trn_query.order_by(models.BookTransaction.book_transaction_id),
+        limit,
+        lambda trn: trn.book_transaction_id
+    )
+
+    etag = make_etag(
+        request.url.query,
+        next_cursor,
+        [
+            (trn.book_transaction_id, trn.updated_at,
+             trn.borrower.updated_at, trn.status.updated_at)
+            for trn in results
+        ]
+    )
+    if is_not_modified(request, etag):
+        return not_modified(etag)
+
+    response.headers["ETag"] = etag
+    return {"transactions": results, "next_cursor": next_cursor}
+
+
+@router.get(
+    '/history',
+    response_model=schemas.BookTransactionHistoryPage,
+)
+def get_book_transaction_history(
+    limit: int = Query(50, ge=1, le=200),
+    after: Optional[int] = None,
+    borrowed_by: Optional[int] = None,
+    db: Session = Depends(get_db),
+    token_data: schemas.TokenData = Depends(oauth2.get_current_token_data)
+):
+    """
+    Read-only loan history over both the live and the archived
+    transactions, keyset-paginated on book_transaction_id.
+    Only admins can look at somebody else's history.
+    """
+    if token_data.role_id != 1:
+        borrowed_by = token_data.user_profile_id
+
+    branches = []
+    for table, archived in [
+        (models.BookTransaction, False),
+        (models.BookTransactionArchive, True)
+    ]:
+        branch = select(
+            table.book_transaction_id,
+            table.borrowed_by,
+            table.issued_date,
+            table.due_date,
+            table.book_fine,
+            table.status_id,
+            literal(archived).label("archived")
+        )
+        # Filtering inside each branch lets both tables use their indexes
+        if after is not None:
+            branch = branch.where(table.book_transaction_id > after)
+        if borrowed_by is not None:
+            branch = branch.where(table.borrowed_by == borrowed_by)
+        branches.append(
+            branch.order_by(table.book_transaction_id).limit(limit + 1)
+        )
+
+    history = union_all(
+        *[branch.subquery().select() for branch in branches]
+    ).subquery()
+
+    results = db.execute(
+        select(history).order_by(
+            history.c.book_transaction_id
+        ).limit(limit + 1)
+    ).all()
+
+    results, next_cursor = split_page(
+        results, limit, lambda trn: trn.book_transaction_id
+    )
+
+    return {"transactions": results, "next_cursor": next_cursor}
 
 
 @router.post(
@@ -35,21 +162,13 @@ def get_books(
 def initiate_book_transaction(
     book: schemas.BookTransactionCreate,
     db: Session = Depends(get_db),
-    current_user: int = Depends(oauth2.get_current_user)
+    token_data: schemas.TokenData = Depends(oauth2.require_admin)
 ):
 
-    # Allowing only the admins to proceed
-
-    if current_user.role_id != 1 or current_user is None:
-        raise HTTPException(
-            status_code=status.HTTP_403_FORBIDDEN,
-            detail=f"Not Authorized to perform requested action!"
-        )
-
     prev_transaction = db.query(
         models.BookTransaction
     ).filter(
-        models.BookTransaction.borrowed_by == current_user.user_profile_id
+        models.BookTransaction.borrowed_by == token_data.user_profile_id
     ).order_by(
         models.BookTransaction.issued_date.desc()
     ).first()
@@ -60,33 +179,88 @@ def initiate_book_transaction(
             detail=f"You have not returned books that you have borrowed. Return them to borrow new books."
         )
 
-    trn_status = db.query(models.StatusCode).filter(
-        models.StatusCode.status_id == 1
-    ).first()
-
     books = book.dict()["books"]
 
-    new_book_transaction = models.BookTransaction(
-        borrowed_by=current_user.user_profile_id
+    # Reserve the copies first. This locks the book rows, so a concurrent
+    # checkout of the same titles waits here instead of overselling them.
+    unavailable = inventory.checkout(
+        db, [trn_book["book_id"] for trn_book in books]
     )
-    db.add(new_book_transaction)
-    db.commit()
-    db.refresh(new_book_transaction)
+    if unavailable:
+        db.rollback()
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail=f"Books with id: {unavailable} are not available!"
+        )
 
-    trn_id = new_book_transaction.__dict__["book_transaction_id"]
+    # Counted before the transaction gets its id, co_borrow.rebuild relies
+    # on that order.
+    co_borrow.record_transaction(
+        db, [trn_book["book_id"] for trn_book in books]
+    )
 
-    new_books = []
-    for trn_book in books:
-        book_borrowed = models.BookBorrow(
-            book_id=trn_book["book_id"],
-            book_transaction_id=trn_id
+    # The whole checkout is a single database transaction: the transaction
+    # row and its status come back from one INSERT ... RETURNING and all the
+    # borrow rows go in with one multi-row INSERT.
+    new_transaction = insert(models.BookTransaction).values(
+        borrowed_by=token_data.user_profile_id,
+        status_id=1
+    ).returning(
+        models.BookTransaction.book_transaction_id,
+        models.BookTransaction.status_id
+    ).cte("new_transaction")
+
+    trn_id, trn_description = db.execute(
+        select(
+            new_transaction.c.book_transaction_id,
+            models.StatusCode.description
+        ).join_from(
+            new_transaction,
+            models.StatusCode,
+            models.StatusCode.status_id == new_transaction.c.status_id
         )
-        db.add(book_borrowed)
-        db.commit()
-        db.refresh(book_borrowed)
-        new_books.append(book_borrowed.__dict__)
+    ).one()
+
+    new_books = []
+    if books:
+        new_books = db.execute(
+            insert(models.BookBorrow).values([
+                {
+                    "book_id": trn_book["book_id"],
+                    "book_transaction_id": trn_id
+                }
+                for trn_book in books
+            ]).returning(
+                models.BookBorrow.book_borrow_id,
+                models.BookBorrow.book_id,
+                models.BookBorrow.book_transaction_id,
+                models.BookBorrow.created_at
+            )
+        ).mappings().all()
+
+    db.commit()
+
+    return {
+        "book_transaction_id": trn_id,
+        "books": [dict(new_book) for new_book in new_books],
+        "status": {"description": trn_description}
+    }
+
 
-    return {"book_transaction_id": trn_id, "books": new_books, "status": trn_status}
+@router.post(
+    '/compute-fines',
+    response_model=schemas.FineRunResult
+)
+def compute_fines(
+    rate_per_day: Optional[float] = Query(None, ge=0),
+    db: Session = Depends(get_db),
+    token_data: schemas.TokenData = Depends(oauth2.require_admin)
+):
+    """
+    Recomputes the fine of every overdue open transaction in one go.
+    Safe to run as often as needed.
+    """
+    return fines.compute_overdue_fines(db, rate_per_day)
 
 
 @ router.get(
@@ -97,8 +271,10 @@ def initiate_book_transaction(
 )
 def get_book_transaction_info(
     id: int,
+    request: Request,
+    response: Response,
     db: Session = Depends(get_db),
-    current_user: int = Depends(oauth2.get_current_user)
+    token_data: schemas.TokenData = Depends(oauth2.require_admin)
 ):
     """
     {id} is a path parameter
@@ -113,22 +289,38 @@ def get_book_transaction_info(
     # error later. Don't know the reason for the error yet.
     # post = cursor.fetchone()
 
-    if current_user.role_id != 1 or current_user is None:
-        raise HTTPException(
-            status_code=status.HTTP_403_FORBIDDEN,
-            detail=f"Not Authorized to perform requested action!"
-        )
-
-    book = db.query(models.BookTransaction).filter(
+    versions = db.query(
+        models.BookTransaction.updated_at,
+        models.UserProfile.updated_at,
+        models.StatusCode.updated_at
+    ).select_from(
+        models.BookTransaction
+    ).join(
+        models.BookTransaction.borrower
+    ).join(
+        models.BookTransaction.status
+    ).filter(
         models.BookTransaction.book_transaction_id == id
     ).first()
 
-    if not book:
+    if versions is None:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail=f"Book Transaction with id: {id} not found!"
         )
 
+    etag = make_etag(id, *versions)
+    if is_not_modified(request, etag):
+        return not_modified(etag)
+
+    book = db.query(models.BookTransaction).options(
+        joinedload(models.BookTransaction.borrower),
+        joinedload(models.BookTransaction.status)
+    ).filter(
+        models.BookTransaction.book_transaction_id == id
+    ).first()
+
+    response.headers["ETag"] = etag
     return book
 
 
@@ -139,21 +331,17 @@ def get_book_transaction_info(
 def delete_book(
     id: int,
     db: Session = Depends(get_db),
-    current_user: int = Depends(oauth2.get_current_user)
+    token_data: schemas.TokenData = Depends(oauth2.require_admin)
 ):
 
-    if current_user.role_id != 1 or current_user is None:
-        raise HTTPException(
-            status_code=status.HTTP_403_FORBIDDEN,
-            detail=f"Not Authorized to perform requested action!"
-        )
-
     book_transaction_query = db.query(
         models.BookTransaction
     ).filter(
         models.BookTransaction.book_transaction_id == id
     )
-    book = book_transaction_query.first()
+    # Locked, so that a concurrent close or delete waits here and then sees
+    # the new status instead of returning the same books a second time.
+    book = book_transaction_query.with_for_update().first()
 
     if book is None:
         raise HTTPException(
@@ -161,6 +349,10 @@ def delete_book(
             detail=f"Book Transaction with id: {id} does not exist!"
         )
 
+    # Books of an open transaction go back on the shelf
+    if book.status_id == 1:
+        inventory.release_transaction(db, id)
+
     book_transaction_query.delete(synchronize_session=False)
     db.commit()
 
@@ -176,22 +368,17 @@ def update_book(
     id: int,
     updated_book_transaction: schemas.BookTransactionUpdate,
     db: Session = Depends(get_db),
-    current_user: int = Depends(oauth2.get_current_user)
+    token_data: schemas.TokenData = Depends(oauth2.require_admin)
 ):
 
-    if current_user.role_id != 1 or current_user is None:
-        raise HTTPException(
-            status_code=status.HTTP_403_FORBIDDEN,
-            detail=f"Not Authorized to perform requested action!"
-        )
-
     book_transaction_query = db.query(
         models.BookTransaction
     ).filter(
         models.BookTransaction.book_transaction_id == id
     )
 
-    book = book_transaction_query.first()
+    # Locked for the same reason as in delete_book
+    book = book_transaction_query.with_for_update().first()
 
     if book is None:
         raise HTTPException(
@@ -201,6 +388,28 @@ def update_book(
 
     # print(status_code.__dict__)
     updated_book_transaction_info = updated_book_transaction.dict()
+    updated_book_transaction_info["updated_at"] = datetime.now().astimezone()
+
+    # Closing a transaction returns its books. Reopening takes them again
+    # through the same locked check as a checkout.
+    new_status_id = updated_book_transaction_info["status_id"]
+    if book.status_id == 1 and new_status_id != 1:
+        inventory.release_transaction(db, id)
+    elif book.status_id != 1 and new_status_id == 1:
+        borrowed = db.query(
+            models.BookBorrow.book_id
+        ).filter(
+            models.BookBorrow.book_transaction_id == id
+        ).all()
+        unavailable = inventory.checkout(
+            db, [trn_book.book_id for trn_book in borrowed]
+        )
+        if unavailable:
+            db.rollback()
+            raise HTTPException(
+                status_code=status.HTTP_409_CONFLICT,
+                detail=f"Books with id: {unavailable} are not available!"
+            )
 
     # print(updated_init_type)
     book_transaction_query.update(
@@ -1,10 +1,16 @@
 from datetime import datetime
-from fastapi import status, HTTPException, Response, Depends, APIRouter
+from fastapi import (
+    status, HTTPException, Request, Response, Depends, APIRouter, Query
+)
 from typing import List
-from sqlalchemy.orm import Session
+from sqlalchemy import func, literal_column, select, update
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session, joinedload
 
 from ..database import get_db
-from .. import models, schemas, oauth2
+from .. import models, schemas, oauth2, rating_summary
+from ..etag import make_etag, is_not_modified, not_modified
 
 # Using hyphen by following this answer
 # https://stackoverflow.com/a/18449772
@@ -20,9 +26,26 @@ router = APIRouter(
 )
 # @router.get('/')
 def get_ratings(
+    request: Request,
+    response: Response,
     db: Session = Depends(get_db),
 ):
-    results = db.query(models.Rating).all()
+    results = db.query(models.Rating).options(
+        joinedload(models.Rating.book),
+        joinedload(models.Rating.rater)
+    ).order_by(
+        models.Rating.rating_id
+    ).all()
+
+    etag = make_etag([
+        (rating.rating_id, rating.updated_at,
+         rating.book.updated_at, rating.rater.updated_at)
+        for rating in results
+    ])
+    if is_not_modified(request, etag):
+        return not_modified(etag)
+
+    response.headers["ETag"] = etag
     return results
 
 
@@ -33,14 +56,68 @@ def get_ratings(
 # @router.get('/')
 def get_all_ratings_for_a_book(
     id: int,
+    request: Request,
+    response: Response,
     db: Session = Depends(get_db),
 ):
-    results = db.query(models.Rating).filter(
+    results = db.query(models.Rating).options(
+        joinedload(models.Rating.book),
+        joinedload(models.Rating.rater)
+    ).filter(
         models.Rating.book_id == id
+    ).order_by(
+        models.Rating.rating_id
     ).all()
+
+    etag = make_etag(id, [
+        (rating.rating_id, rating.updated_at,
+         rating.book.updated_at, rating.rater.updated_at)
+        for rating in results
+    ])
+    if is_not_modified(request, etag):
+        return not_modified(etag)
+
+    response.headers["ETag"] = etag
     return results
 
 
+@router.get(
+    '/summary',
+    response_model=List[schemas.BookRatingSummary]
+)
+def get_rating_summaries(
+    ids: List[int] = Query(..., max_items=200),
+    db: Session = Depends(get_db),
+):
+    """
+    Rating summaries of several books at once, e.g. ?ids=1&ids=2
+    """
+    summaries = {
+        summary.book_id: summary
+        for summary in db.query(models.BookRatingSummary).filter(
+            models.BookRatingSummary.book_id.in_(ids)
+        )
+    }
+    return [
+        rating_summary.as_dict(book_id, summaries.get(book_id))
+        for book_id in ids
+    ]
+
+
+@router.get(
+    '/summary/{book_id}',
+    response_model=schemas.BookRatingSummary
+)
+def get_rating_summary(
+    book_id: int,
+    db: Session = Depends(get_db),
+):
+    summary = db.query(models.BookRatingSummary).filter(
+        models.BookRatingSummary.book_id == book_id
+    ).first()
+    return rating_summary.as_dict(book_id, summary)
+
+
 @router.post(
     '/create',
     status_code=status.HTTP_201_CREATED,
@@ -48,23 +125,50 @@ def get_all_ratings_for_a_book(
 )
 def create_rating(
     rating: schemas.RatingCreate,
+    response: Response,
     db: Session = Depends(get_db),
     current_user: int = Depends(oauth2.get_current_user)
 ):
-
-    new_rating = models.Rating(
+    """
+    Creates the rating, or updates the point when the user already rated
+    this book (200 instead of 201). Both are a single upsert.
+    """
+    statement = insert(models.Rating).values(
         given_by=current_user.user_profile_id,
         **rating.dict(),
     )
-    # ** unpacks the dictionary into this format:
-    # title=post.title, content=post.content, ...
-    # This prevents us from specifiying individual fields
+    statement = statement.on_conflict_do_update(
+        constraint='uq_rating_book_id_given_by',
+        set_={
+            "point": statement.excluded.point,
+            "updated_at": func.now()
+        }
+    ).returning(
+        models.Rating.rating_id,
+        # xmax is only 0 on a freshly inserted row
+        literal_column("rating.xmax = 0").label("inserted"),
+    )
+    upserted = db.execute(statement).first()
+
+    # The point an update replaced cannot be read back reliably: a
+    # concurrent request may have changed it after this statement's
+    # snapshot. The summary of the book is counted again instead.
+    if upserted.inserted:
+        rating_summary.apply(db, rating.book_id, rating.point)
+    else:
+        rating_summary.recompute(db, rating.book_id)
 
-    db.add(new_rating)
     db.commit()
-    db.refresh(new_rating)
 
-    return new_rating
+    if not upserted.inserted:
+        response.status_code = status.HTTP_200_OK
+
+    return db.query(models.Rating).options(
+        joinedload(models.Rating.book),
+        joinedload(models.Rating.rater)
+    ).filter(
+        models.Rating.rating_id == upserted.rating_id
+    ).first()
 
 
 @router.get(
@@ -73,6 +177,8 @@ def create_rating(
 )
 def get_rating(
     id: int,
+    request: Request,
+    response: Response,
     db: Session = Depends(get_db),
 ):
     """ 
@@ -88,16 +194,38 @@ def get_rating(
     # error later. Don't know the reason for the error yet.
     # post = cursor.fetchone()
 
-    rating = db.query(models.Rating).filter(
+    versions = db.query(
+        models.Rating.updated_at,
+        models.Book.updated_at,
+        models.UserProfile.updated_at
+    ).select_from(
+        models.Rating
+    ).join(
+        models.Rating.book
+    ).join(
+        models.Rating.rater
+    ).filter(
         models.Rating.rating_id == id
     ).first()
 
-    if not rating:
+    if versions is None:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail=f"Rating with id: {id} not found!"
         )
 
+    etag = make_etag(id, *versions)
+    if is_not_modified(request, etag):
+        return not_modified(etag)
+
+    rating = db.query(models.Rating).options(
+        joinedload(models.Rating.book),
+        joinedload(models.Rating.rater)
+    ).filter(
+        models.Rating.rating_id == id
+    ).first()
+
+    response.headers["ETag"] = etag
     return rating
 
 
@@ -116,7 +244,9 @@ def delete_rating(
     ).filter(
         models.Rating.rating_id == id
     )
-    rating = rating_query.first()
+    # Locked, so that a concurrent delete waits and then finds nothing
+    # instead of taking the rating out of the summary a second time.
+    rating = rating_query.with_for_update().first()
 
     if rating is None:
         raise HTTPException(
@@ -131,6 +261,7 @@ def delete_rating(
         )
 
     rating_query.delete(synchronize_session=False)
+    rating_summary.apply(db, rating.book_id, rating.point, direction=-1)
     db.commit()
 
     return Response(status_code=status.HTTP_204_NO_CONTENT)
@@ -148,36 +279,74 @@ def update_rating(
     current_user: int = Depends(oauth2.get_current_user)
 ):
 
-    rating_query = db.query(
-        models.Rating
-    ).filter(
-        models.Rating.rating_id == id
-    )
-
-    rating = rating_query.first()
+    # print(status_code.__dict__)
+    updated_book_rating = updated_rating.dict()
+    updated_book_rating["updated_at"] = datetime.now().astimezone()
 
-    if rating is None:
+    # One statement reads the old book and point and writes the new ones.
+    # The CTE locks the row first, so the point it returns is the one this
+    # UPDATE replaces, even when a concurrent request changed it after the
+    # statement started.
+    old_rating = select(
+        models.Rating.rating_id,
+        models.Rating.book_id,
+        models.Rating.point
+    ).where(
+        models.Rating.rating_id == id
+    ).with_for_update().cte("old_rating")
+
+    try:
+        old = db.execute(
+            update(models.Rating).where(
+                models.Rating.rating_id == old_rating.c.rating_id,
+                models.Rating.given_by == current_user.user_profile_id
+            ).values(
+                updated_book_rating
+            ).returning(
+                old_rating.c.book_id,
+                old_rating.c.point
+            ).execution_options(
+                synchronize_session=False
+            )
+        ).first()
+    except IntegrityError:
+        db.rollback()
         raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail=f"Rating with id: {id} does not exist!"
+            status_code=status.HTTP_409_CONFLICT,
+            detail=f"You have already rated the book with id: "
+            f"{updated_book_rating['book_id']}!"
         )
 
-    if current_user.user_profile_id != rating.given_by:
+    if old is None:
+        # Nothing was updated, tell a missing rating from someone else's
+        given_by = db.query(
+            models.Rating.given_by
+        ).filter(
+            models.Rating.rating_id == id
+        ).scalar()
+
+        if given_by is None:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail=f"Rating with id: {id} does not exist!"
+            )
+
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
             detail=f"Not Authorized to perform requested action!"
         )
 
-    # print(status_code.__dict__)
-    updated_book_rating = updated_rating.dict()
-    updated_book_rating["updated_at"] = datetime.now().astimezone()
-
-    # print(updated_book_rating)
-    rating_query.update(
-        updated_book_rating,
-        synchronize_session=False
+    # Move the rating from its old book and point to the new ones
+    rating_summary.apply(db, old.book_id, old.point, direction=-1)
+    rating_summary.apply(
+        db, updated_book_rating["book_id"], updated_book_rating["point"]
     )
     db.commit()
 
     # Sending the updated empl_type back to the user
-    return rating_query.first()
+    return db.query(models.Rating).options(
+        joinedload(models.Rating.book),
+        joinedload(models.Rating.rater)
+    ).filter(
+        models.Rating.rating_id == id
+    ).first()
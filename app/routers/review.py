@@ -1,10 +1,16 @@
+from base64 import urlsafe_b64decode, urlsafe_b64encode
 from datetime import datetime
-from fastapi import status, HTTPException, Response, Depends, APIRouter
-from typing import List
-from sqlalchemy.orm import Session
+from fastapi import (
+    status, HTTPException, Request, Response, Depends, APIRouter, Query
+)
+from typing import Optional
+from sqlalchemy import tuple_
+from sqlalchemy.orm import Session, joinedload
 
 from ..database import get_db
 from .. import models, schemas, oauth2
+from ..etag import make_etag, is_not_modified, not_modified
+from ..pagination import fetch_page
 
 # Using hyphen by following this answer
 # https://stackoverflow.com/a/18449772
@@ -14,31 +20,146 @@ router = APIRouter(
 )
 
 
+# Fields that can be asked for with `fields=`
+REVIEW_FIELDS = set(schemas.ReviewFeedItem.__fields__)
+
+
+def parse_fields(fields):
+    selected = {name.strip() for name in fields.split(",") if name.strip()}
+    unknown = selected - REVIEW_FIELDS
+    if not selected or unknown:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Unknown fields: {', '.join(sorted(unknown))}! "
+            f"Pick from: {', '.join(sorted(REVIEW_FIELDS))}"
+        )
+    return selected
+
+
+# The cursor is the (given_at, review_id) of the last review of a page,
+# base64 encoded so that clients treat it as opaque.
+def encode_cursor(review):
+    raw = f"{review.given_at.isoformat()}|{review.review_id}"
+    return urlsafe_b64encode(raw.encode()).decode()
+
+
+def decode_cursor(cursor):
+    try:
+        given_at, review_id = urlsafe_b64decode(
+            cursor.encode()
+        ).decode().split("|")
+        return datetime.fromisoformat(given_at), int(review_id)
+    except ValueError:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Invalid cursor!"
+        )
+
+
+def get_review_page(request, response, review_query, limit, after, fields):
+    """
+    Newest reviews first, keyset-paginated on (given_at, review_id).
+    The book and the reviewer are joined in the same query, and only when
+    they were asked for, so a page is always a single query.
+    """
+    selected = REVIEW_FIELDS if fields is None else parse_fields(fields)
+
+    if "book" in selected:
+        review_query = review_query.options(joinedload(models.Review.book))
+    if "reviewer" in selected:
+        review_query = review_query.options(
+            joinedload(models.Review.reviewer)
+        )
+
+    if after is not None:
+        review_query = review_query.filter(
+            tuple_(models.Review.given_at, models.Review.review_id)
+            < decode_cursor(after)
+        )
+
+    results, next_cursor = fetch_page(
+        review_query.order_by(
+            models.Review.given_at.desc(),
+            models.Review.review_id.desc()
+        ),
+        limit,
+        encode_cursor
+    )
+
+    etag = make_etag(request.url.path, request.url.query, next_cursor, [
+        (review.review_id, review.updated_at,
+         review.book.updated_at if "book" in selected else None,
+         review.reviewer.updated_at if "reviewer" in selected else None)
+        for review in results
+    ])
+    if is_not_modified(request, etag):
+        return not_modified(etag)
+
+    if fields is not None:
+        results = [
+            {name: getattr(review, name) for name in selected}
+            for review in results
+        ]
+
+    response.headers["ETag"] = etag
+    return {"reviews": results, "next_cursor": next_cursor}
+
+
 @router.get(
     '/all',
-    response_model=List[schemas.ReviewSimple]
+    response_model=schemas.ReviewPage,
+    response_model_exclude_unset=True
 )
 # @router.get('/')
 def get_reviews(
+    request: Request,
+    response: Response,
+    limit: int = Query(50, ge=1, le=200),
+    after: Optional[str] = None,
+    fields: Optional[str] = None,
     db: Session = Depends(get_db),
 ):
-    results = db.query(models.Review).all()
-    return results
+    """
+    Pass the `next_cursor` of a page as `after` to get the next one.
+    `fields` is a comma separated subset of the review fields,
+    e.g. `fields=review_id,description,given_at`.
+    """
+    return get_review_page(
+        request,
+        response,
+        db.query(models.Review),
+        limit,
+        after,
+        fields
+    )
 
 
 @router.get(
     '/all/book/{id}',
-    response_model=List[schemas.ReviewSimple]
+    response_model=schemas.ReviewPage,
+    response_model_exclude_unset=True
 )
 # @router.get('/')
 def get_all_reviews_for_a_book(
     id: int,
+    request: Request,
+    response: Response,
+    limit: int = Query(50, ge=1, le=200),
+    after: Optional[str] = None,
+    fields: Optional[str] = None,
     db: Session = Depends(get_db),
 ):
-    results = db.query(models.Review).filter(
-        models.Review.book_id == id
-    ).all()
-    return results
+    """
+    Same paging and `fields` as /review/all, for a single book.
+    """
+    return get_review_page(
+        request,
+        response,
+        db.query(models.Review).filter(models.Review.book_id == id),
+        limit,
+        after,
+        fields
+    )
 
 
 @router.post(
@@ -73,6 +194,8 @@ def create_review(
 )
 def get_review(
     id: int,
+    request: Request,
+    response: Response,
     db: Session = Depends(get_db),
 ):
     """ 
@@ -88,16 +211,38 @@ def get_review(
     # error later. Don't know the reason for the error yet.
     # post = cursor.fetchone()
 
-    review = db.query(models.Review).filter(
+    versions = db.query(
+        models.Review.updated_at,
+        models.Book.updated_at,
+        models.UserProfile.updated_at
+    ).select_from(
+        models.Review
+    ).join(
+        models.Review.book
+    ).join(
+        models.Review.reviewer
+    ).filter(
         models.Review.review_id == id
     ).first()
 
-    if not review:
+    if versions is None:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail=f"Review with id: {id} not found!"
         )
 
+    etag = make_etag(id, *versions)
+    if is_not_modified(request, etag):
+        return not_modified(etag)
+
+    review = db.query(models.Review).options(
+        joinedload(models.Review.book),
+        joinedload(models.Review.reviewer)
+    ).filter(
+        models.Review.review_id == id
+    ).first()
+
+    response.headers["ETag"] = etag
     return review
 
 
@@ -1,9 +1,11 @@
-from fastapi import status, HTTPException, Response, Depends, APIRouter
+from datetime import datetime
+from fastapi import status, HTTPException, Request, Response, Depends, APIRouter
 from typing import List
 from sqlalchemy.orm import Session
 
 from ..database import get_db
-from .. import models, schemas, oauth2
+from .. import models, schemas, oauth2, user_profiles
+from ..etag import make_etag, is_not_modified, not_modified
 
 # Using hyphen by following this answer
 # https://stackoverflow.com/a/18449772
@@ -19,17 +21,19 @@ router = APIRouter(
 )
 # @router.get('/')
 def get_roles(
+    request: Request,
+    response: Response,
     db: Session = Depends(get_db),
-    current_user: int = Depends(oauth2.get_current_user)
+    token_data: schemas.TokenData = Depends(oauth2.require_admin)
 ):
 
-    if current_user.role_id != 1 or current_user is None:
-        raise HTTPException(
-            status_code=status.HTTP_403_FORBIDDEN,
-            detail=f"Not Authorized to perform requested action!"
-        )
+    results = db.query(models.Role).order_by(models.Role.role_id).all()
+
+    etag = make_etag([(role.role_id, role.updated_at) for role in results])
+    if is_not_modified(request, etag):
+        return not_modified(etag)
 
-    results = db.query(models.Role).all()
+    response.headers["ETag"] = etag
     return results
 
 
@@ -41,7 +45,7 @@ def get_roles(
 def create_role(
     empl_type: schemas.RoleCreate,
     db: Session = Depends(get_db),
-    current_user: int = Depends(oauth2.get_current_user)
+    token_data: schemas.TokenData = Depends(oauth2.require_admin)
 ):
 
     new_role = models.Role(**empl_type.dict())
@@ -49,12 +53,6 @@ def create_role(
     # title=post.title, content=post.content, ...
     # This prevents us from specifiying individual fields
 
-    if current_user.role_id != 1:
-        raise HTTPException(
-            status_code=status.HTTP_403_FORBIDDEN,
-            detail=f"Not Authorized to perform requested action!"
-        )
-
     db.add(new_role)
     db.commit()
     db.refresh(new_role)
@@ -68,8 +66,10 @@ def create_role(
 )
 def get_role(
     id: int,
+    request: Request,
+    response: Response,
     db: Session = Depends(get_db),
-    current_user: int = Depends(oauth2.get_current_user)
+    token_data: schemas.TokenData = Depends(oauth2.require_admin)
 ):
     """ 
     {id} is a path parameter
@@ -84,22 +84,25 @@ def get_role(
     # error later. Don't know the reason for the error yet.
     # post = cursor.fetchone()
 
-    if current_user.role_id != 1:
-        raise HTTPException(
-            status_code=status.HTTP_403_FORBIDDEN,
-            detail=f"Not Authorized to perform requested action!"
-        )
-
-    empl_type = db.query(models.Role).filter(
+    updated_at = db.query(models.Role.updated_at).filter(
         models.Role.role_id == id
-    ).first()
+    ).scalar()
 
-    if not empl_type:
+    if updated_at is None:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail=f"Role with id: {id} not found!"
         )
 
+    etag = make_etag(id, updated_at)
+    if is_not_modified(request, etag):
+        return not_modified(etag)
+
+    empl_type = db.query(models.Role).filter(
+        models.Role.role_id == id
+    ).first()
+
+    response.headers["ETag"] = etag
     return empl_type
 
 
@@ -110,15 +113,9 @@ def get_role(
 def delete_role(
     id: int,
     db: Session = Depends(get_db),
-    current_user: int = Depends(oauth2.get_current_user)
+    token_data: schemas.TokenData = Depends(oauth2.require_admin)
 ):
 
-    if current_user.role_id != 1:
-        raise HTTPException(
-            status_code=status.HTTP_403_FORBIDDEN,
-            detail=f"Not Authorized to perform requested action!"
-        )
-
     empl_type_query = db.query(models.Role).filter(
         models.Role.role_id == id)
     empl_type = empl_type_query.first()
@@ -129,6 +126,8 @@ def delete_role(
             detail=f"Role with id: {id} does not exist!"
         )
 
+    # The users of the role are deleted with it
+    user_profiles.delete(db, [models.UserProfile.role_id == id])
     empl_type_query.delete(synchronize_session=False)
     db.commit()
 
@@ -144,15 +143,9 @@ def update_role(
     id: int,
     updated_role: schemas.RoleCreate,
     db: Session = Depends(get_db),
-    current_user: int = Depends(oauth2.get_current_user)
+    token_data: schemas.TokenData = Depends(oauth2.require_admin)
 ):
 
-    if current_user.role_id != 1:
-        raise HTTPException(
-            status_code=status.HTTP_403_FORBIDDEN,
-            detail=f"Not Authorized to perform requested action!"
-        )
-
     empl_type_query = db.query(
         models.Role
     ).filter(
@@ -167,8 +160,11 @@ def update_role(
             detail=f"Role with id: {id} does not exist!"
         )
 
+    updated_role_data = updated_role.dict()
+    updated_role_data["updated_at"] = datetime.now().astimezone()
+
     empl_type_query.update(
-        updated_role.dict(),
+        updated_role_data,
         synchronize_session=False
     )
     db.commit()
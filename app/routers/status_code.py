@@ -1,10 +1,11 @@
 from datetime import datetime
-from fastapi import status, HTTPException, Response, Depends, APIRouter
+from fastapi import status, HTTPException, Request, Response, Depends, APIRouter
 from typing import List
 from sqlalchemy.orm import Session
 
 from ..database import get_db
 from .. import models, schemas, oauth2
+from ..etag import make_etag, is_not_modified, not_modified
 
 # Using hyphen by following this answer
 # https://stackoverflow.com/a/18449772
@@ -20,9 +21,22 @@ router = APIRouter(
 )
 # @router.get('/')
 def get_status_codes(
+    request: Request,
+    response: Response,
     db: Session = Depends(get_db),
 ):
-    results = db.query(models.StatusCode).all()
+    results = db.query(models.StatusCode).order_by(
+        models.StatusCode.status_id
+    ).all()
+
+    etag = make_etag([
+        (status_code.status_id, status_code.updated_at)
+        for status_code in results
+    ])
+    if is_not_modified(request, etag):
+        return not_modified(etag)
+
+    response.headers["ETag"] = etag
     return results
 
 
@@ -34,16 +48,9 @@ def get_status_codes(
 def create_status_code(
     status_code: schemas.StatusCodeCreate,
     db: Session = Depends(get_db),
-    current_user: int = Depends(oauth2.get_current_user)
+    token_data: schemas.TokenData = Depends(oauth2.require_admin)
 ):
 
-    # Allowing only the admins to proceed
-    if current_user.role_id != 1:
-        raise HTTPException(
-            status_code=status.HTTP_403_FORBIDDEN,
-            detail=f"Not Authorized to perform requested action!"
-        )
-
     new_status_code = models.StatusCode(**status_code.dict())
     # ** unpacks the dictionary into this format:
     # title=post.title, content=post.content, ...
@@ -62,8 +69,10 @@ def create_status_code(
 )
 def get_status_code(
     id: int,
+    request: Request,
+    response: Response,
     db: Session = Depends(get_db),
-    current_user: int = Depends(oauth2.get_current_user)
+    token_data: schemas.TokenData = Depends(oauth2.require_admin)
 ):
     """ 
     {id} is a path parameter
@@ -78,22 +87,25 @@ def get_status_code(
     # error later. Don't know the reason for the error yet.
     # post = cursor.fetchone()
 
-    if current_user.role_id != 1:
-        raise HTTPException(
-            status_code=status.HTTP_403_FORBIDDEN,
-            detail=f"Not Authorized to perform requested action!"
-        )
-
-    status_code = db.query(models.StatusCode).filter(
+    updated_at = db.query(models.StatusCode.updated_at).filter(
         models.StatusCode.status_id == id
-    ).first()
+    ).scalar()
 
-    if not status_code:
+    if updated_at is None:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail=f"Status Code with id: {id} not found!"
         )
 
+    etag = make_etag(id, updated_at)
+    if is_not_modified(request, etag):
+        return not_modified(etag)
+
+    status_code = db.query(models.StatusCode).filter(
+        models.StatusCode.status_id == id
+    ).first()
+
+    response.headers["ETag"] = etag
     return status_code
 
 
@@ -104,15 +116,9 @@ def get_status_code(
 def delete_status_code(
     id: int,
     db: Session = Depends(get_db),
-    current_user: int = Depends(oauth2.get_current_user)
+    token_data: schemas.TokenData = Depends(oauth2.require_admin)
 ):
 
-    if current_user.role_id != 1:
-        raise HTTPException(
-            status_code=status.HTTP_403_FORBIDDEN,
-            detail=f"Not Authorized to perform requested action!"
-        )
-
     status_code_query = db.query(
         models.StatusCode
     ).filter(
@@ -141,16 +147,10 @@ def update_status_code(
     id: int,
     updated_status_code: schemas.StatusCodeCreate,
     db: Session = Depends(get_db),
-    current_user: int = Depends(oauth2.get_current_user)
+    token_data: schemas.TokenData = Depends(oauth2.require_admin)
 ):
 
     print(updated_status_code)
-    if current_user.role_id != 1:
-        raise HTTPException(
-            status_code=status.HTTP_403_FORBIDDEN,
-            detail=f"Not Authorized to perform requested action!"
-        )
-
     status_code_query = db.query(
         models.StatusCode
     ).filter(
@@ -1,8 +1,10 @@
 from typing import List
-from fastapi import status, HTTPException, Response, Depends, APIRouter
+from fastapi import status, HTTPException, Request, Response, Depends, APIRouter
 from sqlalchemy.orm import Session
 from .. import models, schemas, utils, oauth2
+from ..cache import token_cache, user_cache
 from ..database import get_db
+from ..etag import make_etag, is_not_modified, not_modified
 
 router = APIRouter(
     prefix='/user',
@@ -16,26 +18,56 @@ router = APIRouter(
 )
 # @router.get('/')
 def get_current_user(
+    db: Session = Depends(get_db),
     current_user: int = Depends(oauth2.get_current_user)
 ):
-    return current_user
+    # current_user only holds the cached principal, not the whole profile
+    return db.query(models.UserProfile).filter(
+        models.UserProfile.user_profile_id == current_user.user_profile_id
+    ).first()
     # return current_user
 
 
+@router.get(
+    '/cache-stats',
+    response_model=schemas.CacheStats
+)
+def get_user_cache_stats(
+    token_data: schemas.TokenData = Depends(oauth2.require_admin)
+):
+    return user_cache.stats()
+
+
+@router.get(
+    '/token-cache-stats',
+    response_model=schemas.CacheStats
+)
+def get_token_cache_stats(
+    token_data: schemas.TokenData = Depends(oauth2.require_admin)
+):
+    return token_cache.stats()
+
+
 @ router.get('/all', response_model=List[schemas.UserProfileTable])
 # @router.get('/')
 def get_users(
+    request: Request,
+    response: Response,
     db: Session = Depends(get_db),
-    current_user: int = Depends(oauth2.get_current_user)
+    token_data: schemas.TokenData = Depends(oauth2.require_admin)
 ):
 
-    if current_user.role_id != 1 or current_user is None:
-        raise HTTPException(
-            status_code=status.HTTP_403_FORBIDDEN,
-            detail=f"Not Authorized to perform requested action!"
-        )
+    results = db.query(models.UserProfile).order_by(
+        models.UserProfile.user_profile_id
+    ).all()
+
+    etag = make_etag([
+        (user.user_profile_id, user.updated_at) for user in results
+    ])
+    if is_not_modified(request, etag):
+        return not_modified(etag)
 
-    results = db.query(models.UserProfile).all()
+    response.headers["ETag"] = etag
     return results
 
 
@@ -104,24 +136,32 @@ def create_user(
 )
 def get_user(
     id: int,
+    request: Request,
+    response: Response,
     db: Session = Depends(get_db),
-    current_user: int = Depends(oauth2.get_current_user)
+    token_data: schemas.TokenData = Depends(oauth2.require_admin)
 ):
 
-    if current_user.role_id != 1 or current_user is None:
+    updated_at = db.query(
+        models.UserProfile.updated_at
+    ).filter(
+        models.UserProfile.user_profile_id == id
+    ).scalar()
+    if updated_at is None:
         raise HTTPException(
-            status_code=status.HTTP_403_FORBIDDEN,
-            detail=f"Not Authorized to perform requested action!"
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"User with id: {id} does not exist!"
         )
 
+    etag = make_etag(id, updated_at)
+    if is_not_modified(request, etag):
+        return not_modified(etag)
+
     user = db.query(
         models.UserProfile
     ).filter(
         models.UserProfile.user_profile_id == id
     ).first()
-    if not user:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail=f"User with id: {id} does not exist!"
-        )
+
+    response.headers["ETag"] = etag
     return user
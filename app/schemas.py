@@ -7,9 +7,8 @@
     with the backend.
 """
 
-from ast import Dict
 from datetime import datetime
-from typing import Optional, List
+from typing import Optional, List, Dict
 from pydantic import BaseModel, EmailStr
 from pydantic.types import conint
 from sqlalchemy import Float
@@ -57,6 +56,16 @@ class UserProfileTable(BaseModel):
         orm_mode = True
 
 
+# The part of a user that authorization needs, cached per worker
+class UserPrincipal(BaseModel):
+    user_profile_id: int
+    role_id: int
+    books_allowed: int
+
+    class Config:
+        orm_mode = True
+
+
 class UserDetail(BaseModel):
     user_name: str
     phone_number: str
@@ -98,13 +107,23 @@ class UserLogin(BaseModel):
         orm_mode = True
 
 
+class CacheStats(BaseModel):
+    hits: int
+    misses: int
+    hit_rate: float
+    evictions: int
+    size: int
+    maxsize: int
+
+
 class Token(BaseModel):
     access_token: str
     token_type: str
 
 
 class TokenData(BaseModel):
-    user_profile_id: Optional[str] = None
+    user_profile_id: Optional[int] = None
+    role_id: Optional[int] = None
 
 
 # ------------------------------------------------------------------------------
@@ -158,6 +177,64 @@ class BookSimple(BaseModel):
         orm_mode = True
 
 
+class BookPage(BaseModel):
+    books: List[BookSimple]
+    next_cursor: Optional[int] = None
+
+
+class BookSearchPage(BaseModel):
+    books: List[BookSimple]
+    next_offset: Optional[int] = None
+
+
+class BookAvailability(BaseModel):
+    book_id: int
+    book_count: int
+    available_count: int
+
+    class Config:
+        orm_mode = True
+
+
+class LeaderboardEntry(BaseModel):
+    rank: int
+    book_id: int
+    book_name: str
+    book_author: str
+    score: float
+
+
+class SimilarBook(BaseModel):
+    book_id: int
+    book_name: str
+    book_author: str
+    score: float
+
+    class Config:
+        orm_mode = True
+
+
+class CoBorrowedBook(BaseModel):
+    book_id: int
+    book_name: str
+    book_author: str
+    borrow_count: int
+
+    class Config:
+        orm_mode = True
+
+
+class BookImportError(BaseModel):
+    row: int
+    detail: str
+
+
+class BookImportResult(BaseModel):
+    inserted: int
+    failed: int
+    errors: List[BookImportError]
+
+
 class BookShort(BaseModel):
     book_id: int
     book_name: str
@@ -240,6 +317,11 @@ class BookTransactionSimple(BaseModel):
         orm_mode = True
 
 
+class FineRunResult(BaseModel):
+    updated: int
+    seconds: float
+
+
 class BookTransaction(BaseModel):
     book_transaction_id: int
     issued_date: datetime
@@ -251,12 +333,35 @@ class BookTransaction(BaseModel):
         orm_mode = True
 
 
+class BookTransactionPage(BaseModel):
+    transactions: List[BookTransaction]
+    next_cursor: Optional[int] = None
+
+
+class BookTransactionHistory(BaseModel):
+    book_transaction_id: int
+    borrowed_by: int
+    issued_date: datetime
+    due_date: Optional[datetime]
+    book_fine: Optional[float]
+    status_id: int
+    archived: bool
+
+    class Config:
+        orm_mode = True
+
+
+class BookTransactionHistoryPage(BaseModel):
+    transactions: List[BookTransactionHistory]
+    next_cursor: Optional[int] = None
+
+
 # ------------------------------------------------------------------------------
 
 
 class RatingCreate(BaseModel):
     book_id: int
-    point: int
+    point: conint(ge=1, le=5)
 
     class Config:
         orm_mode = True
@@ -295,6 +400,13 @@ class RatingComplete(RatingUpdate):
         orm_mode = True
 
 
+class BookRatingSummary(BaseModel):
+    book_id: int
+    rating_count: int
+    average: Optional[float]
+    histogram: Dict[int, int]
+
+
 # -------------------------------------------------------------------------------
 
 class ReviewCreate(BaseModel):
@@ -337,4 +449,24 @@ class ReviewComplete(ReviewUpdate):
     class Config:
         orm_mode = True
 
+
+# Every field is optional because the feeds can be asked for a subset of
+# them with `fields=`.
+class ReviewFeedItem(BaseModel):
+    review_id: Optional[int]
+    book_id: Optional[int]
+    description: Optional[str]
+    given_at: Optional[datetime]
+    updated_at: Optional[datetime]
+    book: Optional[BookShort]
+    reviewer: Optional[UserSimple]
+
+    class Config:
+        orm_mode = True
+
+
+class ReviewPage(BaseModel):
+    reviews: List[ReviewFeedItem]
+    next_cursor: Optional[str] = None
+
 # -------------------------------------------------------------------------------
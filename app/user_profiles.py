@@ -0,0 +1,69 @@
+# Changes to user_profile rows. get_current_user serves the principal of a
+# user (role, books allowed) from a per-worker cache and tokens carry the
+# role, so every update or delete of user_profile rows has to go through
+# here: the cached principals of the changed users are dropped once the
+# change is committed, and their tokens too when the role changed.
+# Deleting a role deletes its users, so it goes through delete() as well.
+from datetime import datetime
+
+from sqlalchemy import delete as sql_delete, event, update as sql_update
+from sqlalchemy.orm import Session
+
+from . import models, oauth2
+
+
+def _forget_after_commit(db, user_profile_ids, revoke_tokens):
+    # Not before, or a request could cache the old row again in between
+    db.info.setdefault("changed_users", []).extend(
+        (user_profile_id, revoke_tokens)
+        for user_profile_id in user_profile_ids
+    )
+
+
+@event.listens_for(Session, "after_commit")
+def _forget_changed_users(session):
+    for user_profile_id, revoke_tokens in session.info.pop(
+        "changed_users", []
+    ):
+        if revoke_tokens:
+            oauth2.revoke_user(user_profile_id)
+        else:
+            oauth2.forget_user(user_profile_id)
+
+
+@event.listens_for(Session, "after_rollback")
+def _keep_users(session):
+    session.info.pop("changed_users", None)
+
+
+def update(db, criteria, values):
+    """
+    Updates the users matching all the criteria. Returns their ids, the
+    caller commits.
+    """
+    values = dict(values, updated_at=datetime.now().astimezone())
+    user_profile_ids = db.execute(
+        sql_update(models.UserProfile).where(*criteria).values(
+            values
+        ).returning(
+            models.UserProfile.user_profile_id
+        ).execution_options(synchronize_session=False)
+    ).scalars().all()
+
+    _forget_after_commit(db, user_profile_ids, "role_id" in values)
+    return user_profile_ids
+
+
+def delete(db, criteria):
+    """
+    Deletes the users matching all the criteria, their logins go with them.
+    Returns their ids, the caller commits.
+    """
+    user_profile_ids = db.execute(
+        sql_delete(models.UserProfile).where(*criteria).returning(
+            models.UserProfile.user_profile_id
+        ).execution_options(synchronize_session=False)
+    ).scalars().all()
+
+    _forget_after_commit(db, user_profile_ids, True)
+    return user_profile_ids
@@ -1,18 +1,102 @@
 # This file will hold a bunch of utility functions
+import os
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing import get_context
+from threading import BoundedSemaphore, Lock
+
+from fastapi import HTTPException, status
 from passlib.context import CryptContext
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+from .config import settings
+
+pwd_context = CryptContext(
+    schemes=["bcrypt"],
+    deprecated="auto",
+    bcrypt__rounds=settings.bcrypt_rounds
+)
+
+# bcrypt runs in a small pool of processes of its own, so that a burst of
+# logins cannot take every thread of the threadpool the other sync routes
+# run in. At most `password_pool_size + password_queue_limit` calls wait
+# on the pool, any call beyond that is turned away with a 503.
+# The processes come from a forkserver, not from forking this process from
+# one of its threadpool threads.
+_pool = None
+_pool_lock = Lock()
+_slots = BoundedSemaphore(
+    settings.password_pool_size + settings.password_queue_limit
+)
+
+
+def _lower_priority():
+    # When the CPUs are busy, serving requests comes before hashing
+    os.nice(10)
+
+
+def _get_pool(broken=None):
+    # Created at startup, so that every gunicorn worker gets its own. A pool
+    # breaks for good once one of its processes dies, the caller that saw
+    # it break passes it in to have it replaced.
+    global _pool
+    with _pool_lock:
+        if _pool is None or _pool is broken:
+            if broken is not None:
+                broken.shutdown(wait=False)
+            _pool = ProcessPoolExecutor(
+                max_workers=settings.password_pool_size,
+                mp_context=get_context("forkserver"),
+                initializer=_lower_priority
+            )
+        return _pool
+
+
+def start_pool():
+    _get_pool()
+
+
+def stop_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown()
+            _pool = None
+
+
+def _hash(password):
+    return pwd_context.hash(password)
+
+
+def _verify(plain_password, hashed_password):
+    return pwd_context.verify(plain_password, hashed_password)
+
+
+def _run_in_pool(function, *args):
+    if not _slots.acquire(blocking=False):
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Too many password checks in progress, try again!",
+            headers={"Retry-After": "1"}
+        )
+    try:
+        pool = _get_pool()
+        try:
+            return pool.submit(function, *args).result()
+        except BrokenProcessPool:
+            return _get_pool(broken=pool).submit(function, *args).result()
+    finally:
+        _slots.release()
 
 
 def hash(password: str):
     """
     Returns bcrypt hashed string
     """
-    return pwd_context.hash(password)
+    return _run_in_pool(_hash, password)
 
 # We could have done the below thing in the auth.py but we would have to
 # import the above stuff again. So, it is better to group related stuff.
 
 
 def verify(plain_password, hashed_password):
-    return pwd_context.verify(plain_password, hashed_password)
+    return _run_in_pool(_verify, plain_password, hashed_password)
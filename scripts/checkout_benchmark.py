@@ -0,0 +1,144 @@
+# Checkouts per second, before and after a checkout became one database
+# transaction. "before" is the route as it used to be: the transaction row
+# and then every borrow row were each added, committed and refreshed on
+# their own. "after" is initiate_book_transaction as it is now.
+# It runs against the Postgres configured by the DATABASE_* settings (.env),
+# migrated to head, and cleans up after itself like checkout_load_test.
+# Point it at a local database, never at production.
+#
+# How to run it from the repository root:
+#   python -m scripts.checkout_benchmark
+#   python -m scripts.checkout_benchmark --checkouts 5000 --books 5 --workers 8
+import argparse
+import threading
+import time
+
+from app import inventory, models, schemas
+from app.database import SessionLocal
+from app.routers.book_transaction import initiate_book_transaction
+from scripts.checkout_load_test import (
+    cleanup,
+    create_books,
+    create_users,
+    reset,
+    session_factory
+)
+
+
+def checkout_before(db, user_profile_id, book_ids):
+    """
+    The checkout before the rewrite, without the role check. The users are
+    new, so the previous loan check always passes.
+    """
+    db.query(
+        models.BookTransaction
+    ).filter(
+        models.BookTransaction.borrowed_by == user_profile_id
+    ).order_by(
+        models.BookTransaction.issued_date.desc()
+    ).first()
+
+    db.query(models.StatusCode).filter(
+        models.StatusCode.status_id == 1
+    ).first()
+
+    new_book_transaction = models.BookTransaction(borrowed_by=user_profile_id)
+    db.add(new_book_transaction)
+    db.commit()
+    db.refresh(new_book_transaction)
+
+    for book_id in book_ids:
+        book_borrowed = models.BookBorrow(
+            book_id=book_id,
+            book_transaction_id=new_book_transaction.book_transaction_id
+        )
+        db.add(book_borrowed)
+        db.commit()
+        db.refresh(book_borrowed)
+
+    inventory.checkout(db, book_ids)
+    db.commit()
+
+
+def checkout_after(db, user_profile_id, book_ids):
+    initiate_book_transaction(
+        schemas.BookTransactionCreate(
+            books=[{"book_id": book_id} for book_id in book_ids]
+        ),
+        db,
+        schemas.TokenData(user_profile_id=user_profile_id, role_id=1)
+    )
+
+
+CHECKOUTS = {"before": checkout_before, "after": checkout_after}
+
+
+def run(checkout, sessions, user_ids, book_ids, workers):
+    """
+    Every desk checks out books of its own for its share of the users, one
+    after the other, so that the desks do not wait on each other's row
+    locks. Returns the checkouts per second over all the desks.
+    """
+    errors = []
+    books = len(book_ids) // workers
+
+    def desk(number):
+        db = sessions()
+        try:
+            desk_book_ids = book_ids[number * books:(number + 1) * books]
+            for user_profile_id in user_ids[number::workers]:
+                checkout(db, user_profile_id, desk_book_ids)
+        except Exception as error:
+            errors.append(error)
+        finally:
+            db.close()
+
+    threads = [
+        threading.Thread(target=desk, args=(number,))
+        for number in range(workers)
+    ]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    if errors:
+        raise errors[0]
+    return len(user_ids) / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Measure checkouts per second before and after the "
+        "single transaction checkout"
+    )
+    parser.add_argument("--checkouts", type=int, default=2000)
+    parser.add_argument("--books", type=int, default=5)
+    parser.add_argument("--workers", type=int, default=1)
+    args = parser.parse_args()
+
+    sessions = session_factory(args.workers)
+    db = SessionLocal()
+    # A user can only have one open loan, so every checkout gets its own
+    role, user_ids = create_users(db, args.checkouts)
+    category, book_ids = create_books(
+        db, args.checkouts, args.books * args.workers
+    )
+    try:
+        for name, checkout in CHECKOUTS.items():
+            rate = run(checkout, sessions, user_ids, book_ids, args.workers)
+            print(
+                f"{name}: {rate:.0f} checkouts/s "
+                f"({args.checkouts} checkouts of {args.books} books, "
+                f"{args.workers} desks)"
+            )
+            reset(db, user_ids, book_ids, args.checkouts)
+    finally:
+        cleanup(db, role, category, user_ids)
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
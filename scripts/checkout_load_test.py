@@ -0,0 +1,238 @@
+# Concurrent checkout load test: hundreds of desks race for the last copies
+# of the same two books through the checkout route, and the shelf must never
+# be oversold.
+# It runs against the Postgres configured by the DATABASE_* settings (.env),
+# migrated to head. Every desk gets a connection of its own, so the server's
+# max_connections (100 by default) has to be above --workers. It creates its
+# own role, users, category and books and deletes them when done, so point
+# it at a local database, never at production.
+#
+# How to run it from the repository root:
+#   python -m scripts.checkout_load_test
+#   python -m scripts.checkout_load_test --copies 100 --workers 400 --rounds 10
+import argparse
+import sys
+import threading
+import time
+import uuid
+
+from fastapi import HTTPException, status
+from sqlalchemy import create_engine, func
+from sqlalchemy.orm import sessionmaker
+
+from app import models, schemas
+from app.database import SQLALCHEMY_DATABASE_URL, SessionLocal
+from app.routers.book_transaction import initiate_book_transaction
+
+
+def session_factory(workers):
+    """
+    A pool of its own with a connection per desk. The app's default pool
+    of 5 + 10 connections would let only 15 desks in at a time.
+    """
+    engine = create_engine(
+        SQLALCHEMY_DATABASE_URL,
+        pool_size=workers,
+        max_overflow=0
+    )
+    return sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+
+def create_users(db, count):
+    """
+    One borrower per desk, a user with an open loan cannot borrow again
+    """
+    role = models.Role(role_name=f"load-test-{uuid.uuid4()}")
+    db.add(role)
+    db.flush()
+
+    users = [
+        models.UserProfile(
+            user_name=f"load-test-{number}",
+            phone_number="0000000000",
+            residential_address="Created by scripts/checkout_load_test.py",
+            role_id=role.role_id
+        )
+        for number in range(count)
+    ]
+    db.add_all(users)
+    db.commit()
+
+    return role, [user.user_profile_id for user in users]
+
+
+def create_books(db, copies, count=2):
+    category = models.BookCategory(category_name=f"load-test-{uuid.uuid4()}")
+    db.add(category)
+    db.flush()
+
+    books = []
+    for _ in range(count):
+        book = models.Book(
+            isbn=f"load-test-{uuid.uuid4()}",
+            book_name="Load test",
+            book_author="Load test",
+            edition=1,
+            book_category_id=category.book_category_id,
+            book_price=1,
+            book_count=copies,
+            available_count=copies,
+            book_description="Created by scripts/checkout_load_test.py"
+        )
+        db.add(book)
+        books.append(book)
+    db.commit()
+
+    return category, [book.book_id for book in books]
+
+
+def delete_loans(db, user_ids):
+    # The borrow rows go with their transaction
+    db.query(models.BookTransaction).filter(
+        models.BookTransaction.borrowed_by.in_(user_ids)
+    ).delete(synchronize_session=False)
+
+
+def reset(db, user_ids, book_ids, copies):
+    """
+    Deletes the loans of the test users and puts every copy back
+    """
+    delete_loans(db, user_ids)
+    db.query(models.Book).filter(
+        models.Book.book_id.in_(book_ids)
+    ).update(
+        {"available_count": copies},
+        synchronize_session=False
+    )
+    db.commit()
+
+
+def cleanup(db, role, category, user_ids):
+    delete_loans(db, user_ids)
+    # The books go with their category, the users with their role
+    db.delete(category)
+    db.delete(role)
+    db.commit()
+
+
+def race(sessions, user_ids, book_ids):
+    """
+    Starts every checkout at the same moment. Half of the desks ask for the
+    books in the opposite order, which would deadlock without the ordered
+    row locks of inventory.checkout. Returns how many checkouts succeeded
+    and how long the round took.
+    """
+    workers = len(user_ids)
+    started = []
+    barrier = threading.Barrier(
+        workers, action=lambda: started.append(time.perf_counter())
+    )
+    succeeded = []
+    errors = []
+
+    requests = [
+        schemas.BookTransactionCreate(books=[
+            {"book_id": book_id}
+            for book_id in (book_ids if number % 2 else book_ids[::-1])
+        ])
+        for number in range(workers)
+    ]
+
+    def desk(number):
+        db = sessions()
+        try:
+            token_data = schemas.TokenData(
+                user_profile_id=user_ids[number],
+                role_id=1
+            )
+            # Connected before the start, so that the round times only
+            # the checkouts
+            db.connection()
+            barrier.wait()
+            try:
+                initiate_book_transaction(requests[number], db, token_data)
+                succeeded.append(number)
+            except HTTPException as error:
+                # Sold out is the expected answer for the late desks
+                if error.status_code != status.HTTP_409_CONFLICT:
+                    raise
+        except Exception as error:
+            errors.append(error)
+        finally:
+            db.close()
+
+    threads = [
+        threading.Thread(target=desk, args=(number,))
+        for number in range(workers)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started[0]
+
+    if errors:
+        raise errors[0]
+    return len(succeeded), elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Check that concurrent checkouts never oversell a book"
+    )
+    parser.add_argument("--copies", type=int, default=100)
+    parser.add_argument("--workers", type=int, default=200)
+    parser.add_argument("--rounds", type=int, default=5)
+    args = parser.parse_args()
+
+    sessions = session_factory(args.workers)
+    db = SessionLocal()
+    role, user_ids = create_users(db, args.workers)
+    category, book_ids = create_books(db, args.copies)
+    failures = 0
+    try:
+        for round_number in range(1, args.rounds + 1):
+            succeeded, elapsed = race(sessions, user_ids, book_ids)
+
+            db.expire_all()
+            counts = [
+                db.query(models.Book.available_count).filter(
+                    models.Book.book_id == book_id
+                ).scalar()
+                for book_id in book_ids
+            ]
+            borrows = db.query(
+                func.count(models.BookBorrow.book_borrow_id)
+            ).join(
+                models.BookTransaction,
+                models.BookTransaction.book_transaction_id
+                == models.BookBorrow.book_transaction_id
+            ).filter(
+                models.BookTransaction.borrowed_by.in_(user_ids)
+            ).scalar()
+            expected = max(args.copies - args.workers, 0)
+            ok = (
+                succeeded == min(args.copies, args.workers)
+                and counts == [expected, expected]
+                and borrows == succeeded * len(book_ids)
+            )
+            failures += not ok
+            print(
+                f"round {round_number}: {succeeded}/{args.workers} checkouts "
+                f"succeeded in {elapsed:.3f}s, "
+                f"{args.workers / elapsed:.0f} requests/s, "
+                f"{succeeded / elapsed:.0f} checkouts/s, "
+                f"available_count {counts}, {borrows} borrow rows, "
+                f"{'ok' if ok else 'OVERSOLD'}"
+            )
+
+            reset(db, user_ids, book_ids, args.copies)
+    finally:
+        cleanup(db, role, category, user_ids)
+        db.close()
+
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+# Per-request cost of oauth2.get_current_user with and without the cache of
+# user principals. Without it every call selects the user_profile row; the
+# token itself is verified from the token cache in both cases, so only the
+# user lookup is compared. The calls run from several threads at once, like
+# requests in the threadpool.
+# It runs against the Postgres configured by the DATABASE_* settings (.env),
+# migrated to head. It creates its own role and user and deletes them when
+# done, so point it at a local database, never at production.
+#
+# How to run it from the repository root:
+#   python -m scripts.current_user_benchmark
+#   python -m scripts.current_user_benchmark --calls 5000 --workers 16
+import argparse
+import statistics
+import threading
+import time
+import uuid
+
+from app import models, oauth2
+from app.cache import user_cache
+from app.database import SessionLocal
+from scripts.checkout_load_test import session_factory
+
+
+def create_user(db):
+    role = models.Role(role_name=f"current-user-benchmark-{uuid.uuid4()}")
+    db.add(role)
+    db.flush()
+
+    user = models.UserProfile(
+        user_name="current-user-benchmark",
+        phone_number="0000000000",
+        residential_address="Created by scripts/current_user_benchmark.py",
+        role_id=role.role_id
+    )
+    db.add(user)
+    db.commit()
+
+    return role, user.user_profile_id
+
+
+def run(sessions, token, calls, workers, cached):
+    """
+    Returns the latency of every call in microseconds
+    """
+    timings = []
+    errors = []
+
+    def worker():
+        db = sessions()
+        try:
+            for _ in range(calls):
+                if not cached:
+                    user_cache.clear()
+                started = time.perf_counter()
+                oauth2.get_current_user(token, db)
+                timings.append((time.perf_counter() - started) * 1000000)
+                # Ends the transaction like the end of a request would
+                db.rollback()
+        except Exception as error:
+            errors.append(error)
+        finally:
+            db.close()
+
+    threads = [threading.Thread(target=worker) for _ in range(workers)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    if errors:
+        raise errors[0]
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Measure get_current_user with and without its cache"
+    )
+    parser.add_argument("--calls", type=int, default=2000)
+    parser.add_argument("--workers", type=int, default=8)
+    args = parser.parse_args()
+
+    sessions = session_factory(args.workers)
+    db = SessionLocal()
+    role, user_profile_id = create_user(db)
+    token = oauth2.create_access_token(data={
+        "user_profile_id": user_profile_id,
+        "role_id": role.role_id
+    })
+    try:
+        results = {}
+        for name, cached in [("uncached", False), ("cached", True)]:
+            timings = sorted(run(
+                sessions, token, args.calls, args.workers, cached
+            ))
+            results[name] = statistics.mean(timings)
+            print(
+                f"{name}: mean {results[name]:.0f} us, "
+                f"p50 {timings[len(timings) // 2]:.0f} us, "
+                f"p95 {timings[int(len(timings) * 0.95)]:.0f} us "
+                f"({args.workers} threads x {args.calls} calls)"
+            )
+        print(
+            f"saved per request: "
+            f"{results['uncached'] - results['cached']:.0f} us"
+        )
+    finally:
+        db.delete(role)
+        db.commit()
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
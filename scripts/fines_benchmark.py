@@ -0,0 +1,166 @@
+# Timing of app.fines.compute_overdue_fines over 1M open loans. The loans
+# are issued over the last 20 days and due 5 days later, so three in four
+# of them are overdue. The first run fines all of those, the second one
+# shows that a re-run on the same day changes nothing. For comparison a
+# sample of the loans is fined the row by row way first, one ORM update
+# per loan, and its time is scaled up to the whole backlog.
+# It runs against the Postgres configured by the DATABASE_* settings (.env),
+# migrated to head. It creates its own role, users and loans and deletes
+# them when done, but the job fines every overdue loan in the database, so
+# point it at a local database, never at production.
+#
+# How to run it from the repository root:
+#   python -m scripts.fines_benchmark
+#   python -m scripts.fines_benchmark --loans 100000 --sample 0
+import argparse
+import time
+import uuid
+
+from sqlalchemy import text
+
+from app import models
+from app.config import settings
+from app.database import SessionLocal
+from app.fines import compute_overdue_fines
+
+SEED_USERS = text("""
+    INSERT INTO user_profile (
+        user_name, phone_number, residential_address, books_allowed,
+        role_id
+    )
+    SELECT
+        'fines-benchmark-' || i,
+        '0000000000',
+        'Created by scripts/fines_benchmark.py',
+        5,
+        :role_id
+    FROM generate_series(1, :count) AS i
+""")
+
+SEED_LOANS = text("""
+    INSERT INTO book_transaction (
+        borrowed_by, issued_date, due_date, status_id
+    )
+    SELECT
+        u.ids[1 + i % u.n],
+        now() - (i % 20) * interval '1 day',
+        now() - (i % 20) * interval '1 day' + interval '5 day',
+        1
+    FROM generate_series(CAST(:start AS bigint), :stop - 1) AS i,
+        (SELECT array_agg(user_profile_id) AS ids, count(*) AS n
+            FROM user_profile WHERE role_id = :role_id) AS u
+""")
+
+
+def seed(db, role, users, loans, chunk_size=100000):
+    db.execute(SEED_USERS, {"role_id": role.role_id, "count": users})
+    db.commit()
+
+    for start in range(0, loans, chunk_size):
+        db.execute(SEED_LOANS, {
+            "role_id": role.role_id,
+            "start": start,
+            "stop": min(start + chunk_size, loans)
+        })
+        db.commit()
+    db.execute(text("ANALYZE book_transaction"))
+    db.commit()
+
+
+def overdue_loans(db, role):
+    return db.query(models.BookTransaction).join(
+        models.UserProfile,
+        models.UserProfile.user_profile_id
+        == models.BookTransaction.borrowed_by
+    ).filter(
+        models.UserProfile.role_id == role.role_id,
+        models.BookTransaction.status_id == 1,
+        models.BookTransaction.due_date < text("now()")
+    )
+
+
+def fine_row_by_row(db, role, sample):
+    """
+    Fines `sample` overdue loans one ORM update at a time, the way the
+    update_book route would. Returns the seconds it took.
+    """
+    started = time.perf_counter()
+
+    loans = overdue_loans(db, role).limit(sample).all()
+    now = db.execute(text("SELECT now()")).scalar()
+    for loan in loans:
+        # Every started day past the due date counts as a full day
+        days_overdue = -(-(now - loan.due_date).total_seconds() // 86400)
+        loan.book_fine = days_overdue * settings.fine_per_day
+        db.flush()
+    db.commit()
+
+    return time.perf_counter() - started
+
+
+def clear_fines(db, role):
+    db.query(models.BookTransaction).filter(
+        models.BookTransaction.borrowed_by.in_(
+            db.query(models.UserProfile.user_profile_id).filter(
+                models.UserProfile.role_id == role.role_id
+            )
+        )
+    ).update(
+        {models.BookTransaction.book_fine: None},
+        synchronize_session=False
+    )
+    db.commit()
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Time the overdue fine job over many open loans"
+    )
+    parser.add_argument("--loans", type=int, default=1000000)
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument(
+        "--sample", type=int, default=10000,
+        help="loans fined row by row for comparison, 0 to skip"
+    )
+    args = parser.parse_args()
+
+    db = SessionLocal()
+    role = models.Role(role_name=f"fines-benchmark-{uuid.uuid4()}")
+    db.add(role)
+    db.commit()
+    try:
+        started = time.perf_counter()
+        seed(db, role, args.users, args.loans)
+        overdue = overdue_loans(db, role).count()
+        print(
+            f"seeded {args.loans} open loans, {overdue} overdue, in "
+            f"{time.perf_counter() - started:.1f}s"
+        )
+
+        if args.sample:
+            seconds = fine_row_by_row(db, role, args.sample)
+            print(
+                f"row by row: {args.sample} loans in {seconds:.1f}s, "
+                f"about {seconds / args.sample * overdue:.0f}s for all "
+                f"{overdue}"
+            )
+            clear_fines(db, role)
+
+        for name in ["first run", "re-run"]:
+            result = compute_overdue_fines(db)
+            print(
+                f"{name}: updated {result['updated']} in "
+                f"{result['seconds']}s"
+            )
+    finally:
+        db.rollback()
+        # The users and their loans go with their role
+        db.query(models.Role).filter(
+            models.Role.role_id == role.role_id
+        ).delete(synchronize_session=False)
+        db.commit()
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
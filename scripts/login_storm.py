@@ -0,0 +1,154 @@
+# Latency of a cheap route during a login storm. GET /status-code/all runs
+# in the same threadpool as /login, so it shows whether bcrypt, which runs
+# in its own process pool, still leaves room for the other routes.
+# It needs the API running against the Postgres configured by the
+# DATABASE_* settings (.env), with the login rate limits raised so that the
+# storm reaches bcrypt:
+#   LOGIN_IP_PER_MINUTE=1000000 LOGIN_IP_BURST=1000000 \
+#   LOGIN_USERNAME_PER_MINUTE=1000000 LOGIN_USERNAME_BURST=1000000 \
+#   uvicorn app.main:app
+# It creates its own users and deletes them when done, so point it at a
+# local database, never at production.
+#
+# How to run it from the repository root:
+#   python -m scripts.login_storm
+#   python -m scripts.login_storm --url http://127.0.0.1:8000 --concurrency 64
+import argparse
+import statistics
+import threading
+import time
+import uuid
+from collections import Counter
+
+import httpx
+
+from app import models, utils
+from app.database import SessionLocal
+
+PASSWORD = "login-storm"
+
+
+def create_users(db, count):
+    role = models.Role(role_name=f"login-storm-{uuid.uuid4()}")
+    db.add(role)
+    db.flush()
+
+    # Hashed once, every user gets the same password
+    hashed_password = utils.pwd_context.hash(PASSWORD)
+    emails = []
+    for number in range(count):
+        profile = models.UserProfile(
+            user_name=f"login-storm-{number}",
+            phone_number="0000000000",
+            residential_address="Created by scripts/login_storm.py",
+            role_id=role.role_id
+        )
+        db.add(profile)
+        db.flush()
+
+        email = f"login-storm-{role.role_id}-{number}@example.com"
+        db.add(models.UserLogin(
+            user_profile_id=profile.user_profile_id,
+            email_address=email,
+            password=hashed_password
+        ))
+        emails.append(email)
+    db.commit()
+
+    return role, emails
+
+
+def probe(url, seconds, interval):
+    """
+    Requests the cheap route one after the other for `seconds`. Returns the
+    latencies in milliseconds.
+    """
+    timings = []
+    with httpx.Client(base_url=url, timeout=60) as client:
+        stop = time.perf_counter() + seconds
+        while time.perf_counter() < stop:
+            started = time.perf_counter()
+            client.get("/status-code/all").raise_for_status()
+            timings.append((time.perf_counter() - started) * 1000)
+            time.sleep(interval)
+    return timings
+
+
+def storm(url, emails, concurrency, stopped, statuses):
+    def attacker(number):
+        with httpx.Client(base_url=url, timeout=60) as client:
+            while not stopped.is_set():
+                email = emails[number % len(emails)]
+                response = client.post(
+                    "/login",
+                    data={"username": email, "password": PASSWORD}
+                )
+                statuses[response.status_code] += 1
+                number += concurrency
+
+    threads = [
+        threading.Thread(target=attacker, args=(number,))
+        for number in range(concurrency)
+    ]
+    for thread in threads:
+        thread.start()
+    return threads
+
+
+def report(name, timings):
+    timings = sorted(timings)
+    percentile = statistics.quantiles(timings, n=100)
+    print(
+        f"{name}: {len(timings)} requests, "
+        f"p50 {percentile[49]:.1f} ms, p95 {percentile[94]:.1f} ms, "
+        f"p99 {percentile[98]:.1f} ms, max {timings[-1]:.1f} ms"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Time a cheap route while /login is flooded"
+    )
+    parser.add_argument("--url", default="http://127.0.0.1:8000")
+    parser.add_argument("--users", type=int, default=50)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--seconds", type=float, default=20)
+    parser.add_argument("--interval", type=float, default=0.02)
+    args = parser.parse_args()
+
+    db = SessionLocal()
+    role, emails = create_users(db, args.users)
+    try:
+        report("quiet", probe(args.url, args.seconds, args.interval))
+
+        stopped = threading.Event()
+        statuses = Counter()
+        threads = storm(args.url, emails, args.concurrency, stopped, statuses)
+        started = time.perf_counter()
+        try:
+            report(
+                "login storm",
+                probe(args.url, args.seconds, args.interval)
+            )
+        finally:
+            stopped.set()
+            for thread in threads:
+                thread.join()
+        elapsed = time.perf_counter() - started
+
+        print(
+            f"/login: {sum(statuses.values()) / elapsed:.0f} requests/s, "
+            + ", ".join(
+                f"{count} x {status_code}"
+                for status_code, count in sorted(statuses.items())
+            )
+        )
+    finally:
+        # The users and their logins go with their role
+        db.delete(role)
+        db.commit()
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
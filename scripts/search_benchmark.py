@@ -0,0 +1,151 @@
+# Book search latency on a large catalog: the ILIKE filter over the name,
+# author and description that clients had to do without /book/search,
+# against the ranked full-text search of the route, served from the GIN
+# index on book.search_vector.
+# It runs against the Postgres configured by the DATABASE_* settings (.env),
+# migrated to head. The books are generated by postgres in one category of
+# their own, which is deleted at the end unless --keep is given, so point it
+# at a local database, never at production.
+#
+# How to run it from the repository root:
+#   python -m scripts.search_benchmark
+#   python -m scripts.search_benchmark --books 100000 --repeat 50 --keep
+import argparse
+import statistics
+import time
+import uuid
+
+from sqlalchemy import or_, text
+
+from app import models
+from app.database import SessionLocal
+from app.routers.book import search_books
+
+# About 5000 made up words, so that a word is as rare as in a real catalog
+SYLLABLES = [
+    "ka", "lo", "mi", "ne", "ru", "sa", "to", "vi", "ze", "bra", "cle",
+    "dri", "fo", "gla", "hu", "jo", "ple", "qua", "sti", "tre", "wy", "xo",
+    "an", "el", "is", "or", "um", "ar", "en", "ith", "ost", "ul", "ber",
+    "cor", "dal", "fen", "gor", "hal", "ker", "lin", "mor", "nar", "pel",
+    "rin", "sel", "tor", "var", "wen", "yor", "zan", "dun", "mar", "thal",
+    "bel", "cas", "dor", "fal", "gan", "hel", "ion", "jas", "kel", "lum",
+    "nor", "pas", "ros", "sil", "tam", "ven", "wil",
+]
+WORDS = [first + second for first in SYLLABLES for second in SYLLABLES]
+
+# Every book gets a few words picked by multiplicative hashing of its
+# number, so the words are spread evenly but every run is the same.
+SEED_BOOKS = text("""
+    INSERT INTO book (
+        isbn, book_name, book_author, edition, book_category_id,
+        book_price, book_count, available_count, book_description
+    )
+    SELECT
+        :prefix || i,
+        initcap(w[1 + (i * 7919) % n] || ' ' || w[1 + (i * 104729) % n]),
+        initcap(w[1 + (i * 31) % n]) || ' ' || initcap(w[1 + (i * 17) % n]),
+        1,
+        :book_category_id,
+        10,
+        1,
+        1,
+        'A story of ' || w[1 + (i * 13) % n] || ', ' || w[1 + (i * 7) % n]
+            || ' and ' || w[1 + (i * 3) % n] || '.'
+    FROM generate_series(CAST(:start AS bigint), :stop - 1) AS i,
+        (SELECT CAST(:words AS text[]) AS w,
+            cardinality(CAST(:words AS text[])) AS n) AS vocabulary
+""")
+
+# One word, two words that have to appear together, and no match at all
+QUERIES = [WORDS[100], f"{WORDS[200]} {WORDS[300]}", "no such title"]
+
+
+def seed(db, count, chunk_size=100000):
+    category = models.BookCategory(
+        category_name=f"search-benchmark-{uuid.uuid4()}"
+    )
+    db.add(category)
+    db.commit()
+
+    prefix = f"search-benchmark-{category.book_category_id}-"
+    for start in range(0, count, chunk_size):
+        db.execute(SEED_BOOKS, {
+            "prefix": prefix,
+            "book_category_id": category.book_category_id,
+            "start": start,
+            "stop": min(start + chunk_size, count),
+            "words": WORDS
+        })
+        db.commit()
+    db.execute(text("ANALYZE book"))
+    db.commit()
+
+    return category
+
+
+def search_ilike(db, q, limit):
+    pattern = f"%{q}%"
+    return db.query(models.Book).filter(or_(
+        models.Book.book_name.ilike(pattern),
+        models.Book.book_author.ilike(pattern),
+        models.Book.book_description.ilike(pattern)
+    )).order_by(models.Book.book_id).limit(limit).all()
+
+
+def search_full_text(db, q, limit):
+    return search_books(q, limit, 0, db, None)["books"]
+
+
+SEARCHES = {"ilike": search_ilike, "full-text": search_full_text}
+
+
+def timed(search, db, q, limit, repeat):
+    """
+    Returns the median and the slowest latency in milliseconds, after one
+    run that warms the cache
+    """
+    search(db, q, limit)
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        search(db, q, limit)
+        timings.append((time.perf_counter() - started) * 1000)
+        db.expunge_all()
+    return statistics.median(timings), max(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Compare ILIKE and full-text book search latency"
+    )
+    parser.add_argument("--books", type=int, default=1000000)
+    parser.add_argument("--limit", type=int, default=20)
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--keep", action="store_true")
+    args = parser.parse_args()
+
+    db = SessionLocal()
+    started = time.perf_counter()
+    category = seed(db, args.books)
+    print(
+        f"seeded {args.books} books in {time.perf_counter() - started:.1f}s"
+    )
+    try:
+        for q in QUERIES:
+            for name, search in SEARCHES.items():
+                median, slowest = timed(
+                    search, db, q, args.limit, args.repeat
+                )
+                print(
+                    f"{q!r} {name}: median {median:.1f} ms, "
+                    f"max {slowest:.1f} ms"
+                )
+    finally:
+        if not args.keep:
+            db.delete(category)
+            db.commit()
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,198 @@
+# Build time and peak memory of app.recommendations.build_similarities on a
+# synthetic catalog of 10M ratings. Every user rates the same number of
+# books, spread over the catalog by multiplicative hashing, with points from
+# 1 to 5, so every run is the same.
+# It runs against the Postgres configured by the DATABASE_* settings (.env),
+# migrated to head. It creates its own role, users, category, books and
+# ratings and deletes them when done. build_similarities rebuilds the whole
+# book_similarity table, so point it at a local database, never at
+# production, and run python -m app.recommendations afterwards to rebuild
+# the table from the real ratings.
+#
+# How to run it from the repository root:
+#   python -m scripts.similarity_benchmark
+#   python -m scripts.similarity_benchmark --users 50000 --books 10000
+import argparse
+import resource
+import time
+import uuid
+
+from sqlalchemy import text
+
+from app import models
+from app.database import SessionLocal
+from app.recommendations import build_similarities
+
+SEED_USERS = text("""
+    INSERT INTO user_profile (
+        user_name, phone_number, residential_address, books_allowed,
+        role_id
+    )
+    SELECT
+        'similarity-benchmark-' || i,
+        '0000000000',
+        'Created by scripts/similarity_benchmark.py',
+        5,
+        :role_id
+    FROM generate_series(1, :count) AS i
+""")
+
+SEED_BOOKS = text("""
+    INSERT INTO book (
+        isbn, book_name, book_author, edition, book_category_id,
+        book_price, book_count, available_count, book_description
+    )
+    SELECT
+        :prefix || i,
+        'Similarity Benchmark ' || i,
+        'Similarity Benchmark',
+        1,
+        :book_category_id,
+        10,
+        1,
+        1,
+        'Created by scripts/similarity_benchmark.py'
+    FROM generate_series(1, :count) AS i
+""")
+
+# The j-th book of a user is 199 * j books after its first one, so a user
+# never rates the same book twice as long as 199 * per_user <= books.
+SEED_RATINGS = text("""
+    INSERT INTO rating (book_id, point, given_by)
+    SELECT
+        b.ids[1 + (u.number * 7919 + j * 199) % b.n],
+        1 + (u.number * 31 + j * 17) % 5,
+        u.user_profile_id
+    FROM (
+        SELECT
+            user_profile_id,
+            row_number() OVER (ORDER BY user_profile_id) AS number
+        FROM user_profile
+        WHERE role_id = :role_id
+    ) AS u,
+        generate_series(0, :per_user - 1) AS j,
+        (SELECT array_agg(book_id ORDER BY book_id) AS ids, count(*) AS n
+            FROM book WHERE book_category_id = :book_category_id) AS b
+    WHERE u.number > :start AND u.number <= :stop
+""")
+
+
+def create_owners(db):
+    """
+    The role of the synthetic users and the category of the synthetic books
+    """
+    role = models.Role(role_name=f"similarity-benchmark-{uuid.uuid4()}")
+    category = models.BookCategory(
+        category_name=f"similarity-benchmark-{uuid.uuid4()}"
+    )
+    db.add_all([role, category])
+    db.commit()
+
+    return role, category
+
+
+def seed(db, role, category, users, books, per_user, chunk_size=10000):
+    db.execute(SEED_USERS, {"role_id": role.role_id, "count": users})
+    db.execute(SEED_BOOKS, {
+        "prefix": f"similarity-benchmark-{category.book_category_id}-",
+        "book_category_id": category.book_category_id,
+        "count": books
+    })
+    db.commit()
+
+    for start in range(0, users, chunk_size):
+        db.execute(SEED_RATINGS, {
+            "role_id": role.role_id,
+            "book_category_id": category.book_category_id,
+            "per_user": per_user,
+            "start": start,
+            "stop": start + chunk_size
+        })
+        db.commit()
+    db.execute(text("ANALYZE rating"))
+    db.commit()
+
+
+def cleanup(db, role, category):
+    # rating.given_by has no index, so the ratings go first, on their own:
+    # left to the cascade, every deleted user would scan the whole table.
+    db.query(models.Rating).filter(
+        models.Rating.book_id.in_(
+            db.query(models.Book.book_id).filter(
+                models.Book.book_category_id == category.book_category_id
+            )
+        )
+    ).delete(synchronize_session=False)
+    db.commit()
+    # Drops the dead ratings, which the cascade would still have to read
+    with db.get_bind().connect() as connection:
+        connection.execution_options(
+            isolation_level="AUTOCOMMIT"
+        ).execute(text("VACUUM rating"))
+
+    # The similarities go with their books, the users with their role
+    db.query(models.Book).filter(
+        models.Book.book_category_id == category.book_category_id
+    ).delete(synchronize_session=False)
+    db.query(models.BookCategory).filter(
+        models.BookCategory.book_category_id == category.book_category_id
+    ).delete(synchronize_session=False)
+    db.query(models.Role).filter(
+        models.Role.role_id == role.role_id
+    ).delete(synchronize_session=False)
+    db.commit()
+
+
+def peak_memory_mb():
+    # ru_maxrss is in kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Time build_similarities on synthetic ratings"
+    )
+    parser.add_argument("--users", type=int, default=100000)
+    parser.add_argument("--books", type=int, default=20000)
+    parser.add_argument(
+        "--per-user", type=int, default=100,
+        help="ratings per user, 10M with the default users"
+    )
+    parser.add_argument("--top-k", type=int, default=None)
+    args = parser.parse_args()
+
+    if args.per_user * 199 > args.books:
+        parser.error("--books has to be at least 199 x --per-user")
+
+    db = SessionLocal()
+    role, category = create_owners(db)
+    try:
+        started = time.perf_counter()
+        seed(db, role, category, args.users, args.books, args.per_user)
+        print(
+            f"seeded {args.users * args.per_user} ratings in "
+            f"{time.perf_counter() - started:.1f}s"
+        )
+
+        baseline = peak_memory_mb()
+        result = build_similarities(db, args.top_k)
+        peak = peak_memory_mb()
+        print(
+            f"ratings: {result['ratings']}, "
+            f"neighbours stored: {result['stored']}, "
+            f"loaded in {result['load_seconds']}s, "
+            f"built in {result['total_seconds']}s"
+        )
+        print(
+            f"peak memory: {peak:.0f} MB, "
+            f"{peak - baseline:.0f} MB above the {baseline:.0f} MB before "
+            f"the build"
+        )
+    finally:
+        db.rollback()
+        cleanup(db, role, category)
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
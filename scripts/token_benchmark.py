@@ -0,0 +1,94 @@
+# Microbenchmark of oauth2.verify_access_token with and without the cache
+# of verified tokens, for HS256 and RS256 signed tokens. Needs no database.
+# The app signs with SECRET_KEY and ALGORITHM from the settings; for RS256
+# this script signs with a fresh RSA key and verifies with its public key.
+#
+# How to run it from the repository root:
+#   python -m scripts.token_benchmark
+#   python -m scripts.token_benchmark --calls 50000
+import argparse
+import time
+from datetime import datetime, timedelta
+
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import rsa
+from jose import jwt
+
+from app import oauth2
+from app.cache import token_cache
+from app.config import settings
+
+
+def rsa_keys():
+    key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    private_key = key.private_bytes(
+        serialization.Encoding.PEM,
+        serialization.PrivateFormat.PKCS8,
+        serialization.NoEncryption()
+    ).decode()
+    public_key = key.public_key().public_bytes(
+        serialization.Encoding.PEM,
+        serialization.PublicFormat.SubjectPublicKeyInfo
+    ).decode()
+    return private_key, public_key
+
+
+def make_token(algorithm, signing_key):
+    return jwt.encode(
+        {
+            "user_profile_id": 1,
+            "role_id": 1,
+            "exp": datetime.utcnow() + timedelta(hours=1),
+            "iat": time.time(),
+            "ver": settings.token_version
+        },
+        signing_key,
+        algorithm=algorithm
+    )
+
+
+def per_call(token, calls, cached):
+    """
+    Returns the microseconds one verify_access_token call takes
+    """
+    exception = oauth2.get_credentials_exception()
+    token_cache.clear()
+    oauth2.verify_access_token(token, exception)
+
+    started = time.perf_counter()
+    for _ in range(calls):
+        if not cached:
+            token_cache.clear()
+        oauth2.verify_access_token(token, exception)
+    return (time.perf_counter() - started) * 1000000 / calls
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Measure token verification with and without the cache"
+    )
+    parser.add_argument("--calls", type=int, default=20000)
+    args = parser.parse_args()
+
+    private_key, public_key = rsa_keys()
+    # (algorithm, signing key, verifying key)
+    algorithms = [
+        ("HS256", "benchmark-secret", "benchmark-secret"),
+        ("RS256", private_key, public_key),
+    ]
+
+    for algorithm, signing_key, verifying_key in algorithms:
+        # verify_access_token reads the key and algorithm from the module
+        oauth2.SECRET_KEY, oauth2.ALGORITHM = verifying_key, algorithm
+        token = make_token(algorithm, signing_key)
+
+        uncached = per_call(token, args.calls, cached=False)
+        cached = per_call(token, args.calls, cached=True)
+        print(
+            f"{algorithm}: {uncached:.1f} us uncached, {cached:.1f} us "
+            f"cached, {uncached / cached:.0f}x"
+        )
+
+
+if __name__ == "__main__":
+    main()
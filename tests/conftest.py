@@ -0,0 +1,15 @@
+# The settings are read when the app package is imported. None of the tests
+# talk to the database, so placeholders are enough when no .env is around.
+import os
+
+for name, value in {
+    "DATABASE_HOSTNAME": "localhost",
+    "DATABASE_PORT": "5432",
+    "DATABASE_USERNAME": "postgres",
+    "DATABASE_PASSWORD": "postgres",
+    "DATABASE_NAME": "libms_test",
+    "SECRET_KEY": "test",
+    "ALGORITHM": "HS256",
+    "ACCESS_TOKEN_EXPIRE_MINUTES": "30",
+}.items():
+    os.environ.setdefault(name, value)
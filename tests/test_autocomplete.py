@@ -0,0 +1,67 @@
+from types import SimpleNamespace
+
+from app.autocomplete import PrefixIndex
+
+
+def book(book_id, book_name, isbn=None):
+    return SimpleNamespace(
+        book_id=book_id,
+        isbn=isbn or f"isbn-{book_id}",
+        book_name=book_name,
+        book_author="Author"
+    )
+
+
+def test_add_many_after_interleaved_rebuild_keeps_one_copy():
+    index = PrefixIndex()
+    index.load([book(1, "Dune")])
+    imported = [book(2, "Dune Messiah"), book(3, "Children of Dune")]
+
+    # A refresh that already sees the committed chunk lands between the
+    # merge and the swap of add_many, which then has to merge again.
+    merge = PrefixIndex._merge
+    calls = []
+
+    def merge_with_rebuild(keys, new_keys):
+        if not calls:
+            index.load([book(1, "Dune")] + imported)
+        calls.append(1)
+        return merge(keys, new_keys)
+
+    index._merge = merge_with_rebuild
+    index.add_many(imported)
+    del index._merge
+
+    assert len(calls) == 2
+    assert len(index._keys) == len(set(index._keys)) == 6
+
+    index.remove(2)
+    assert all(book_id != 2 for _, book_id in index._keys)
+    assert [entry["book_id"] for entry in index.search("dune")] == [1]
+
+
+def test_add_many_replaces_renamed_books():
+    index = PrefixIndex()
+    index.load([book(1, "Dune"), book(2, "Emma")])
+
+    index.add_many([book(2, "Persuasion")])
+
+    assert index.search("emma") == []
+    assert [entry["book_id"] for entry in index.search("pers")] == [2]
+
+    index.remove(2)
+    assert index.search("pers") == []
+    assert all(book_id != 2 for _, book_id in index._keys)
+
+
+def test_add_many_merges_in_order():
+    index = PrefixIndex()
+    index.load([book(i, f"Book {i:03}") for i in range(0, 100, 2)])
+
+    index.add_many([book(i, f"Book {i:03}") for i in range(1, 100, 2)])
+
+    assert index._keys == sorted(index._keys)
+    assert len(index._keys) == 200
+    assert [entry["book_id"] for entry in index.search("book 01", 20)] == (
+        list(range(10, 20))
+    )